@@ -1,3 +1,50 @@
-from .database_chat_integration import SQLAgent
+import importlib
 
-__all__ = ['SQLAgent']
\ No newline at end of file
+# Names are imported from their submodule on first access, so importing one of them does not load the
+# dependencies of all others (the agent alone pulls in langchain, langgraph and pandas)
+_EXPORTS = {
+    'SQLAgent': '.database_chat_integration',
+    'QueryPreview': '.query_preview',
+    'ResultSetCache': '.result_cache',
+    'PlanEstimate': '.query_guard',
+    'QueryRejectedError': '.query_guard',
+    'QueryResult': '.query_guard',
+    'AnalyticsMirror': '.analytics_mirror',
+    'SchemaDescriptor': '.schema_descriptor',
+    'SchemaDescriptorProvider': '.schema_descriptor',
+    'SpeculativeQueryRunner': '.speculative_queries',
+    'QueryGenerationCancelled': '.speculative_queries',
+    'ExampleStore': '.example_store',
+    'QueryExample': '.example_store',
+    'QueryTemplateEngine': '.query_templates',
+    'TemplateMatch': '.query_templates',
+    'PromptPrefilter': '.prompt_prefilter',
+    'QueryEvent': '.query_events',
+    'QueryJobQueue': '.job_queue',
+    'QueryJob': '.job_queue',
+    'JobStatus': '.job_queue',
+    'AdmissionController': '.admission',
+    'AdmissionRejectedError': '.admission',
+    'LLMCassette': '.chat_models',
+    'RecordingChatModel': '.chat_models',
+    'ReplayChatModel': '.chat_models',
+    'UsageCallbackHandler': '.chat_models',
+    'MetricsCallbackHandler': '.chat_models',
+    'build_chat_model': '.chat_models',
+}
+
+def __getattr__(name:str):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_EXPORTS[name],__name__),name)
+    globals()[name] = value
+    return value
+
+def __dir__()->list[str]:
+    return sorted(list(globals()) + list(_EXPORTS))
+
+__all__ = ['SQLAgent', 'QueryPreview', 'ResultSetCache', 'PlanEstimate', 'QueryRejectedError', 'QueryResult', 'AnalyticsMirror', 'SchemaDescriptor', 'SchemaDescriptorProvider',
+           'SpeculativeQueryRunner', 'QueryGenerationCancelled', 'LLMCassette', 'RecordingChatModel', 'ReplayChatModel', 'UsageCallbackHandler',
+           'MetricsCallbackHandler', 'build_chat_model', 'ExampleStore', 'QueryExample',
+           'QueryTemplateEngine', 'TemplateMatch', 'PromptPrefilter', 'QueryEvent',
+           'QueryJobQueue', 'QueryJob', 'JobStatus', 'AdmissionController', 'AdmissionRejectedError']
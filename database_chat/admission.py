@@ -0,0 +1,230 @@
+from concurrent.futures import Future
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Iterator, TypeVar
+import itertools
+import math
+import re
+import threading
+import time
+
+T = TypeVar("T")
+
+class AdmissionRejectedError(Exception):
+    """
+    Raised when the admission queue is full, ``retry_after_seconds`` estimates when a slot frees up.
+    """
+    def __init__(self, message:str, retry_after_seconds:int) -> None:
+        super().__init__(message)
+        self.retry_after_seconds = retry_after_seconds
+
+@dataclass
+class _Waiter:
+    client_id : str
+    priority : int
+    sequence : int
+    granted : threading.Event = field(default_factory=threading.Event)
+
+def normalize_prompt(prompt:str)->str:
+    return re.sub(r"\s+", " ", prompt.strip().lower())
+
+class AdmissionController:
+    """
+    Limits the number of concurrent LLM runs. Requests over the limit wait in a queue ordered by priority
+    (lower runs first), then by how many runs their client already has active, then by arrival. Requests
+    that wait longer than ``max_wait_seconds`` are rejected. Identical concurrent requests are coalesced
+    into a single run.
+    """
+    def __init__(self, max_concurrency:int, max_queue_size:int, max_queued_per_client:int, max_wait_seconds:float | None = None) -> None:
+        self._max_concurrency = max_concurrency
+        self._max_queue_size = max_queue_size
+        self._max_queued_per_client = max_queued_per_client
+        self._max_wait_seconds = max_wait_seconds
+
+        self._lock = threading.Lock()
+        self._waiters : list[_Waiter] = []
+        self._active_runs = 0
+        self._active_runs_by_client : dict[str,int] = {}
+        self._sequence = itertools.count()
+        self._in_flight : dict[tuple[str,str],Future] = {}
+        # Moving average of run durations, used for the retry-after estimate
+        self._average_run_seconds = 10.0
+
+    def _retry_after_seconds(self)->int:
+        queued_rounds = (len(self._waiters) + 1) / self._max_concurrency
+        return max(1, math.ceil(self._average_run_seconds * queued_rounds))
+
+    def _raise_if_full(self, client_id:str)->None:
+        client_waiter_count = sum(1 for waiter in self._waiters if waiter.client_id == client_id)
+        if len(self._waiters) >= self._max_queue_size or client_waiter_count >= self._max_queued_per_client:
+            raise AdmissionRejectedError("Too many requests are waiting, try again later.",self._retry_after_seconds())
+
+    def _grant(self, client_id:str)->None:
+        self._active_runs += 1
+        self._active_runs_by_client[client_id] = self._active_runs_by_client.get(client_id,0) + 1
+
+    def try_acquire(self, client_id:str, reserve:int = 0)->bool:
+        """
+        Take a run slot only if one is free right away and nobody is waiting for it.
+
+        ### Parameters
+        1. client_id : ``str``
+            - Client the run is for
+        2. reserve : ``int``
+            - Number of slots that must still be free afterwards
+
+        ### Returns
+        ``True`` if the slot was taken and must be released with ``release``.
+        """
+        with self._lock:
+            if self._active_runs + reserve < self._max_concurrency and not self._waiters:
+                self._grant(client_id)
+                return True
+            return False
+
+    def check_capacity(self, client_id:str)->None:
+        """
+        Check that a request from the client would be admitted or queued right now, without taking a slot.
+
+        ### Parameters
+        1. client_id : ``str``
+            - Client the request is for
+
+        ### Raises
+        ``AdmissionRejectedError`` if the queue, or the client's share of it, is full.
+
+        ### Returns
+        ``None``
+        """
+        with self._lock:
+            if self._active_runs < self._max_concurrency and not self._waiters:
+                return
+            self._raise_if_full(client_id)
+
+    def acquire(self, client_id:str, priority:int)->None:
+        """
+        Take a run slot, waiting in the queue if none is free.
+
+        ### Parameters
+        1. client_id : ``str``
+            - Client the run is for
+        2. priority : ``int``
+            - Lower values are admitted first
+
+        ### Raises
+        ``AdmissionRejectedError`` if the queue, or the client's share of it, is full, or if no slot was
+        free within ``max_wait_seconds``.
+
+        ### Returns
+        ``None``
+        """
+        with self._lock:
+            if self._active_runs < self._max_concurrency and not self._waiters:
+                self._grant(client_id)
+                return
+
+            self._raise_if_full(client_id)
+            waiter = _Waiter(client_id=client_id,priority=priority,sequence=next(self._sequence))
+            self._waiters.append(waiter)
+
+        # The slot is handed over by release, which grants it before setting the event
+        if waiter.granted.wait(self._max_wait_seconds):
+            return
+
+        with self._lock:
+            # The slot may have been granted between the timeout and taking the lock
+            if waiter.granted.is_set():
+                return
+            self._waiters.remove(waiter)
+            raise AdmissionRejectedError("Timed out waiting for a free slot, try again later.",self._retry_after_seconds())
+
+    def release(self, client_id:str, run_seconds:float | None = None)->None:
+        """
+        Give the run slot back and admit the next waiter.
+
+        ### Parameters
+        1. client_id : ``str``
+            - Client the run was for
+        2. run_seconds : ``float | None``
+            - Duration of the run, used for the retry-after estimate
+
+        ### Returns
+        ``None``
+        """
+        with self._lock:
+            self._active_runs -= 1
+            self._active_runs_by_client[client_id] -= 1
+            if self._active_runs_by_client[client_id] == 0:
+                del self._active_runs_by_client[client_id]
+
+            if run_seconds is not None:
+                self._average_run_seconds = 0.8 * self._average_run_seconds + 0.2 * run_seconds
+
+            if self._waiters and self._active_runs < self._max_concurrency:
+                # The queue is short, so the next waiter is picked with a scan since fair share changes as runs finish
+                next_waiter = min(
+                    self._waiters,
+                    key=lambda waiter: (waiter.priority, self._active_runs_by_client.get(waiter.client_id,0), waiter.sequence)
+                )
+                self._waiters.remove(next_waiter)
+                self._grant(next_waiter.client_id)
+                next_waiter.granted.set()
+
+    @contextmanager
+    def slot(self, client_id:str, priority:int)->Iterator[None]:
+        """
+        Hold a run slot for the duration of the ``with`` block, see ``acquire``.
+        """
+        self.acquire(client_id,priority)
+        start_time = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(client_id,time.monotonic() - start_time)
+
+    def run(self, operation:str, prompt:str, client_id:str, priority:int, function:Callable[[],T])->T:
+        """
+        Run the function within a slot, sharing the result with identical concurrent requests.
+
+        ### Parameters
+        1. operation : ``str``
+            - Name of the operation, requests only coalesce within the same operation
+        2. prompt : ``str``
+            - Prompt of the request, compared after normalizing case and whitespace
+        3. client_id : ``str``
+            - Client the run is for
+        4. priority : ``int``
+            - Lower values are admitted first
+        5. function : ``Callable[[],T]``
+            - Computation to run
+
+        ### Raises
+        ``AdmissionRejectedError`` if the queue is full. Errors raised by the function are re-raised for
+        every coalesced request.
+
+        ### Returns
+        The result of the function.
+        """
+        key = (operation, normalize_prompt(prompt))
+
+        with self._lock:
+            in_flight_result = self._in_flight.get(key)
+            is_leader = in_flight_result is None
+            if is_leader:
+                in_flight_result = Future()
+                self._in_flight[key] = in_flight_result
+
+        if not is_leader:
+            return in_flight_result.result()
+
+        try:
+            with self.slot(client_id,priority):
+                result = function()
+            in_flight_result.set_result(result)
+            return result
+        except BaseException as e:
+            in_flight_result.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key,None)
@@ -0,0 +1,184 @@
+from pathlib import Path
+from typing import TYPE_CHECKING
+import importlib.util
+import json
+import re
+import threading
+from .query_preview import strip_query_terminator
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Literals, quoted identifiers and comments are blanked out before the query text is inspected
+_QUOTED_OR_COMMENT_PATTERN = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|--[^\n]*|/\*.*?\*/",re.DOTALL)
+_AGGREGATE_PATTERN = re.compile(r"\bgroup\s+by\b|\b(?:count|sum|avg|min|max|stddev|stddev_samp|stddev_pop|variance|median|percentile_cont|percentile_disc)\s*\(",re.IGNORECASE)
+_WRITE_PATTERN = re.compile(r"\b(?:insert|update|delete|merge|create|drop|alter|truncate|copy|grant|revoke|into|call|do|set|lock)\b",re.IGNORECASE)
+# Functions of the operational database (and PostgreSQL specifics) that the mirror does not provide
+_UNSUPPORTED_PATTERN = re.compile(
+    r"\b(?:study_directional_volumes|get_in_volume|get_out_volume|pedway_in_volume|pedway_out_volume|to_char|to_date|to_timestamp"
+    r"|string_agg|array_agg|generate_series|regexp_matches|pg_\w+|information_schema|current_setting)\b|::\s*regclass|\bfor\s+update\b",
+    re.IGNORECASE
+)
+# DuckDB names unaliased expressions after their text, PostgreSQL after the outermost function
+_FUNCTION_COLUMN_PATTERN = re.compile(r"^(\w+)\(.*\)$",re.DOTALL)
+# The mirror has a single schema, queries qualified with the PostgreSQL one are mapped onto it
+_PUBLIC_SCHEMA_PATTERN = re.compile(r'\b(?:public|"public")\.',re.IGNORECASE)
+
+def _quote_identifier(name:str)->str:
+    return '"' + name.replace('"','""') + '"'
+
+def _return_relations(node:object, relations:set[tuple[str,str,str]], cte_names:set[str])->bool:
+    # Walks a json_serialize_sql parse tree, collecting the tables and CTE names it references.
+    # Returns False as soon as a table function (read_csv, read_text, ...) is found.
+    if isinstance(node,list):
+        return all(_return_relations(child,relations,cte_names) for child in node)
+    if not isinstance(node,dict):
+        return True
+
+    if node.get("type") == "TABLE_FUNCTION":
+        return False
+    if node.get("type") == "BASE_TABLE":
+        relations.add((node.get("catalog_name",""),node.get("schema_name",""),node.get("table_name","").lower()))
+    if isinstance(node.get("cte_map"),dict):
+        cte_names.update(entry["key"].lower() for entry in node["cte_map"].get("map",[]))
+
+    return all(_return_relations(child,relations,cte_names) for child in node.values())
+
+def _postgres_column_name(name:str)->str:
+    match = _FUNCTION_COLUMN_PATTERN.match(name)
+    if match is None:
+        return name
+    function_name = match.group(1).lower()
+    return "count" if function_name == "count_star" else function_name
+
+class AnalyticsMirror:
+    """
+    Read-only DuckDB copy of the database written by ``database_construction`` after each ingestion.
+
+    Aggregate queries are answered from the mirror when it was exported at the same data generation as the
+    operational database. Any other query, or a query the mirror cannot run, returns ``None`` so the caller
+    falls back to PostgreSQL.
+    """
+    def __init__(self, mirror_path:Path | None, max_rows:int, statement_timeout_ms:int) -> None:
+        self._mirror_path = mirror_path
+        self._max_rows = max_rows
+        self._statement_timeout_ms = statement_timeout_ms
+
+    def is_enabled(self)->bool:
+        return (self._mirror_path is not None
+                and self._mirror_path.exists()
+                and importlib.util.find_spec("duckdb") is not None)
+
+    def translate_query(self, query:str)->str | None:
+        """
+        Return the DuckDB form of the query if it is a read-only aggregate the mirror can answer.
+
+        ### Parameters
+        1. query : ``str``
+            - Generated PostgreSQL query
+
+        ### Returns
+        The translated query as a ``str``, or ``None`` if the query should run on PostgreSQL.
+        """
+        statement = strip_query_terminator(query)
+        inspected_text = _QUOTED_OR_COMMENT_PATTERN.sub(" ",statement)
+
+        if ";" in inspected_text or not re.match(r"\s*(?:select|with)\b",inspected_text,re.IGNORECASE):
+            return None
+        if _WRITE_PATTERN.search(inspected_text) or _UNSUPPORTED_PATTERN.search(inspected_text):
+            return None
+        if not _AGGREGATE_PATTERN.search(inspected_text):
+            return None
+
+        return _PUBLIC_SCHEMA_PATTERN.sub("",statement)
+
+    def _is_mirrored_query(self, mirror_connection, statement:str)->bool:
+        # Only a single query over the mirrored tables is run, table functions and file paths (replacement
+        # scans) are refused even though external access is disabled on the connection
+        try:
+            parse_tree = json.loads(mirror_connection.execute("SELECT json_serialize_sql(?)",[statement]).fetchone()[0])
+            mirrored_tables = {row[0].lower() for row in mirror_connection.execute(
+                "SELECT table_name FROM duckdb_tables() WHERE schema_name = 'main'"
+            ).fetchall()}
+        except Exception:
+            return False
+
+        if parse_tree.get("error") or len(parse_tree.get("statements",[])) != 1:
+            return False
+
+        relations : set[tuple[str,str,str]] = set()
+        cte_names : set[str] = set()
+        if not _return_relations(parse_tree["statements"],relations,cte_names):
+            return False
+
+        return all(
+            catalog_name == "" and schema_name in ("","main") and (table_name in mirrored_tables or (schema_name == "" and table_name in cte_names))
+            for catalog_name, schema_name, table_name in relations
+        )
+
+    def _read_generation(self, mirror_connection)->int | None:
+        try:
+            return mirror_connection.execute("SELECT MAX(generation) FROM data_generation").fetchone()[0]
+        except Exception:
+            return None
+
+    def execute(self, query:str, generation:int)->"pd.DataFrame | None":
+        """
+        Run the query on the mirror if it is routable and the mirror is at the given data generation.
+
+        ### Parameters
+        1. query : ``str``
+            - Generated PostgreSQL query
+        2. generation : ``int``
+            - Current data generation of the operational database
+
+        ### Returns
+        The result as a ``pd.DataFrame``, or ``None`` if the query has to run on PostgreSQL.
+        """
+        if not self.is_enabled():
+            return None
+
+        statement = self.translate_query(query)
+        if statement is None:
+            return None
+
+        import duckdb
+
+        try:
+            # Generated queries must not reach the file system, so external access is off and cannot be turned back on.
+            # Integer division behaves as it would on PostgreSQL.
+            mirror_connection = duckdb.connect(
+                str(self._mirror_path),
+                read_only=True,
+                config={"enable_external_access": False, "integer_division": True, "lock_configuration": True}
+            )
+        except duckdb.Error:
+            return None
+
+        # DuckDB has no statement timeout, the running query is interrupted instead
+        timer = threading.Timer(self._statement_timeout_ms / 1000,mirror_connection.interrupt)
+        try:
+            if self._read_generation(mirror_connection) != generation:
+                return None
+            if not self._is_mirrored_query(mirror_connection,statement):
+                return None
+
+            timer.start()
+            relation = mirror_connection.sql(f"SELECT * FROM ({statement}) AS mirror_result LIMIT {self._max_rows + 1}")
+            # Sums of integers are HUGEINT in DuckDB, which pandas only holds as floats, PostgreSQL returns them as BIGINT
+            projection = ", ".join(
+                f"CAST({_quote_identifier(column)} AS BIGINT) AS {_quote_identifier(column)}" if str(column_type) == "HUGEINT" else _quote_identifier(column)
+                for column, column_type in zip(relation.columns,relation.types)
+            )
+            dataframe = relation.project(projection).df()
+            dataframe.columns = [_postgres_column_name(column) for column in dataframe.columns]
+        except duckdb.Error:
+            return None
+        finally:
+            timer.cancel()
+            mirror_connection.close()
+
+        # Results over the row limit go through the query guard on PostgreSQL
+        if len(dataframe) > self._max_rows:
+            return None
+        return dataframe
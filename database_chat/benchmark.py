@@ -0,0 +1,142 @@
+"""
+Latency benchmark for ``SQLAgent``.
+
+Runs a fixed prompt set through the same stages as a chat turn (validate, then query and execute, or
+suggest for invalid prompts) and reports p50/p95 latency, LLM calls, tool calls and tokens per stage.
+
+Record a cassette once against the live API, then replay it locally against a local Postgres::
+
+    LLM_MODE=record LLM_CASSETTE_PATH=bench.json DATABASE_URL=... python -m database_chat.benchmark
+    LLM_MODE=replay LLM_CASSETTE_PATH=bench.json LLM_REPLAY_LATENCY_MS=800 DATABASE_URL=... python -m database_chat.benchmark --repeat 5
+
+Every pass over the prompts starts from an empty example store, so later passes replay the same LLM requests as
+the first one, and the query templates and prompt prefilter are off unless
+``QUERY_TEMPLATES_ENABLED`` / ``PROMPT_PREFILTER_ENABLED`` are set, so that results only depend on the cassette.
+"""
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Any
+import argparse
+import json
+import os
+import tempfile
+import time
+import numpy as np
+from .chat_models import ChatModelUsage, UsageCallbackHandler
+
+# Settings that let prompts skip LLM calls, printed with the report
+SHORTCUT_SETTINGS = ["QUERY_TEMPLATES_ENABLED", "PROMPT_PREFILTER_ENABLED", "ANALYTICS_MIRROR_PATH"]
+
+BENCHMARK_PROMPTS = [
+    "What is the total traffic volume for study 1230846 by direction?",
+    "Show the hourly volume of buses for every study on 2025-06-12.",
+    "Which location recorded the most bicycles?",
+    "What is the total volume of each movement for Northbound traffic across all studies?",
+    "What will the weather be like tomorrow?",
+]
+
+@dataclass
+class StageStatistics:
+    durations : list[float] = field(default_factory=list)
+    errors : int = 0
+    usage : ChatModelUsage = field(default_factory=ChatModelUsage)
+
+def _usage_difference(before:ChatModelUsage, after:ChatModelUsage)->ChatModelUsage:
+    return ChatModelUsage(
+        llm_calls=after.llm_calls - before.llm_calls,
+        input_tokens=after.input_tokens - before.input_tokens,
+        output_tokens=after.output_tokens - before.output_tokens,
+        tool_calls=after.tool_calls - before.tool_calls
+    )
+
+class AgentBenchmark:
+    def __init__(self, agent, usage_handler:UsageCallbackHandler) -> None:
+        self._agent = agent
+        self._usage_handler = usage_handler
+        self.statistics : dict[str,StageStatistics] = {}
+
+    def _measure(self, stage:str, function:Callable[[],Any])->Any:
+        stage_statistics = self.statistics.setdefault(stage,StageStatistics())
+        usage_before = self._usage_handler.snapshot()
+        start_time = time.perf_counter()
+
+        try:
+            return function()
+        except Exception as e:
+            stage_statistics.errors += 1
+            print(f'[{stage}] {type(e).__name__}: {e}')
+            return None
+        finally:
+            stage_statistics.durations.append(time.perf_counter() - start_time)
+            usage = _usage_difference(usage_before,self._usage_handler.snapshot())
+            stage_statistics.usage.llm_calls += usage.llm_calls
+            stage_statistics.usage.input_tokens += usage.input_tokens
+            stage_statistics.usage.output_tokens += usage.output_tokens
+            stage_statistics.usage.tool_calls += usage.tool_calls
+
+    def run_prompt(self, prompt:str)->None:
+        is_valid = self._measure("validate", lambda: self._agent.validate_prompt_adequacy(prompt))
+
+        if not is_valid:
+            self._measure("suggest", lambda: self._agent.generate_prompt_suggestions(prompt))
+            return
+
+        query = self._measure("query", lambda: self._agent.generate_query(prompt))
+        if query is not None:
+            self._measure("execute", lambda: self._agent.return_dataframe(query))
+
+    def report(self)->str:
+        header = f"{'stage':<10}{'runs':>6}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'llm calls':>11}{'tool calls':>12}{'in tokens':>11}{'out tokens':>12}"
+        lines = [header, "-" * len(header)]
+
+        for stage, stage_statistics in self.statistics.items():
+            runs = len(stage_statistics.durations)
+            durations_ms = np.array(stage_statistics.durations) * 1000
+            usage = stage_statistics.usage
+            lines.append(
+                f"{stage:<10}{runs:>6}{stage_statistics.errors:>8}"
+                f"{np.percentile(durations_ms,50):>10.1f}{np.percentile(durations_ms,95):>10.1f}"
+                f"{usage.llm_calls / runs:>11.1f}{usage.tool_calls / runs:>12.1f}"
+                f"{usage.input_tokens / runs:>11.0f}{usage.output_tokens / runs:>12.0f}"
+            )
+
+        lines.append("LLM calls, tool calls and tokens are averages per run.")
+        return "\n".join(lines)
+
+if __name__ == "__main__":
+    from .database_chat_integration import SQLAgent
+    from .example_store import ExampleStore
+
+    parser = argparse.ArgumentParser(description="Benchmark SQLAgent stages with a recorded or live LLM.")
+    parser.add_argument("--repeat", type=int, default=1, help="Number of passes over the prompt set")
+    parser.add_argument("--prompts-file", type=Path, default=None, help="JSON list of prompts used instead of the built-in set")
+    arguments = parser.parse_args()
+
+    # Execution is measured against the database rather than the result cache
+    os.environ.setdefault("RESULT_CACHE_MAX_BYTES","0")
+    # The templates and the prefilter answer some prompts without the LLM, their stages are measured with them off
+    os.environ.setdefault("QUERY_TEMPLATES_ENABLED","false")
+    os.environ.setdefault("PROMPT_PREFILTER_ENABLED","false")
+
+    prompts = BENCHMARK_PROMPTS
+    if arguments.prompts_file is not None:
+        with open(arguments.prompts_file,'r',encoding='utf-8') as file:
+            prompts = json.load(file)
+
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        os.environ["EXAMPLE_STORE_PATH"] = str(Path(temporary_directory) / "coe_query_examples.jsonl")
+
+        usage_handler = UsageCallbackHandler()
+        agent = SQLAgent()
+        agent.llm.callbacks = [*(agent.llm.callbacks or []), usage_handler]
+
+        benchmark = AgentBenchmark(agent,usage_handler)
+        for pass_index in range(arguments.repeat):
+            # Examples saved by an earlier pass change the generation prompts or turn agent runs into one-shot
+            # generations, neither of which is in the cassette
+            agent.example_store = ExampleStore(Path(temporary_directory) / f"coe_query_examples_{pass_index}.jsonl")
+            for prompt in prompts:
+                benchmark.run_prompt(prompt)
+
+    print(", ".join(f"{name}={os.getenv(name,'')}" for name in SHORTCUT_SETTINGS))
+    print(benchmark.report())
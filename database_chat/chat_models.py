@@ -0,0 +1,248 @@
+from pathlib import Path
+from typing import Any, Sequence
+from uuid import UUID
+from dataclasses import dataclass, asdict
+import hashlib
+import json
+import os
+import threading
+import time
+from langchain_core.callbacks import BaseCallbackHandler, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage, message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration, ChatResult, LLMResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from .metrics import LLM_CALL_DURATION, LLM_CALL_TOKENS, LLM_TOKENS, record_stage
+
+def request_key(messages:Sequence[BaseMessage], **kwargs:Any)->str:
+    """
+    Build a stable key for an LLM request. Message ids are left out since they are generated per run.
+
+    ### Parameters
+    1. messages : ``Sequence[BaseMessage]``
+        - Messages sent to the LLM
+    2. kwargs : ``Any``
+        - Additional request arguments, such as the bound tools
+
+    ### Returns
+    A ``str`` hash of the request.
+    """
+    key_messages = []
+    for message in messages:
+        key_message : dict[str,Any] = {"type": message.type, "content": message.content}
+        if isinstance(message, AIMessage):
+            key_message["tool_calls"] = [(tool_call["name"], tool_call["args"], tool_call["id"]) for tool_call in message.tool_calls]
+        if isinstance(message, ToolMessage):
+            key_message["tool_call_id"] = message.tool_call_id
+        key_messages.append(key_message)
+
+    tool_names = [tool["function"]["name"] for tool in kwargs.get("tools",[])]
+    key_source = json.dumps({"messages": key_messages, "tools": tool_names}, sort_keys=True, default=str)
+    return hashlib.sha256(key_source.encode("utf-8")).hexdigest()
+
+class LLMCassette:
+    """
+    JSON file of recorded LLM responses keyed by ``request_key``.
+    """
+    def __init__(self, cassette_path:Path) -> None:
+        self._cassette_path = cassette_path
+        self._lock = threading.Lock()
+        self._responses : dict[str,list[dict]] = {}
+
+        if self._cassette_path.exists():
+            with open(self._cassette_path,'r',encoding='utf-8') as file:
+                self._responses = json.load(file)
+
+    def get(self, key:str)->list[BaseMessage]:
+        with self._lock:
+            if key not in self._responses:
+                raise KeyError(f"No recorded LLM response for request {key} in {self._cassette_path}")
+            return messages_from_dict(self._responses[key])
+
+    def put(self, key:str, messages:list[BaseMessage])->None:
+        with self._lock:
+            self._responses[key] = [message_to_dict(message) for message in messages]
+            self._cassette_path.parent.mkdir(parents=True,exist_ok=True)
+            with open(self._cassette_path,'w',encoding='utf-8') as file:
+                json.dump(self._responses,file,indent=1)
+
+class _ToolBindingMixin:
+    def bind_tools(self, tools:Sequence[Any], *, tool_choice:str | None = None, **kwargs:Any):
+        # Tools are passed on in the OpenAI format, which is what ChatDeepSeek sends to the API
+        formatted_tools = [convert_to_openai_tool(tool) for tool in tools]
+        if tool_choice is not None:
+            kwargs["tool_choice"] = tool_choice
+        return self.bind(tools=formatted_tools, **kwargs)
+
+class RecordingChatModel(_ToolBindingMixin, BaseChatModel):
+    """
+    Sends requests to the wrapped chat model and saves every request/response pair into the cassette.
+    """
+    inner : BaseChatModel
+    cassette : Any
+
+    @property
+    def _llm_type(self)->str:
+        return "recording-chat-model"
+
+    def _generate(self, messages:list[BaseMessage], stop:list[str] | None = None, run_manager:CallbackManagerForLLMRun | None = None, **kwargs:Any)->ChatResult:
+        result = self.inner._generate(messages, stop=stop, **kwargs)
+        self.cassette.put(request_key(messages, **kwargs), [generation.message for generation in result.generations])
+        return result
+
+class ReplayChatModel(_ToolBindingMixin, BaseChatModel):
+    """
+    Serves responses from the cassette without any network access, after a synthetic delay.
+    """
+    cassette : Any
+    latency_seconds : float = 0.0
+    latency_per_output_token_seconds : float = 0.0
+
+    @property
+    def _llm_type(self)->str:
+        return "replay-chat-model"
+
+    def _generate(self, messages:list[BaseMessage], stop:list[str] | None = None, run_manager:CallbackManagerForLLMRun | None = None, **kwargs:Any)->ChatResult:
+        responses = self.cassette.get(request_key(messages, **kwargs))
+
+        output_tokens = sum((response.usage_metadata or {}).get("output_tokens",0)
+                            for response in responses if isinstance(response, AIMessage))
+        time.sleep(self.latency_seconds + output_tokens * self.latency_per_output_token_seconds)
+
+        return ChatResult(generations=[ChatGeneration(message=response) for response in responses])
+
+def _response_messages(response:LLMResult)->list[AIMessage]:
+    return [
+        generation.message
+        for generations in response.generations
+        for generation in generations
+        if isinstance(getattr(generation, "message", None), AIMessage)
+    ]
+
+@dataclass
+class ChatModelUsage:
+    llm_calls : int = 0
+    input_tokens : int = 0
+    output_tokens : int = 0
+    tool_calls : int = 0
+
+class UsageCallbackHandler(BaseCallbackHandler):
+    """
+    Counts LLM calls, tokens and requested tool calls across every run of the chat model it is attached to.
+    """
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._usage = ChatModelUsage()
+
+    def on_llm_end(self, response:LLMResult, **kwargs:Any)->None:
+        with self._lock:
+            self._usage.llm_calls += 1
+            for message in _response_messages(response):
+                usage_metadata = message.usage_metadata or {}
+                self._usage.input_tokens += usage_metadata.get("input_tokens",0)
+                self._usage.output_tokens += usage_metadata.get("output_tokens",0)
+                self._usage.tool_calls += len(message.tool_calls)
+
+    def snapshot(self)->ChatModelUsage:
+        with self._lock:
+            return ChatModelUsage(**asdict(self._usage))
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """
+    Records the latency and tokens of chat model calls, and the latency of tool runs, in the process metrics
+    and the timing of the current request.
+    """
+    def __init__(self, record_llm_calls:bool = True) -> None:
+        self._record_llm_calls = record_llm_calls
+        self._lock = threading.Lock()
+        self._start_times : dict[UUID,float] = {}
+
+    @property
+    def ignore_llm(self)->bool:
+        return not self._record_llm_calls
+
+    @property
+    def ignore_chat_model(self)->bool:
+        # Chat model starts are dispatched apart from the other LLM callbacks, their start time would never be popped
+        return not self._record_llm_calls
+
+    def _start(self, run_id:UUID)->None:
+        with self._lock:
+            self._start_times[run_id] = time.perf_counter()
+
+    def _elapsed_seconds(self, run_id:UUID)->float | None:
+        with self._lock:
+            start_time = self._start_times.pop(run_id,None)
+        return None if start_time is None else time.perf_counter() - start_time
+
+    def on_chat_model_start(self, serialized:dict, messages:list, *, run_id:UUID, **kwargs:Any)->None:
+        if self._record_llm_calls:
+            self._start(run_id)
+
+    def on_llm_end(self, response:LLMResult, *, run_id:UUID, **kwargs:Any)->None:
+        elapsed_seconds = self._elapsed_seconds(run_id)
+        if elapsed_seconds is not None:
+            LLM_CALL_DURATION.observe(elapsed_seconds)
+            record_stage("llm",elapsed_seconds)
+
+        for message in _response_messages(response):
+            usage_metadata = message.usage_metadata or {}
+            for kind in ("input", "output"):
+                token_count = usage_metadata.get(f"{kind}_tokens",0)
+                LLM_CALL_TOKENS.observe(token_count,kind=kind)
+                LLM_TOKENS.inc(token_count,kind=kind)
+
+    def on_llm_error(self, error:BaseException, *, run_id:UUID, **kwargs:Any)->None:
+        self._elapsed_seconds(run_id)
+
+    def on_tool_start(self, serialized:dict, input_str:str, *, run_id:UUID, **kwargs:Any)->None:
+        self._start(run_id)
+
+    def on_tool_end(self, output:Any, *, run_id:UUID, **kwargs:Any)->None:
+        elapsed_seconds = self._elapsed_seconds(run_id)
+        if elapsed_seconds is not None:
+            record_stage("tool",elapsed_seconds)
+
+    def on_tool_error(self, error:BaseException, *, run_id:UUID, **kwargs:Any)->None:
+        self.on_tool_end(None,run_id=run_id)
+
+def build_chat_model()->BaseChatModel:
+    """
+    Build the chat model selected by the ``LLM_MODE`` environment variable.
+
+    - ``live`` (default): DeepSeek client
+    - ``record``: DeepSeek client whose responses are saved to ``LLM_CASSETTE_PATH``
+    - ``replay``: responses served from ``LLM_CASSETTE_PATH`` after ``LLM_REPLAY_LATENCY_MS`` per call
+      and ``LLM_REPLAY_LATENCY_PER_TOKEN_MS`` per output token
+
+    ### Returns
+    A ``BaseChatModel`` object
+    """
+    llm_mode = os.getenv("LLM_MODE","live").lower()
+    cassette_path = Path(os.getenv("LLM_CASSETTE_PATH","llm_cassette.json"))
+
+    if llm_mode == "replay":
+        return ReplayChatModel(
+            cassette=LLMCassette(cassette_path),
+            latency_seconds=float(os.getenv("LLM_REPLAY_LATENCY_MS",0)) / 1000,
+            latency_per_output_token_seconds=float(os.getenv("LLM_REPLAY_LATENCY_PER_TOKEN_MS",0)) / 1000
+        )
+
+    from langchain_deepseek import ChatDeepSeek
+
+    live_llm = ChatDeepSeek(
+        model="deepseek-chat",
+        temperature=0,
+        max_tokens=None,
+        timeout=None,
+        max_retries=2,
+        base_url=os.getenv("LLM_BASE_URL"),
+        api_key=os.getenv("LLM_API_KEY")
+    )
+
+    if llm_mode == "record":
+        return RecordingChatModel(inner=live_llm,cassette=LLMCassette(cassette_path))
+    elif llm_mode == "live":
+        return live_llm
+    else:
+        raise ValueError(f"Unknown LLM_MODE {llm_mode}, expected live, record or replay")
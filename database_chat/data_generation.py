@@ -0,0 +1,21 @@
+import psycopg2
+from psycopg2 import errors
+
+def read_data_generation(database_connection_string:str)->int | None:
+    """
+    Read the data generation recorded by the last ingestion run of ``database_construction``.
+
+    ### Parameters
+    1. database_connection_string : ``str``
+        - Used to connect to the database
+
+    ### Returns
+    The generation as an ``int``, or ``None`` if the database does not record generations.
+    """
+    try:
+        with psycopg2.connect(database_connection_string) as connection:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT MAX(generation) FROM data_generation;")
+                return cursor.fetchone()[0]
+    except errors.UndefinedTable:
+        return None
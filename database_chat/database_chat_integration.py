@@ -1,33 +1,120 @@
-from langchain_deepseek import ChatDeepSeek
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, SystemMessage, ToolMessage
 from dotenv import load_dotenv
-from langchain_community.utilities import SQLDatabase
-from langchain_community.agent_toolkits import SQLDatabaseToolkit
-from langgraph.prebuilt import create_react_agent
 import os
+import json
+import time
+import threading
+import tempfile
+from collections import OrderedDict
+from typing import Iterator, TYPE_CHECKING
+from pathlib import Path
 import psycopg2
 from psycopg2.extras import RealDictCursor
-import pandas as pd
+from .query_preview import QueryPreview, paginate_query, explain_query, parse_estimated_rows
+from .result_cache import ResultSetCache, normalize_query
+from .query_guard import QueryGuard, QueryGuardConfiguration, QueryResult
+from .analytics_mirror import AnalyticsMirror
+from .data_generation import read_data_generation
+from .schema_descriptor import SchemaDescriptor, SchemaDescriptorProvider, default_descriptor_path, default_snapshot_path
+from .speculative_queries import QueryGenerationCancelled
+from .query_events import QueryEvent
+from .tool_cache import ToolResultCache, memoize_tools
+from .example_store import ExampleStore, ExampleMatch
+from .query_templates import QueryTemplateEngine, TemplateMatch
+from .prompt_prefilter import PromptPrefilter
+from .metrics import AGENT_TOOL_CALLS, timed_stage
+
+# The chat model client, the agent graph and pandas take seconds to import, so they are imported by the
+# methods that need them. Requests answered locally (prefilter, templates, cached results) never load them.
+if TYPE_CHECKING:
+    from langchain_core.language_models.chat_models import BaseChatModel
+    from langchain_community.utilities import SQLDatabase
+    import pandas as pd
 
 class SQLAgent:
     """
     Used to access various capabilities across the SQL agent. 
     """
-    def __init__(self):
+    def __init__(self,llm:"BaseChatModel | None"=None):
+        """
+        ### Parameters
+        1. llm : ``BaseChatModel | None``
+            - Chat model used by the agent. When ``None``, the model selected by ``LLM_MODE`` is built
+              (live DeepSeek client, or recording/replaying one, see ``build_chat_model``) on first use.
+        """
         load_dotenv()
         
-        api_key = os.getenv("LLM_API_KEY")
-        base_url = os.getenv("LLM_BASE_URL")
         self.database_connection_string = os.getenv("DATABASE_URL")
         
-        self.llm = ChatDeepSeek(
-            model="deepseek-chat",
-            temperature=0,
-            max_tokens=None,
-            timeout=None,
-            max_retries=2,
-            base_url=base_url,
-            api_key=api_key
+        default_cache_directory = Path(tempfile.gettempdir()) / "coe_result_cache"
+        self.result_cache = ResultSetCache(
+            cache_directory=Path(os.getenv("RESULT_CACHE_DIRECTORY",default_cache_directory)),
+            max_bytes=int(os.getenv("RESULT_CACHE_MAX_BYTES",256 * 1024 * 1024))
         )
+        # The data generation is re-read at most once per interval, cache hits in between never touch the database
+        self.data_generation_check_interval = float(os.getenv("DATA_GENERATION_CHECK_INTERVAL",30))
+        self._data_generation : int | None = None
+        self._data_generation_checked_at : float | None = None
+        
+        self.schema_descriptor_provider = SchemaDescriptorProvider(default_descriptor_path(),default_snapshot_path())
+        
+        self.query_guard = QueryGuard(QueryGuardConfiguration(
+            max_total_cost=float(os.getenv("QUERY_MAX_TOTAL_COST",10_000_000)),
+            max_estimated_rows=int(os.getenv("QUERY_MAX_ESTIMATED_ROWS",1_000_000)),
+            statement_timeout_ms=int(os.getenv("QUERY_STATEMENT_TIMEOUT_MS",60_000)),
+            auto_limit=os.getenv("QUERY_AUTO_LIMIT","true").lower() == "true"
+        ))
+        
+        # DuckDB copy exported by database_construction, aggregate queries are answered there when it is current
+        analytics_mirror_path = os.getenv("ANALYTICS_MIRROR_PATH")
+        self.analytics_mirror = AnalyticsMirror(
+            mirror_path=Path(analytics_mirror_path) if analytics_mirror_path else None,
+            max_rows=int(os.getenv("QUERY_MAX_ESTIMATED_ROWS",1_000_000)),
+            statement_timeout_ms=int(os.getenv("QUERY_STATEMENT_TIMEOUT_MS",60_000))
+        )
+        
+        # Upper bound on the tool calls of one query generation, after which the agent is asked for its final query
+        self.agent_max_tool_calls = int(os.getenv("AGENT_MAX_TOOL_CALLS",6))
+        self.tool_result_cache = ToolResultCache()
+        self._sql_database : "SQLDatabase | None" = None
+        self._sql_database_lock = threading.Lock()
+        
+        default_example_store_path = Path(tempfile.gettempdir()) / "coe_query_examples.jsonl"
+        self.example_store = ExampleStore(Path(os.getenv("EXAMPLE_STORE_PATH",default_example_store_path)))
+        self.example_count = int(os.getenv("EXAMPLE_COUNT",3))
+        # Above this similarity the nearest examples replace the agent loop with a single LLM call
+        self.example_similarity_threshold = float(os.getenv("EXAMPLE_SIMILARITY_THRESHOLD",0.8))
+        # Prompts of generated queries that have not been executed yet, keyed by the normalized query
+        self._pending_examples : OrderedDict[str,str] = OrderedDict()
+        self._pending_examples_lock = threading.Lock()
+        
+        self.query_templates_enabled = os.getenv("QUERY_TEMPLATES_ENABLED","true").lower() == "true"
+        self._template_engine : QueryTemplateEngine | None = None
+        self._template_engine_descriptor : SchemaDescriptor | None = None
+        # Decides clear cut prompts locally so only ambiguous ones are validated by the LLM
+        self.prompt_prefilter_enabled = os.getenv("PROMPT_PREFILTER_ENABLED","true").lower() == "true"
+        self._prompt_prefilter : PromptPrefilter | None = None
+        self._prompt_prefilter_engine : QueryTemplateEngine | None = None
+        
+        self._llm = llm
+        self._llm_lock = threading.Lock()
+        self._llm_instrumented = False
+    
+    @property
+    def llm(self)->"BaseChatModel":
+        """
+        Chat model used by the agent, built on first access when none was passed in. Its calls are recorded
+        in the process metrics.
+        """
+        with self._llm_lock:
+            if self._llm is None:
+                from .chat_models import build_chat_model
+                self._llm = build_chat_model()
+            if not self._llm_instrumented:
+                from .chat_models import MetricsCallbackHandler
+                self._llm.callbacks = [*(self._llm.callbacks or []), MetricsCallbackHandler()]
+                self._llm_instrumented = True
+            return self._llm
     
     def validate_prompt_adequacy(self,prompt:str)->bool:
         """
@@ -40,6 +127,11 @@ class SQLAgent:
         ### Returns
         ``True|False`` depending on validity.
         """
+        if self.prompt_prefilter_enabled:
+            decision = self.__return_prompt_prefilter(self.database_connection_string).decide(prompt)
+            if decision is not None:
+                return decision
+        
         return self.__validate_information_needed_for_prompt(
             llm=self.llm,
             database_connection_string=self.database_connection_string,
@@ -57,38 +149,121 @@ class SQLAgent:
         ### Returns
         A ``str`` object containing suggestions. 
         """
-        return self.__generate_additional_information(
+        return "".join(self.stream_prompt_suggestions(prompt))
+    
+    def stream_prompt_suggestions(self,prompt:str)->Iterator[str]:
+        """
+        Generate prompt suggestions based on the prompt, yielding the text as the LLM produces it.
+        
+        ### Parameters
+        1. prompt : ``str``
+            - Prompt used for generating suggestions
+        
+        ### Returns
+        An ``Iterator[str]`` of text chunks.
+        """
+        return self.__stream_additional_information(
             llm=self.llm,
             database_connection_string=self.database_connection_string,
             prompt=prompt
         )
     
-    def generate_query(self,prompt:str)->str:
+    def generate_query(self,prompt:str,cancel_event:threading.Event|None=None)->str:
         """
         Given the prompt, internally, generate a query internally and return it.
         
         ### Parameters
         1. prompt : ``str``
             - Prompt to be used generating the query.
+        2. cancel_event : ``threading.Event | None``
+            - When set, generation stops after the current agent step.
+        ### Raises
+        ``QueryGenerationCancelled`` if the cancel event was set before the query was ready.
         ### Returns
         A ``str`` object containing the query.
         """
-        query = self.__generate_query(
-            llm=self.llm,
-            database_connection_string=self.database_connection_string,
-            prompt=prompt
-        )
+        query = None
+        for event in self.stream_query(prompt,cancel_event):
+            if event.event_type == "query":
+                query = event.content
+        
+        return query
+    
+    def stream_query(self,prompt:str,cancel_event:threading.Event|None=None)->Iterator[QueryEvent]:
+        """
+        Given the prompt, generate a query, yielding LLM tokens and agent steps as they are produced.
+        
+        ### Parameters
+        1. prompt : ``str``
+            - Prompt to be used generating the query.
+        2. cancel_event : ``threading.Event | None``
+            - When set, generation stops at the next event.
+        ### Raises
+        ``QueryGenerationCancelled`` if the cancel event was set before the query was ready.
+        ### Returns
+        An ``Iterator[QueryEvent]`` whose last event has the type ``query`` and holds the final query.
+        """
+        template_match = self.match_query_template(prompt)
+        if template_match is not None:
+            yield QueryEvent(event_type="query",content=template_match.query,name=template_match.template_name)
+            return
+        
+        example_matches = self.example_store.search(prompt,self.example_count)
+        
+        if example_matches and example_matches[0].similarity >= self.example_similarity_threshold:
+            event_itr = self.__stream_query_from_examples(
+                llm=self.llm,
+                database_connection_string=self.database_connection_string,
+                prompt=prompt,
+                example_matches=example_matches
+            )
+        else:
+            event_itr = self.__stream_agent_query(
+                llm=self.llm,
+                database_connection_string=self.database_connection_string,
+                prompt=prompt,
+                example_matches=example_matches
+            )
+        
+        response_content = ""
+        for event in event_itr:
+            if cancel_event is not None and cancel_event.is_set():
+                raise QueryGenerationCancelled(f"Query generation cancelled for prompt: {prompt}")
+            if event.event_type == "answer":
+                response_content = event.content
+            else:
+                yield event
         
         # Clean query just in case extra text was left in by the LLM
         expected_first_clause = "SELECT"
         
-        expected_start_index = query.index(expected_first_clause)
+        expected_start_index = response_content.index(expected_first_clause)
         
-        query = query[expected_start_index:]
+        query = response_content[expected_start_index:]
         
-        return query
+        with self._pending_examples_lock:
+            self._pending_examples[normalize_query(query)] = prompt
+            while len(self._pending_examples) > 256:
+                self._pending_examples.popitem(last=False)
+        
+        yield QueryEvent(event_type="query",content=query)
     
-    def return_dataframe(self,prompt:str)->pd.DataFrame:
+    def match_query_template(self,prompt:str)->TemplateMatch|None:
+        """
+        Given the prompt, return the hand written query template that answers it without an LLM, if any.
+        
+        ### Parameters
+        1. prompt : ``str``
+            - Prompt to be matched against the templates.
+        ### Returns
+        A ``TemplateMatch`` object, or ``None`` when templates are disabled or none applies.
+        """
+        if not self.query_templates_enabled:
+            return None
+        
+        return self.__return_template_engine(self.database_connection_string).match(prompt)
+    
+    def return_dataframe(self,prompt:str)->"pd.DataFrame":
         """
         Given the prompt, treat it as a query, access the database, and return a DataFrame.
         
@@ -97,33 +272,204 @@ class SQLAgent:
             - Prompt to be used generating the query.
         ### Returns
         A ``pd.DataFrame`` object
-        """        
-        return self.__retrieve_dataframe(
-            query=prompt,
-            database_connection_string=self.database_connection_string
+        """
+        return self.return_query_result(prompt).dataframe
+    
+    def return_query_result(self,query:str)->QueryResult:
+        """
+        Given the query, check its plan against the guard limits, execute it and return the result along with the plan estimate.
+        
+        ### Parameters
+        1. query : ``str``
+            - Query to be executed.
+        ### Raises
+        ``QueryRejectedError`` if the query is over the configured cost or row limits.
+        ### Returns
+        A ``QueryResult`` object. The plan estimate is ``None`` when the result came from the cache or the analytics mirror.
+        """
+        generation = None
+        if self.result_cache.is_enabled() or self.analytics_mirror.is_enabled():
+            generation = self.__return_data_generation(self.database_connection_string)
+        
+        if generation is not None and self.result_cache.is_enabled():
+            cached_df = self.result_cache.get(query,generation)
+            if cached_df is not None:
+                self.__record_example(query)
+                return QueryResult(dataframe=cached_df,plan_estimate=None)
+        
+        mirror_df = None
+        if generation is not None:
+            with timed_stage("mirror"):
+                mirror_df = self.analytics_mirror.execute(query,generation)
+        
+        if mirror_df is not None:
+            query_result = QueryResult(dataframe=mirror_df,plan_estimate=None)
+        else:
+            query_result = self.__retrieve_dataframe(
+                query=query,
+                database_connection_string=self.database_connection_string
+            )
+        
+        if generation is not None and self.result_cache.is_enabled():
+            self.result_cache.put(query,generation,query_result.dataframe)
+        
+        self.__record_example(query)
+        return query_result
+    
+    def return_preview(self,query:str,page_size:int,offset:int=0)->QueryPreview:
+        """
+        Given the query, return a single page of its result set along with the estimated total row count.
+        
+        ### Parameters
+        1. query : ``str``
+            - Query to be previewed.
+        2. page_size : ``int``
+            - Maximum number of rows returned in the page.
+        3. offset : ``int``
+            - Number of rows to skip before the page starts.
+        ### Returns
+        A ``QueryPreview`` object
+        """
+        return self.__retrieve_preview(
+            query=query,
+            database_connection_string=self.database_connection_string,
+            page_size=page_size,
+            offset=offset
+        )
+    
+    def __record_example(self,query:str)->None:
+        """
+        Store the query as a verified example if it was generated by this agent.
+        
+        ### Parameters
+        1. query: ``str``
+            - Query that executed successfully
+        
+        ### Effects
+        Appends the example to the example store file
+        
+        ### Returns
+        ``None``
+        """
+        with self._pending_examples_lock:
+            prompt = self._pending_examples.pop(normalize_query(query),None)
+        
+        if prompt is not None:
+            self.example_store.add(prompt,query)
+    
+    def __format_examples(self,example_matches:list[ExampleMatch])->str:
+        return "\n\n".join(
+            f"Question: {match.example.prompt}\nQuery: {match.example.query}"
+            for match in example_matches
         )
     
-    def __generate_query(self,llm:ChatDeepSeek,database_connection_string:str,prompt:str)->str:
+    def __stream_llm_answer(self,llm:"BaseChatModel",messages:list)->Iterator[QueryEvent]:
+        """
+        Stream a single LLM response as ``token`` events followed by an ``answer`` event holding the full text.
+        
+        ### Parameters
+        1. llm: ``BaseChatModel``
+            - Chat model client
+        2. messages: ``list``
+            - Messages sent to the LLM
+        
+        ### Effects
+        Internally makes a call to the LLM and depletes tokens
+        
+        ### Returns
+        An ``Iterator[QueryEvent]`` object
+        """
+        response_content = ""
+        for chunk in llm.stream(messages):
+            chunk_text = chunk.text()
+            if chunk_text:
+                response_content += chunk_text
+                yield QueryEvent(event_type="token",content=chunk_text)
+        
+        yield QueryEvent(event_type="answer",content=response_content)
+    
+    def __stream_query_from_examples(self,llm:"BaseChatModel",database_connection_string:str,prompt:str,example_matches:list[ExampleMatch])->Iterator[QueryEvent]:
+        """
+        Generate a query with a single LLM call by adapting verified examples of similar questions.
+        
+        ### Parameters
+        1. llm: ``BaseChatModel``
+            - Chat model client
+        2. database_connection_string : ``str``
+            - Connection string used to obtain the schema descriptor
+        3. prompt: ``str``
+            - Prompt used for sql generation
+        4. example_matches: ``list[ExampleMatch]``
+            - Nearest verified examples
+        
+        ### Effects
+        Internally makes a call to the LLM and depletes tokens
+        
+        ### Returns
+        An ``Iterator[QueryEvent]`` ending with an ``answer`` event holding the DML query in string format
+        """
+        schema_descriptor = self.__return_schema_descriptor(database_connection_string)
+        
+        system_prompt = """You are an agent designed to write {dialect} queries for a traffic count database.
+            The database information is this:
+            
+            {db_info}
+            
+            These questions were answered correctly with the queries below them:
+            
+            {examples}
+            
+            Given an input question, adapt the closest example to write the query that answers it. Query all relevant
+            columns even if the user did not explicitly ask for them. DO NOT make any DML statements (INSERT, UPDATE, DELETE, DROP etc.).
+            
+            ONLY RETURN THE QUERY TEXT NOTHING ELSE, NO ADDED REMARKS. DO NOT FORGET THE SEMICOLON AT THE END OF THE QUERY.
+            """.format(
+                dialect=schema_descriptor.dialect,
+                db_info=schema_descriptor.to_prompt(),
+                examples=self.__format_examples(example_matches)
+            )
+        
+        messages = [
+            (
+                "system",
+                system_prompt
+            ),
+            (
+                "human",
+                prompt
+            )
+        ]
+        
+        return self.__stream_llm_answer(llm,messages)
+    
+    def __stream_agent_query(self,llm:"BaseChatModel",database_connection_string:str,prompt:str,example_matches:list[ExampleMatch]|None=None)->Iterator[QueryEvent]:
         """
         Generate a DML query based on the prompt for the database referenced by the connection string.
         
         ### Parameters
-        1. llm: ``ChatDeepSeek``
-            - Deepseek client
+        1. llm: ``BaseChatModel``
+            - Chat model client
         2. database_connection_string : ``str``
             - Connection string used to obtain schema for context for the LLM
         3. prompt: ``str``
             - Prompt used for sql generation
+        4. example_matches: ``list[ExampleMatch] | None``
+            - Verified examples of similar questions added to the system prompt
         
         ### Effects
         Depletes tokens from DeepSeek account
         
         ### Returns 
+        An ``Iterator[QueryEvent]`` of LLM tokens and tool steps, ending with an ``answer`` event holding the
         DML query in string format
         """
-        db = SQLDatabase.from_uri(database_uri=database_connection_string)
-        toolkit = SQLDatabaseToolkit(db=db,llm=llm)
-        schema_info = db.get_table_info(db.get_usable_table_names())
+        from langchain_community.agent_toolkits import SQLDatabaseToolkit
+        from langgraph.prebuilt import create_react_agent
+        from .chat_models import MetricsCallbackHandler
+        
+        toolkit = SQLDatabaseToolkit(db=self.__return_sql_database(database_connection_string),llm=llm)
+        schema_descriptor = self.__return_schema_descriptor(database_connection_string)
+        self.tool_result_cache.set_generation(schema_descriptor.generation)
         
         system_prompt = """
         You are an agent designed to interact with a SQL database.
@@ -140,41 +486,107 @@ class SQLAgent:
         database. ALWAYS REMEMBER TO LIMIT QUERIES TO A MAXIMUM OF FIVE RETURNED TUPLES WHEN CHECKING THE QUERY.
         HOWEVER, REMOVE THIS FROM THE FINAL QUERY UNLESS THE USER SPECIFIED A LIMIT.
 
-        To start you should ALWAYS look at the tables in the database to see what you
-        can query. Do NOT skip this step.
+        The tables, how they join and the values stored in the lookup tables are described below, so you do not
+        need to list the tables or look up their schema unless a query fails:
+        
+        {db_info}
+
+        You can make at most {max_tool_calls} tool calls, so test the query once and only retry when it fails.
+        {examples}
 
         After testing the query you have written and fixing any issues, return simply the {dialect} query as the final output.
         
         THIS IS IMPORTANT. FOR THE FINAL MESSAGE, ONLY RETURN THE QUERY TEXT NOTHING ELSE, NO ADDED REMARKS. DO NOT FORGET THE
         SEMICOLON AT THE END OF QUERIES.
         """.format(
-            dialect=db.dialect,
+            dialect=schema_descriptor.dialect,
+            db_info=schema_descriptor.to_prompt(),
+            max_tool_calls=self.agent_max_tool_calls,
+            examples=f"\nThese similar questions were answered correctly with the queries below them:\n\n{self.__format_examples(example_matches)}\n" if example_matches else ""
         )
 
         
         agent = create_react_agent(
             model=llm,
-            tools=toolkit.get_tools(),
+            tools=memoize_tools(toolkit.get_tools(),self.tool_result_cache),
             prompt=system_prompt
         )
         
+        # Tokens arrive through the messages stream, completed steps through the values stream
         response_itr = agent.stream(
             {"messages": [{"role": "user", "content": prompt}]},
-            stream_mode='values'
+            # Tool runs are timed here, the model's own callbacks already time its calls
+            config={"callbacks": [MetricsCallbackHandler(record_llm_calls=False)]},
+            stream_mode=['messages','values']
         )
         
-        list_response = list(response_itr)
-        response_content = list_response[-1]['messages'][-1].content
-        return response_content
+        last_state = None
+        reported_message_count = 0
+        tool_call_count = 0
+        for stream_mode, payload in response_itr:
+            if stream_mode == 'messages':
+                message_chunk, _ = payload
+                if isinstance(message_chunk, AIMessageChunk) and message_chunk.text():
+                    yield QueryEvent(event_type="token",content=message_chunk.text())
+                continue
+            
+            last_state = payload
+            for message in last_state['messages'][reported_message_count:]:
+                if isinstance(message, AIMessage):
+                    for tool_call in message.tool_calls:
+                        yield QueryEvent(event_type="tool_call",content=json.dumps(tool_call["args"]),name=tool_call["name"])
+                elif isinstance(message, ToolMessage):
+                    yield QueryEvent(event_type="tool_result",content=str(message.content)[:2000],name=message.name)
+            reported_message_count = len(last_state['messages'])
+            
+            tool_call_count = sum(len(message.tool_calls) for message in last_state['messages'] if isinstance(message, AIMessage))
+            if tool_call_count > self.agent_max_tool_calls:
+                # Stop before the tool calls over the budget are executed
+                AGENT_TOOL_CALLS.observe(tool_call_count)
+                yield from self.__stream_final_query(llm,system_prompt,last_state['messages'])
+                return
+        
+        AGENT_TOOL_CALLS.observe(tool_call_count)
+        yield QueryEvent(event_type="answer",content=last_state['messages'][-1].content)
+    
+    def __stream_final_query(self,llm:"BaseChatModel",system_prompt:str,messages:list)->Iterator[QueryEvent]:
+        """
+        Ask the LLM for its final query once the agent has used up its tool call budget.
+        
+        ### Parameters
+        1. llm: ``BaseChatModel``
+            - Chat model client, used without tools
+        2. system_prompt: ``str``
+            - System prompt given to the agent
+        3. messages: ``list``
+            - Messages of the agent run so far
+        
+        ### Effects
+        Internally makes a call to the LLM and depletes tokens
+        
+        ### Returns
+        An ``Iterator[QueryEvent]`` ending with an ``answer`` event holding the DML query in string format
+        """
+        # Tool calls without results can not be sent back to the LLM
+        if isinstance(messages[-1], AIMessage) and messages[-1].tool_calls:
+            messages = messages[:-1]
+        
+        final_messages = [
+            SystemMessage(content=system_prompt),
+            *messages,
+            HumanMessage(content="The tool call budget has been used up. Respond now with only the final query, using what you have learned so far.")
+        ]
+        
+        return self.__stream_llm_answer(llm,final_messages)
         
 
-    def __generate_additional_information(self,llm:ChatDeepSeek,database_connection_string:str,prompt:str)->str:
+    def __stream_additional_information(self,llm:"BaseChatModel",database_connection_string:str,prompt:str)->Iterator[str]:
         """
         Given the prompt, use an LLM agent to provide the minimum additional information that would be needed to generate
         a query from the database.
         
         ### Parameters
-        1. llm:``langchain_deepseek.ChatDeepSeek``
+        1. llm:``BaseChatModel``
             - Used to send the request
         2. database_connection: ``str``
             - Connection string needed to connect to the database.
@@ -185,10 +597,10 @@ class SQLAgent:
         Internally makes a call to the LLM and depletes tokens
         
         ### Returns
-        ``str`` message that contains the minimum additional information needed to generate information from the database. 
+        ``Iterator[str]`` of text chunks of the message that contains the minimum additional information needed to
+        generate information from the database. 
         """
-        db = SQLDatabase.from_uri(database_connection_string)
-        schema_info = db.get_table_info(db.get_usable_table_names())
+        schema_descriptor = self.__return_schema_descriptor(database_connection_string)
         
         system_prompt = """You are an agent designed to interact with a SQL database.
             The database information is this:
@@ -199,8 +611,8 @@ class SQLAgent:
             
             After examining the schema, respond with the information.
             """.format(
-                db_info=schema_info,
-                dialect=db.dialect
+                db_info=schema_descriptor.to_prompt(),
+                dialect=schema_descriptor.dialect
             )
         
         messages = [
@@ -214,13 +626,15 @@ class SQLAgent:
             )
         ]
         
-        response = llm.invoke(messages)
-        
-        return response.content
+        for chunk in llm.stream(messages):
+            chunk_text = chunk.text()
+            if chunk_text:
+                yield chunk_text
 
-    def __retrieve_dataframe(self,query:str,database_connection_string:str)->pd.DataFrame:
+    def __retrieve_dataframe(self,query:str,database_connection_string:str)->QueryResult:
         """
-        Given the query and connection string, return a pandas Dataframe for the resulting output
+        Given the query and connection string, return a pandas Dataframe for the resulting output.
+        The query runs in a read-only transaction with a statement timeout, after its plan has been checked by the guard.
         
         ### Parameters
         1. query: ``str``
@@ -229,27 +643,175 @@ class SQLAgent:
             - Used to connect to the database
         
         ### Returns
-        A ``pd.DataFrame`` object
+        A ``QueryResult`` object
         """
+        import pandas as pd
         
         return_dict = None
         
-        with psycopg2.connect(database_connection_string) as connection:
+        with timed_stage("sql"), psycopg2.connect(database_connection_string) as connection:
             with connection.cursor(cursor_factory=RealDictCursor) as cursor:
-                cursor.execute(query=query)
+                self.query_guard.configure_transaction(connection,cursor)
+                statement, plan_estimate = self.query_guard.prepare_query(cursor,query)
+                cursor.execute(query=statement)
                 result_dict = cursor.fetchall()
                 return_dict = result_dict
                 
-        return pd.DataFrame(data=return_dict)
+        return QueryResult(
+            dataframe=pd.DataFrame(data=return_dict),
+            plan_estimate=plan_estimate
+        )
         
 
-    def __validate_information_needed_for_prompt(self,llm:ChatDeepSeek,database_connection_string:str,prompt:str)->bool:
+    def __return_schema_descriptor(self,database_connection_string:str)->SchemaDescriptor:
+        """
+        Return the compact schema descriptor embedded into LLM prompts, rebuilt whenever the data generation changes.
+        
+        ### Parameters
+        1. database_connection_string: ``str``
+            - Used to connect to the database
+        
+        ### Returns
+        A ``SchemaDescriptor`` object
+        """
+        return self.schema_descriptor_provider.get_descriptor(
+            database_connection_string=database_connection_string,
+            generation=self.__return_data_generation(database_connection_string)
+        )
+    
+    def __return_template_engine(self,database_connection_string:str)->QueryTemplateEngine:
+        """
+        Return the template engine, rebuilding its vocabulary whenever the schema descriptor changes.
+        
+        ### Parameters
+        1. database_connection_string: ``str``
+            - Used to connect to the database
+        
+        ### Returns
+        A ``QueryTemplateEngine`` object
+        """
+        schema_descriptor = self.__return_schema_descriptor(database_connection_string)
+        
+        if self._template_engine is None or self._template_engine_descriptor is not schema_descriptor:
+            self._template_engine = QueryTemplateEngine(schema_descriptor)
+            self._template_engine_descriptor = schema_descriptor
+        
+        return self._template_engine
+    
+    def __return_prompt_prefilter(self,database_connection_string:str)->PromptPrefilter:
+        """
+        Return the prompt prefilter, rebuilt together with the template engine it shares its vocabulary with.
+        
+        ### Parameters
+        1. database_connection_string: ``str``
+            - Used to connect to the database
+        
+        ### Returns
+        A ``PromptPrefilter`` object
+        """
+        template_engine = self.__return_template_engine(database_connection_string)
+        
+        if self._prompt_prefilter is None or self._prompt_prefilter_engine is not template_engine:
+            self._prompt_prefilter = PromptPrefilter.from_template_engine(
+                template_engine,
+                locations=self._template_engine_descriptor.locations,
+                study_names=self._template_engine_descriptor.study_names
+            )
+            self._prompt_prefilter_engine = template_engine
+        
+        return self._prompt_prefilter
+    
+    def __return_sql_database(self,database_connection_string:str)->"SQLDatabase":
+        """
+        Return the ``SQLDatabase`` used by the agent tools. Tables are reflected when a tool first asks for them,
+        since the schema descriptor in the prompt usually makes the schema lookups unnecessary.
+        
+        ### Parameters
+        1. database_connection_string: ``str``
+            - Used to connect to the database
+        
+        ### Returns
+        A ``SQLDatabase`` object
+        """
+        from langchain_community.utilities import SQLDatabase
+        
+        with self._sql_database_lock:
+            if self._sql_database is None:
+                with timed_stage("schema"):
+                    self._sql_database = SQLDatabase.from_uri(
+                        database_uri=database_connection_string,
+                        ignore_tables=["data_generation"],
+                        lazy_table_reflection=True
+                    )
+            return self._sql_database
+    
+    def __return_data_generation(self,database_connection_string:str)->int|None:
+        """
+        Return the data generation recorded by the last ingestion, re-reading it from the database only
+        once the check interval has passed.
+        
+        ### Parameters
+        1. database_connection_string: ``str``
+            - Used to connect to the database
+        
+        ### Returns
+        The generation as an ``int``, or ``None`` if the database does not record generations, in which
+        case results must not be cached and the schema descriptor is not refreshed.
+        """
+        now = time.monotonic()
+        if self._data_generation_checked_at is not None and now - self._data_generation_checked_at < self.data_generation_check_interval:
+            return self._data_generation
+        
+        self._data_generation = read_data_generation(database_connection_string)
+        self._data_generation_checked_at = now
+        return self._data_generation
+    
+    def __retrieve_preview(self,query:str,database_connection_string:str,page_size:int,offset:int)->QueryPreview:
+        """
+        Given the query, fetch one page of the result set with ``LIMIT/OFFSET`` and estimate the total
+        row count with ``EXPLAIN`` instead of running the full query. Pages follow the query's own order,
+        or a stable order if it has none, so paging through the result returns every row once.
+        
+        ### Parameters
+        1. query: ``str``
+            - Query to be passed into the database
+        2. database_connection_string: ``str``
+            - Used to connect to the database
+        3. page_size: ``int``
+            - Maximum number of rows in the page
+        4. offset: ``int``
+            - Number of rows to skip before the page starts
+        
+        ### Returns
+        A ``QueryPreview`` object
+        """
+        import pandas as pd
+        
+        with timed_stage("sql"), psycopg2.connect(database_connection_string) as connection:
+            with connection.cursor() as cursor:
+                self.query_guard.configure_transaction(connection,cursor)
+                cursor.execute(explain_query(query))
+                explain_output = cursor.fetchone()[0]
+            
+            with connection.cursor(cursor_factory=RealDictCursor) as cursor:
+                cursor.execute(paginate_query(query,page_size,offset,stable_order=True))
+                page_rows = cursor.fetchall()
+                columns = [column.name for column in cursor.description]
+        
+        return QueryPreview(
+            dataframe=pd.DataFrame(data=page_rows,columns=columns),
+            estimated_row_count=parse_estimated_rows(explain_output),
+            page_size=page_size,
+            offset=offset
+        )
+
+    def __validate_information_needed_for_prompt(self,llm:"BaseChatModel",database_connection_string:str,prompt:str)->bool:
         """
         Given the prompt, use an LLM agent to check if the prompt aligns with a request for a SQL query from 
         the database schema. 
         
         ### Parameters
-        1. llm:``langchain_deepseek.ChatDeepSeek``
+        1. llm:``BaseChatModel``
             - Used to send the request
         2. database_connection: ``str``
             - Connection string needed to connect to the database.
@@ -262,9 +824,7 @@ class SQLAgent:
         ### Returns
         ``True | False`` depending on closeness to a SQL query. 
         """
-        db = SQLDatabase.from_uri(database_connection_string)
-        
-        schema_info = db.get_table_info(db.get_usable_table_names())
+        schema_descriptor = self.__return_schema_descriptor(database_connection_string)
         
         system_message = """You are an agent designed to interact with a SQL database.
             The database information is this:
@@ -279,8 +839,8 @@ class SQLAgent:
             Simply respond with 'True' if enough information is present to answer the question, or 'False' if not enough information is available.
             respond with anything else.
             """.format(
-                db_info=schema_info,
-                dialect=db.dialect
+                db_info=schema_descriptor.to_prompt(),
+                dialect=schema_descriptor.dialect
             )
         
         messages = [
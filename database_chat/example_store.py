@@ -0,0 +1,150 @@
+from dataclasses import dataclass, asdict
+from pathlib import Path
+import json
+import re
+import threading
+import zlib
+import numpy as np
+
+@dataclass
+class QueryExample:
+    """
+    Prompt paired with a query that executed successfully for it.
+    """
+    prompt : str
+    query : str
+
+@dataclass
+class ExampleMatch:
+    example : QueryExample
+    similarity : float
+
+def _normalize_prompt(prompt:str)->str:
+    return re.sub(r"\s+", " ", prompt.strip().lower())
+
+class ExampleStore:
+    """
+    Stores verified prompt/query examples in a JSONL file and finds the ones closest to a new prompt, using
+    TF-IDF weighted hashed character n-grams and cosine similarity.
+    """
+    def __init__(self, store_path:Path, n_features:int = 2**14, ngram_range:tuple[int,int] = (3,5)) -> None:
+        self._store_path = store_path
+        self._n_features = n_features
+        self._ngram_range = ngram_range
+        self._lock = threading.Lock()
+
+        self._examples : list[QueryExample] = []
+        self._prompt_indexes : dict[str,int] = {}
+        self._term_frequencies = np.zeros((0,n_features),dtype=np.float32)
+        self._weighted_vectors = self._term_frequencies
+        self._idf = np.ones(n_features,dtype=np.float32)
+
+        for example in self._load_from_disk():
+            self._add_to_index(example)
+        self._reweight()
+
+    def _load_from_disk(self)->list[QueryExample]:
+        examples = []
+        try:
+            with open(self._store_path,'r',encoding='utf-8') as file:
+                for line in file:
+                    if line.strip():
+                        examples.append(QueryExample(**json.loads(line)))
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, TypeError) as e:
+            print(f'[WARNING] Query examples not loaded: {e}')
+        return examples
+
+    def _vectorize(self, prompt:str)->np.ndarray:
+        text = f" {_normalize_prompt(prompt)} "
+        vector = np.zeros(self._n_features,dtype=np.float32)
+        minimum_length, maximum_length = self._ngram_range
+        for length in range(minimum_length,maximum_length + 1):
+            for start in range(len(text) - length + 1):
+                # crc32 is used since the built-in hash of a str changes between processes
+                vector[zlib.crc32(text[start:start + length].encode("utf-8")) % self._n_features] += 1
+        return np.log1p(vector)
+
+    def _add_to_index(self, example:QueryExample)->None:
+        normalized_prompt = _normalize_prompt(example.prompt)
+        term_frequencies = self._vectorize(example.prompt)
+
+        if normalized_prompt in self._prompt_indexes:
+            # The latest verified query replaces the earlier one for the same prompt
+            index = self._prompt_indexes[normalized_prompt]
+            self._examples[index] = example
+            return
+
+        self._prompt_indexes[normalized_prompt] = len(self._examples)
+        self._examples.append(example)
+        self._term_frequencies = np.vstack([self._term_frequencies,term_frequencies])
+
+    def _reweight(self)->None:
+        document_count = len(self._examples)
+        document_frequencies = np.count_nonzero(self._term_frequencies,axis=0)
+        self._idf = (np.log((1 + document_count) / (1 + document_frequencies)) + 1).astype(np.float32)
+        self._weighted_vectors = self._normalize(self._term_frequencies * self._idf)
+
+    def _normalize(self, vectors:np.ndarray)->np.ndarray:
+        norms = np.linalg.norm(vectors,axis=-1,keepdims=True)
+        norms[norms == 0] = 1
+        return vectors / norms
+
+    def __len__(self)->int:
+        return len(self._examples)
+
+    def add(self, prompt:str, query:str)->None:
+        """
+        Add a verified example to the index and append it to the store file.
+
+        ### Parameters
+        1. prompt : ``str``
+            - Prompt the query was generated for
+        2. query : ``str``
+            - Query that executed successfully
+
+        ### Effects
+        Appends a line to the store file
+
+        ### Returns
+        ``None``
+        """
+        example = QueryExample(prompt=prompt.strip(),query=query.strip())
+
+        with self._lock:
+            self._add_to_index(example)
+            self._reweight()
+
+            try:
+                self._store_path.parent.mkdir(parents=True,exist_ok=True)
+                with open(self._store_path,'a',encoding='utf-8') as file:
+                    file.write(json.dumps(asdict(example)) + "\n")
+            except OSError as e:
+                print(f'[WARNING] Query example not saved: {e}')
+
+    def search(self, prompt:str, count:int)->list[ExampleMatch]:
+        """
+        Return the stored examples most similar to the prompt.
+
+        ### Parameters
+        1. prompt : ``str``
+            - Prompt to find examples for
+        2. count : ``int``
+            - Maximum number of examples returned
+
+        ### Returns
+        A ``list[ExampleMatch]`` object ordered from most to least similar
+        """
+        with self._lock:
+            if not self._examples or count <= 0:
+                return []
+
+            prompt_vector = self._normalize(self._vectorize(prompt) * self._idf)
+            similarities = self._weighted_vectors @ prompt_vector
+            best_indexes = np.argsort(-similarities)[:count]
+
+            return [
+                ExampleMatch(example=self._examples[index],similarity=float(similarities[index]))
+                for index in best_indexes
+            ]
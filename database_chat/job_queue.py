@@ -0,0 +1,190 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from enum import StrEnum
+from pathlib import Path
+from typing import Callable
+import sqlite3
+import threading
+import time
+import uuid
+
+class JobStatus(StrEnum):
+    queued = "queued"
+    running = "running"
+    succeeded = "succeeded"
+    failed = "failed"
+
+@dataclass
+class QueryJob:
+    job_id : str
+    prompt : str
+    status : JobStatus
+    query : str | None
+    error : str | None
+    created_at : float
+    updated_at : float
+
+    def is_finished(self)->bool:
+        return self.status in (JobStatus.succeeded, JobStatus.failed)
+
+class QueryJobQueue:
+    """
+    Runs query generation jobs on a bounded worker pool. Jobs and their results are stored in a local
+    SQLite file, so jobs that were queued or running when the process stopped are run again on start.
+    """
+    def __init__(self, generate_query:Callable[[str],str], database_path:Path, max_workers:int, result_ttl_seconds:float) -> None:
+        self._generate_query = generate_query
+        self._result_ttl_seconds = result_ttl_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,thread_name_prefix="query-job")
+        # Notified whenever a job changes state, used by clients waiting for a result
+        self._condition = threading.Condition(threading.RLock())
+
+        database_path.parent.mkdir(parents=True,exist_ok=True)
+        self._connection = sqlite3.connect(database_path,check_same_thread=False,isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS query_jobs (
+                job_id TEXT PRIMARY KEY,
+                prompt TEXT NOT NULL,
+                status TEXT NOT NULL,
+                query TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self._resume_jobs()
+
+    def _resume_jobs(self)->None:
+        with self._condition:
+            self._connection.execute(
+                "UPDATE query_jobs SET status = ?, updated_at = ? WHERE status = ?",
+                (JobStatus.queued, time.time(), JobStatus.running)
+            )
+            job_ids = [row[0] for row in self._connection.execute(
+                "SELECT job_id FROM query_jobs WHERE status = ? ORDER BY created_at", (JobStatus.queued,)
+            )]
+
+        for job_id in job_ids:
+            self._executor.submit(self._run,job_id)
+
+    def _purge_expired_jobs(self)->None:
+        with self._condition:
+            self._connection.execute(
+                "DELETE FROM query_jobs WHERE status IN (?, ?) AND updated_at < ?",
+                (JobStatus.succeeded, JobStatus.failed, time.time() - self._result_ttl_seconds)
+            )
+
+    def _update(self, job_id:str, status:JobStatus, query:str | None = None, error:str | None = None)->None:
+        with self._condition:
+            self._connection.execute(
+                "UPDATE query_jobs SET status = ?, query = ?, error = ?, updated_at = ? WHERE job_id = ?",
+                (status, query, error, time.time(), job_id)
+            )
+            self._condition.notify_all()
+
+    def _run(self, job_id:str)->None:
+        job = self.get(job_id)
+        self._update(job_id,JobStatus.running)
+
+        try:
+            query = self._generate_query(job.prompt)
+            self._update(job_id,JobStatus.succeeded,query=query)
+        except Exception as e:
+            self._update(job_id,JobStatus.failed,error=str(e.args))
+
+    def submit(self, prompt:str)->QueryJob:
+        """
+        Queue a query generation job for the prompt.
+
+        ### Parameters
+        1. prompt : ``str``
+            - Prompt used for generating the query
+
+        ### Effects
+        Inserts the job into the job database
+
+        ### Returns
+        A ``QueryJob`` object
+        """
+        self._purge_expired_jobs()
+
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._condition:
+            self._connection.execute(
+                "INSERT INTO query_jobs (job_id, prompt, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, prompt, JobStatus.queued, now, now)
+            )
+
+        self._executor.submit(self._run,job_id)
+        return self.get(job_id)
+
+    def get(self, job_id:str)->QueryJob:
+        """
+        Return the current state of the job.
+
+        ### Parameters
+        1. job_id : ``str``
+            - Id returned by ``submit``
+
+        ### Raises
+        ``KeyError`` if the job is unknown or has expired.
+
+        ### Returns
+        A ``QueryJob`` object
+        """
+        with self._condition:
+            row = self._connection.execute(
+                "SELECT job_id, prompt, status, query, error, created_at, updated_at FROM query_jobs WHERE job_id = ?",
+                (job_id,)
+            ).fetchone()
+
+        if row is None:
+            raise KeyError(f"Job {job_id} not found")
+
+        return QueryJob(
+            job_id=row[0],
+            prompt=row[1],
+            status=JobStatus(row[2]),
+            query=row[3],
+            error=row[4],
+            created_at=row[5],
+            updated_at=row[6]
+        )
+
+    def wait(self, job_id:str, timeout:float)->QueryJob:
+        """
+        Wait until the job has finished or the timeout has passed, and return its state.
+
+        ### Parameters
+        1. job_id : ``str``
+            - Id returned by ``submit``
+        2. timeout : ``float``
+            - Maximum number of seconds to wait
+
+        ### Raises
+        ``KeyError`` if the job is unknown or has expired.
+
+        ### Returns
+        A ``QueryJob`` object
+        """
+        deadline = time.monotonic() + timeout
+
+        # The condition lock is re-entrant, holding it between reads means no state change is missed
+        with self._condition:
+            job = self.get(job_id)
+            while not job.is_finished():
+                remaining_time = deadline - time.monotonic()
+                if remaining_time <= 0:
+                    break
+                self._condition.wait(remaining_time)
+                job = self.get(job_id)
+
+        return job
+
+    def shutdown(self)->None:
+        self._executor.shutdown(wait=False,cancel_futures=True)
+        self._connection.close()
@@ -0,0 +1,193 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Sequence
+import bisect
+import threading
+import time
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+TOKEN_BUCKETS = (16, 64, 256, 1024, 2048, 4096, 8192, 16384, 32768)
+COUNT_BUCKETS = (0, 1, 2, 3, 4, 6, 8, 12, 16, 32)
+
+def _format_labels(label_names:Sequence[str], label_values:Sequence[str], extra_label:str | None = None)->str:
+    pairs = [f'{name}="{_escape_label_value(value)}"' for name, value in zip(label_names,label_values)]
+    if extra_label is not None:
+        pairs.append(extra_label)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape_label_value(value:str)->str:
+    return value.replace("\\","\\\\").replace("\n","\\n").replace('"','\\"')
+
+def _format_value(value:float)->str:
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class Histogram:
+    """
+    Prometheus histogram, one series per combination of label values.
+    """
+    def __init__(self, name:str, documentation:str, label_names:Sequence[str] = (), buckets:Sequence[float] = DURATION_BUCKETS) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # Per series: count of observations in each bucket (not cumulative) plus the overflow bucket, sum, count
+        self._series : dict[tuple[str,...],tuple[list[int],list[float]]] = {}
+
+    def observe(self, value:float, **labels:str)->None:
+        label_values = tuple(str(labels[name]) for name in self.label_names)
+        bucket_index = bisect.bisect_left(self.buckets,value)
+
+        with self._lock:
+            bucket_counts, totals = self._series.setdefault(label_values,([0] * (len(self.buckets) + 1),[0.0, 0]))
+            bucket_counts[bucket_index] += 1
+            totals[0] += value
+            totals[1] += 1
+
+    def render(self)->list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+
+        with self._lock:
+            for label_values, (bucket_counts, totals) in sorted(self._series.items()):
+                cumulative_count = 0
+                for upper_bound, bucket_count in zip([*self.buckets, float("inf")],bucket_counts):
+                    cumulative_count += bucket_count
+                    bound = "+Inf" if upper_bound == float("inf") else _format_value(upper_bound)
+                    bucket_labels = _format_labels(self.label_names,label_values,f'le="{bound}"')
+                    lines.append(f"{self.name}_bucket{bucket_labels} {cumulative_count}")
+                lines.append(f"{self.name}_sum{_format_labels(self.label_names,label_values)} {_format_value(totals[0])}")
+                lines.append(f"{self.name}_count{_format_labels(self.label_names,label_values)} {totals[1]}")
+
+        return lines
+
+class Counter:
+    """
+    Prometheus counter, one series per combination of label values.
+    """
+    def __init__(self, name:str, documentation:str, label_names:Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._series : dict[tuple[str,...],float] = {}
+
+    def inc(self, amount:float = 1, **labels:str)->None:
+        label_values = tuple(str(labels[name]) for name in self.label_names)
+        with self._lock:
+            self._series[label_values] = self._series.get(label_values,0) + amount
+
+    def render(self)->list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in sorted(self._series.items()):
+                lines.append(f"{self.name}{_format_labels(self.label_names,label_values)} {_format_value(value)}")
+        return lines
+
+class MetricsRegistry:
+    """
+    Metrics of the process, rendered in the Prometheus text format.
+    """
+    def __init__(self) -> None:
+        self._metrics : list[Histogram | Counter] = []
+
+    def register(self, metric:Histogram | Counter)->Histogram | Counter:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self)->str:
+        return "\n".join(line for metric in self._metrics for line in metric.render()) + "\n"
+
+REGISTRY = MetricsRegistry()
+
+REQUEST_DURATION = REGISTRY.register(Histogram(
+    "coe_http_request_duration_seconds",
+    "Time until the response headers were sent, by route, method and status.",
+    label_names=("route", "method", "status")
+))
+STAGE_DURATION = REGISTRY.register(Histogram(
+    "coe_stage_duration_seconds",
+    "Time spent per stage: llm, tool, schema, sql, mirror and excel.",
+    label_names=("stage",)
+))
+LLM_CALL_DURATION = REGISTRY.register(Histogram(
+    "coe_llm_call_duration_seconds",
+    "Latency of a single chat model call."
+))
+LLM_CALL_TOKENS = REGISTRY.register(Histogram(
+    "coe_llm_call_tokens",
+    "Tokens of a single chat model call, by kind (input or output).",
+    label_names=("kind",),
+    buckets=TOKEN_BUCKETS
+))
+LLM_TOKENS = REGISTRY.register(Counter(
+    "coe_llm_tokens_total",
+    "Tokens used by the chat model, by kind (input or output).",
+    label_names=("kind",)
+))
+AGENT_TOOL_CALLS = REGISTRY.register(Histogram(
+    "coe_agent_tool_calls",
+    "Tool calls made by the agent per generated query.",
+    buckets=COUNT_BUCKETS
+))
+
+class RequestTiming:
+    """
+    Time spent per stage while serving one request, sent back in the ``Server-Timing`` header.
+    """
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._stage_seconds : dict[str,float] = {}
+
+    def add(self, stage:str, seconds:float)->None:
+        with self._lock:
+            self._stage_seconds[stage] = self._stage_seconds.get(stage,0) + seconds
+
+    def server_timing_header(self, total_seconds:float)->str:
+        with self._lock:
+            entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in self._stage_seconds.items()]
+        entries.append(f"total;dur={total_seconds * 1000:.1f}")
+        return ", ".join(entries)
+
+_current_request_timing : ContextVar[RequestTiming | None] = ContextVar("current_request_timing",default=None)
+
+@contextmanager
+def request_timing()->Iterator[RequestTiming]:
+    """
+    Collect the stages recorded within the ``with`` block, including threads the context is copied to
+    (FastAPI runs sync routes and streamed responses in a thread pool with a copy of the context).
+    """
+    timing = RequestTiming()
+    context_token = _current_request_timing.set(timing)
+    try:
+        yield timing
+    finally:
+        _current_request_timing.reset(context_token)
+
+def record_stage(stage:str, seconds:float)->None:
+    """
+    Record the duration of a stage in the histogram and in the timing of the current request, if any.
+
+    ### Parameters
+    1. stage : ``str``
+        - Name of the stage
+    2. seconds : ``float``
+        - Duration of the stage
+
+    ### Returns
+    ``None``
+    """
+    STAGE_DURATION.observe(seconds,stage=stage)
+    timing = _current_request_timing.get()
+    if timing is not None:
+        timing.add(stage,seconds)
+
+@contextmanager
+def timed_stage(stage:str)->Iterator[None]:
+    """
+    Record the duration of the ``with`` block as a stage, see ``record_stage``.
+    """
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage,time.perf_counter() - start_time)
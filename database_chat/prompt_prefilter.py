@@ -0,0 +1,98 @@
+import re
+from .schema_descriptor import TABLE_DESCRIPTIONS
+from .query_templates import QueryTemplateEngine, normalize_text, contains_phrase
+
+# Words that describe what the database measures, in addition to the table and column names
+MEASURE_WORDS = {
+    "volume", "volumes", "count", "counts", "counted", "total", "totals", "traffic", "busy", "busiest", "peak",
+    "vehicles", "vehicle", "cars", "trucks", "cyclists", "bikes", "pedestrians", "turning", "turns", "approach",
+    "intersection", "intersections", "hourly", "hour", "hours", "interval", "miovision", "tmc",
+    "site", "sites", "survey", "surveys", "surveyed", "data", "collect", "collected", "location", "locations",
+}
+
+# Words of requests the database can never answer, a prompt is only rejected locally if it has one of them
+OFF_TOPIC_WORDS = {
+    "poem", "poems", "joke", "jokes", "story", "stories", "song", "songs", "lyrics", "essay", "recipe", "recipes",
+    "weather", "forecast", "movie", "movies", "capital", "translate", "hello", "hi", "hey", "thanks",
+}
+
+# Generic parts of location names that say nothing about a particular study
+LOCATION_STOPWORDS = {"and", "ave", "avenue", "st", "street", "rd", "road", "dr", "drive", "blvd", "way", "the", "at", "of", "nw", "sw", "ne", "se"}
+
+class PromptPrefilter:
+    """
+    Local scorer for prompt validation. Prompts fully understood by a query template are accepted,
+    clearly off-topic prompts without any database term are rejected, and everything else is left to the LLM.
+    """
+    def __init__(self, template_engine:QueryTemplateEngine, schema_words:set[str], location_words:set[str], study_names:list[str]) -> None:
+        self._template_engine = template_engine
+        self._domain_words = MEASURE_WORDS | schema_words
+        self._location_words = location_words
+        self._study_names = [normalize_text(study_name) for study_name in study_names]
+
+    @classmethod
+    def from_template_engine(cls, template_engine:QueryTemplateEngine, locations:list[str], study_names:list[str])->"PromptPrefilter":
+        """
+        Build the prefilter from the template engine vocabulary and the schema descriptor values.
+
+        ### Parameters
+        1. template_engine : ``QueryTemplateEngine``
+            - Engine whose slot extractor recognizes studies, directions and vehicle classes
+        2. locations : ``list[str]``
+            - Study locations
+        3. study_names : ``list[str]``
+            - Study names
+
+        ### Returns
+        A ``PromptPrefilter`` object
+        """
+        schema_words = set()
+        for table_name, columns in TABLE_DESCRIPTIONS.items():
+            schema_words.update(table_name.split("_"))
+            for column_name in columns:
+                schema_words.update(column_name.split("_"))
+        # Key and type words appear in every kind of question
+        schema_words -= {"id", "type", "name", "types"}
+
+        location_words = set()
+        for location in locations:
+            location_words.update(
+                word for word in normalize_text(location).split(" ")
+                if len(word) > 2 and word not in LOCATION_STOPWORDS and not word.isdigit()
+            )
+
+        return cls(template_engine,schema_words,location_words,study_names)
+
+    def decide(self, prompt:str)->bool | None:
+        """
+        Decide whether the prompt can be answered from the database without asking the LLM.
+
+        ### Parameters
+        1. prompt : ``str``
+            - Prompt to be validated
+
+        ### Returns
+        ``True | False`` when the decision is confident, ``None`` when the LLM should decide.
+        """
+        # Only a template that consumed every word of the prompt is trusted to understand it
+        template_match = self._template_engine.match(prompt)
+        if template_match is not None and not template_match.slots.unconsumed_words:
+            return True
+
+        text = normalize_text(prompt)
+        slots = self._template_engine.extractor.extract(prompt)
+        words = set(text.split(" "))
+
+        names_study = (bool(slots.study_ids) or bool(slots.locations)
+                       or any(contains_phrase(text,study_name) for study_name in self._study_names))
+        names_measure = slots.asks_for_volume or bool(words & self._domain_words)
+        names_vocabulary = bool(slots.directions) or bool(slots.vehicles) or bool(slots.movements) or bool(slots.groupings)
+
+        # Numbers may be study ids or dates the extractor did not recognize
+        has_database_terms = (names_study or names_measure or names_vocabulary
+                              or bool(words & self._location_words) or re.search(r"\d", text) is not None)
+        # Missing database terms alone are not enough, questions may use words the vocabulary lacks
+        if not has_database_terms and words & OFF_TOPIC_WORDS:
+            return False
+
+        return None
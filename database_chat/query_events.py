@@ -0,0 +1,15 @@
+from dataclasses import dataclass
+
+@dataclass
+class QueryEvent:
+    """
+    Event produced while a query is generated.
+
+    - ``token``: text streamed by the LLM
+    - ``tool_call``: tool requested by the agent, ``content`` holds its JSON arguments
+    - ``tool_result``: output of a tool, truncated
+    - ``query``: the final query, always the last event
+    """
+    event_type : str
+    content : str
+    name : str | None = None
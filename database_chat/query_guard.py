@@ -0,0 +1,116 @@
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+from psycopg2 import sql
+from psycopg2.extensions import connection, cursor
+from .query_preview import paginate_query, strip_query_terminator
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+class QueryRejectedError(Exception):
+    """
+    Raised when the plan estimate of a query exceeds the configured limits.
+    """
+
+@dataclass
+class PlanEstimate:
+    """
+    Planner estimate for the statement that was executed.
+    """
+    total_cost : float
+    estimated_rows : int
+    row_limit_applied : int | None
+
+@dataclass
+class QueryResult:
+    dataframe : "pd.DataFrame"
+    plan_estimate : PlanEstimate | None
+
+@dataclass
+class QueryGuardConfiguration:
+    max_total_cost : float
+    max_estimated_rows : int
+    statement_timeout_ms : int
+    auto_limit : bool
+
+class QueryGuard:
+    """
+    Checks LLM generated queries against the planner's estimate before they are executed and restricts
+    the transaction they run in.
+    """
+    def __init__(self, configuration:QueryGuardConfiguration) -> None:
+        self._configuration = configuration
+
+    def configure_transaction(self, db_connection:connection, db_cursor:cursor)->None:
+        """
+        Make the connection read-only and apply the statement timeout to the current transaction.
+        Must be called before anything else is executed on the connection.
+
+        ### Parameters
+        1. db_connection : ``connection``
+            - Connection the query will be executed on
+        2. db_cursor : ``cursor``
+            - Cursor of the connection
+
+        ### Returns
+        ``None``
+        """
+        db_connection.set_session(readonly=True)
+        db_cursor.execute(
+            sql.SQL("SET LOCAL statement_timeout = {timeout}").format(
+                timeout=sql.Literal(int(self._configuration.statement_timeout_ms))
+            )
+        )
+
+    def _explain(self, db_cursor:cursor, query:sql.Composable)->tuple[float,int]:
+        # A plain cursor is used since the caller's cursor may return rows as dictionaries
+        with db_cursor.connection.cursor() as explain_cursor:
+            explain_cursor.execute(sql.SQL("EXPLAIN (FORMAT JSON) {query}").format(query=query))
+            plan = explain_cursor.fetchone()[0][0]["Plan"]
+        return float(plan["Total Cost"]), int(plan["Plan Rows"])
+
+    def prepare_query(self, db_cursor:cursor, query:str)->tuple[sql.Composable,PlanEstimate]:
+        """
+        Estimate the cost of the query and return the statement that should be executed in its place.
+        If auto limiting is enabled, queries over the row or cost limit are wrapped in a ``LIMIT`` and
+        checked again.
+
+        ### Parameters
+        1. db_cursor : ``cursor``
+            - Cursor used to run ``EXPLAIN``
+        2. query : ``str``
+            - Query to be checked
+
+        ### Raises
+        ``QueryRejectedError`` if the (limited) query is still over the configured limits.
+
+        ### Returns
+        A ``tuple`` of the statement to execute and its ``PlanEstimate``.
+        """
+        statement : sql.Composable = sql.SQL(strip_query_terminator(query))
+        total_cost, estimated_rows = self._explain(db_cursor,statement)
+        row_limit_applied : int | None = None
+
+        is_over_limit = (total_cost > self._configuration.max_total_cost
+                         or estimated_rows > self._configuration.max_estimated_rows)
+
+        if is_over_limit and self._configuration.auto_limit:
+            row_limit_applied = self._configuration.max_estimated_rows
+            statement = paginate_query(query,row_limit_applied,0)
+            total_cost, estimated_rows = self._explain(db_cursor,statement)
+
+        if total_cost > self._configuration.max_total_cost:
+            raise QueryRejectedError(
+                f'Estimated query cost {total_cost:.0f} exceeds the limit of {self._configuration.max_total_cost:.0f}.'
+            )
+
+        if estimated_rows > self._configuration.max_estimated_rows:
+            raise QueryRejectedError(
+                f'Estimated row count {estimated_rows} exceeds the limit of {self._configuration.max_estimated_rows}.'
+            )
+
+        return statement, PlanEstimate(
+            total_cost=total_cost,
+            estimated_rows=estimated_rows,
+            row_limit_applied=row_limit_applied
+        )
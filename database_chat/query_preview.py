@@ -0,0 +1,112 @@
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+from psycopg2 import sql
+import re
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+@dataclass
+class QueryPreview:
+    """
+    First page of a query's result set along with the planner's row estimate.
+    """
+    dataframe : "pd.DataFrame"
+    estimated_row_count : int
+    page_size : int
+    offset : int
+
+def strip_query_terminator(query:str)->str:
+    """
+    Remove surrounding whitespace and any trailing semicolons so the query can be embedded in another statement.
+
+    ### Parameters
+    1. query : ``str``
+        - Query to be cleaned
+
+    ### Returns
+    The query as a ``str`` without the trailing terminator.
+    """
+    return query.strip().rstrip(';').strip()
+
+def has_top_level_order_by(query:str)->bool:
+    """
+    Check whether the query orders its own result, ignoring ``ORDER BY`` clauses within parentheses
+    (subqueries, window definitions, aggregates), string literals, quoted identifiers and comments.
+
+    ### Parameters
+    1. query : ``str``
+        - Query to be checked
+
+    ### Returns
+    ``True`` if the query ends with an ``ORDER BY`` clause.
+    """
+    depth = 0
+    top_level_text = []
+    for token in re.finditer(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|--[^\n]*|/\*.*?\*/|[()]|[^'\"()/-]+|.",query,re.DOTALL):
+        text = token.group()
+        if text == '(':
+            depth += 1
+        elif text == ')':
+            depth -= 1
+        elif depth == 0 and not text.startswith(("'",'"','--','/*')):
+            top_level_text.append(text)
+    return re.search(r"\border\s+by\b"," ".join(top_level_text),re.IGNORECASE) is not None
+
+def paginate_query(query:str,page_size:int,offset:int,stable_order:bool=False)->sql.Composed:
+    """
+    Wrap the query as a subquery and restrict it to a single page with ``LIMIT``/``OFFSET``.
+
+    ### Parameters
+    1. query : ``str``
+        - Query to be paginated
+    2. page_size : ``int``
+        - Maximum number of rows in the page
+    3. offset : ``int``
+        - Number of rows to skip before the page starts
+    4. stable_order : ``bool``
+        - Whether consecutive pages must neither overlap nor skip rows. Queries without their own
+        ``ORDER BY`` are then ordered by the text of each row, which works for columns of any type.
+
+    ### Returns
+    A ``sql.Composed`` object that can be executed without parameters.
+    """
+    # Without an ORDER BY, Postgres may return rows in a different order on every execution
+    order_by = sql.SQL("ORDER BY preview_page::text ") if stable_order and not has_top_level_order_by(query) else sql.SQL("")
+    return sql.SQL("SELECT * FROM (\n{query}\n) AS preview_page {order_by}LIMIT {page_size} OFFSET {offset}").format(
+        query=sql.SQL(strip_query_terminator(query)),
+        order_by=order_by,
+        page_size=sql.Literal(int(page_size)),
+        offset=sql.Literal(int(offset))
+    )
+
+def explain_query(query:str)->sql.Composed:
+    """
+    Wrap the query in an ``EXPLAIN (FORMAT JSON)`` statement. The query is planned but never executed.
+
+    ### Parameters
+    1. query : ``str``
+        - Query to be explained
+
+    ### Returns
+    A ``sql.Composed`` object that can be executed without parameters.
+    """
+    return sql.SQL("EXPLAIN (FORMAT JSON) {query}").format(
+        query=sql.SQL(strip_query_terminator(query))
+    )
+
+def parse_estimated_rows(explain_output:list)->int:
+    """
+    Extract the planner's estimated row count from the output of ``EXPLAIN (FORMAT JSON)``.
+
+    ### Parameters
+    1. explain_output : ``list``
+        - The JSON document returned by Postgres
+
+    ### Returns
+    The estimated number of rows as an ``int``.
+    """
+    try:
+        return int(explain_output[0]["Plan"]["Plan Rows"])
+    except (IndexError, KeyError, TypeError) as e:
+        raise Exception(f'Unexpected EXPLAIN output, could not estimate row count: {e}')
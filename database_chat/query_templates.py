@@ -0,0 +1,349 @@
+from dataclasses import dataclass, field
+from datetime import date, datetime
+import re
+from .schema_descriptor import SchemaDescriptor
+
+# Words that ask for something the templates can not express, such prompts are left to the agent
+UNSUPPORTED_PATTERN = re.compile(
+    r"\b(average|avg|mean|median|compare|comparison|percent|percentage|ratio|share|difference|trend|"
+    r"highest|lowest|most|least|top|rank|maximum|minimum|max|min|why|not|except|excluding|without|"
+    r"morning|afternoon|evening|night|am|pm|weekday|weekdays|weekend|between|before|after|during|since|until|"
+    r"pedestrians?|latitude|longitude|project)\b|\d{1,2}:\d{2}"
+)
+VOLUME_PATTERN = re.compile(r"\b(volumes?|counts?|totals?|traffic|how many)\b")
+# Questions counting studies, locations or other rows rather than traffic, e.g. "how many studies ..."
+ENTITY_COUNT_PATTERN = re.compile(
+    r"\b(how many|number of|count of|count the)( (different|distinct|unique|separate))? "
+    r"(studies|study|locations?|intersections?|sites?|directions?|approach(es)?|movements?|class(es)?|types?|categories|"
+    r"records?|rows?|entries|days?|dates?|hours?|projects?|times)\b"
+)
+STUDY_ID_PATTERN = re.compile(r"\b\d{6,8}\b")
+ISO_DATE_PATTERN = re.compile(r"\b\d{4}-\d{2}-\d{2}\b")
+WRITTEN_DATE_PATTERN = re.compile(r"\b([a-z]+ \d{1,2},? \d{4}|\d{1,2} [a-z]+,? \d{4})\b")
+WRITTEN_DATE_FORMATS = ["%B %d %Y", "%b %d %Y", "%d %B %Y", "%d %b %Y"]
+PEAK_HOUR_PATTERN = re.compile(r"\b(peak|busiest) hour\b")
+# Date qualifiers left after the recognized dates are removed, the query would silently ignore them
+UNPARSED_DATE_PATTERN = re.compile(
+    r"\b(january|february|march|april|june|july|august|september|october|november|december|"
+    r"jan|feb|mar|apr|jun|jul|aug|sep|sept|oct|nov|dec)\b|\b(in|of|during) may\b|\bmay \d"
+    r"|\b(19|20)\d{2}\b|\b\d{1,4}[/.-]\d{1,2}([/.-]\d{1,4})?\b"
+    r"|\b(yesterday|today|tomorrow|days?|weeks?|months?|years?|quarter|season|spring|summer|fall|autumn|winter|"
+    r"mondays?|tuesdays?|wednesdays?|thursdays?|fridays?|saturdays?|sundays?|dates?|recent|recently|latest|last|past|ago)\b"
+)
+# Movements known before the type tables are read, in case the descriptor holds no movement values
+DEFAULT_MOVEMENT_NAMES = ["Thru", "Left", "Right", "U-Turn", "Hard Left", "Hard Right", "Bear Left", "Bear Right"]
+MOVEMENT_SYNONYMS = {"through": "Thru", "straight": "Thru", "u turn": "U-Turn", "uturn": "U-Turn"}
+# Words that carry no slot of their own, every other word of a prompt has to be consumed by a slot
+FILLER_WORDS = {
+    "what", "whats", "was", "were", "is", "are", "the", "a", "an", "of", "for", "at", "on", "in", "to", "from", "and",
+    "with", "by", "per", "each", "every", "all", "show", "me", "give", "get", "find", "list", "tell", "please", "can",
+    "could", "you", "i", "want", "need", "see", "did", "do", "does", "there", "how", "many", "much", "study", "studies",
+    "id", "vehicle", "vehicles", "total", "overall", "which", "that", "its", "their", "recorded", "counted",
+    "intersection", "location", "site",
+}
+
+# Grouping dimensions, in the order their columns appear in the output
+GROUPING_PATTERNS : dict[str,re.Pattern] = {
+    "direction": re.compile(r"\b(by|per|each|every) (approach |travel )?(direction|approach|bound)s?\b"),
+    "movement": re.compile(r"\b(by|per|each|every) (turning )?(movement|turn)s?\b"),
+    "vehicle": re.compile(r"\b(by|per|each|every) (vehicle|class|mode)( type| class)?(es|s)?\b"),
+    "hour": re.compile(r"\b(hourly|by hour|per hour|each hour|every hour|hour by hour)\b"),
+}
+
+GROUPING_COLUMNS = {
+    "direction": ("direction_types.direction_type_name", "direction"),
+    "movement": ("movement_types.movement_type_name", "movement"),
+    "vehicle": ("vehicles_types.vehicle_type_name", "vehicle_type"),
+    "hour": ("EXTRACT(HOUR FROM granular_count.time_stamp)::INTEGER", "hour"),
+}
+
+@dataclass
+class PromptSlots:
+    """
+    Values recognized in a prompt by ``SlotExtractor``.
+    """
+    study_ids : list[int] = field(default_factory=list)
+    locations : list[str] = field(default_factory=list)
+    dates : list[date] = field(default_factory=list)
+    directions : list[str] = field(default_factory=list)
+    vehicles : list[str] = field(default_factory=list)
+    movements : list[str] = field(default_factory=list)
+    groupings : list[str] = field(default_factory=list)
+    peak_hour : bool = False
+    asks_for_volume : bool = False
+    asks_for_entity_count : bool = False
+    has_unsupported_terms : bool = False
+    has_unparsed_dates : bool = False
+    # Words of the prompt not consumed by any slot or filler word
+    unconsumed_words : list[str] = field(default_factory=list)
+
+@dataclass
+class TemplateMatch:
+    template_name : str
+    query : str
+    slots : PromptSlots
+
+def normalize_text(text:str)->str:
+    text = text.lower().replace("&", " and ")
+    text = re.sub(r"[^\w\s:-]", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+def _phrase_pattern(phrase:str)->str:
+    return rf"(?<![\w-]){re.escape(phrase)}(?![\w-])"
+
+def contains_phrase(text:str, phrase:str)->bool:
+    return re.search(_phrase_pattern(phrase), text) is not None
+
+def remove_phrase(text:str, phrase:str)->str:
+    return re.sub(_phrase_pattern(phrase), " ", text)
+
+def _singular(word:str)->str:
+    if word.endswith("es") and word[:-2].endswith(("s","x","ch","sh")):
+        return word[:-2]
+    if word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+def quote_literal(value:str | int | date)->str:
+    """
+    Render a value as a SQL literal. Strings are quoted with embedded quotes doubled.
+
+    ### Parameters
+    1. value : ``str | int | date``
+        - Value to render
+
+    ### Returns
+    A ``str`` object containing the literal.
+    """
+    if isinstance(value, bool):
+        raise TypeError("Boolean values are not supported")
+    if isinstance(value, int):
+        return str(int(value))
+    if isinstance(value, date):
+        return f"DATE '{value.isoformat()}'"
+    return "'" + str(value).replace("'", "''") + "'"
+
+class SlotExtractor:
+    """
+    Rule based extractor for study ids, locations, dates, directions, vehicle classes and groupings, using
+    the values of the type tables and the study locations from the schema descriptor as vocabulary.
+    """
+    def __init__(self, descriptor:SchemaDescriptor) -> None:
+        self._direction_aliases = self._build_aliases(descriptor.domains.get("direction_types.direction_type_name",[]))
+        self._vehicle_aliases = self._build_aliases(descriptor.domains.get("vehicles_types.vehicle_type_name",[]))
+        self._movement_aliases = self._build_movement_aliases(
+            descriptor.domains.get("movement_types.movement_type_name") or DEFAULT_MOVEMENT_NAMES
+        )
+        self._locations = sorted(
+            ((normalize_text(location), location) for location in descriptor.locations),
+            key=lambda item: len(item[0]),
+            reverse=True
+        )
+
+    def _build_aliases(self, values:list[str])->dict[str,list[str]]:
+        aliases : dict[str,list[str]] = {}
+        for value in values:
+            normalized_value = normalize_text(value)
+            words = normalized_value.split(" ")
+            # The first word and plural nouns identify a class, e.g. trucks for Articulated Trucks
+            alias_words = {words[0]} | {word for word in words if word.endswith("s")}
+            value_aliases = {normalized_value} | alias_words | {_singular(word) for word in alias_words}
+            if normalized_value.endswith("bound") and len(normalized_value) > len("bound"):
+                # Northbound is also written as north or nb
+                value_aliases.update({normalized_value[:-len("bound")], f"{normalized_value[0]}b"})
+            for alias in value_aliases:
+                if alias:
+                    aliases.setdefault(alias,[]).append(value)
+        return aliases
+
+    def _build_movement_aliases(self, values:list[str])->dict[str,list[str]]:
+        # Every word of a movement counts, "left" is a mention of Left, Hard Left and Bear Left
+        aliases : dict[str,list[str]] = {}
+        for value in values:
+            normalized_value = normalize_text(value)
+            for alias in {normalized_value} | set(normalized_value.split(" ")):
+                if alias:
+                    aliases.setdefault(alias,[]).append(value)
+        for synonym, value in MOVEMENT_SYNONYMS.items():
+            aliases.setdefault(synonym,[]).append(value)
+        return aliases
+
+    def _match_aliases(self, text:str, aliases:dict[str,list[str]])->tuple[list[str],list[str]]:
+        matched_values = []
+        matched_aliases = []
+        for alias, values in aliases.items():
+            if contains_phrase(text,alias):
+                matched_aliases.append(alias)
+                matched_values.extend(value for value in values if value not in matched_values)
+        return matched_values, matched_aliases
+
+    def _extract_dates(self, text:str)->tuple[list[date],list[str]]:
+        dates = []
+        parsed_phrases = []
+        for match in ISO_DATE_PATTERN.findall(text):
+            try:
+                dates.append(date.fromisoformat(match))
+                parsed_phrases.append(match)
+            except ValueError:
+                pass
+
+        for match in WRITTEN_DATE_PATTERN.findall(text):
+            candidate = match.replace(",", "")
+            for date_format in WRITTEN_DATE_FORMATS:
+                try:
+                    dates.append(datetime.strptime(candidate,date_format).date())
+                    parsed_phrases.append(match)
+                    break
+                except ValueError:
+                    continue
+
+        return list(dict.fromkeys(dates)), parsed_phrases
+
+    def extract(self, prompt:str)->PromptSlots:
+        """
+        Extract the slots from the prompt.
+
+        ### Parameters
+        1. prompt : ``str``
+            - Prompt written by the user
+
+        ### Returns
+        A ``PromptSlots`` object
+        """
+        text = normalize_text(prompt)
+        slots = PromptSlots()
+
+        slots.dates, date_phrases = self._extract_dates(text)
+        text_without_dates = ISO_DATE_PATTERN.sub(" ", text)
+        slots.study_ids = list(dict.fromkeys(int(study_id) for study_id in STUDY_ID_PATTERN.findall(text_without_dates)))
+
+        remaining_text = text_without_dates
+        for normalized_location, location in self._locations:
+            if contains_phrase(remaining_text,normalized_location):
+                slots.locations.append(location)
+                # Street names inside a location should not be read as directions or vehicles
+                remaining_text = remaining_text.replace(normalized_location, " ")
+
+        slots.directions, direction_aliases = self._match_aliases(remaining_text,self._direction_aliases)
+        slots.vehicles, vehicle_aliases = self._match_aliases(remaining_text,self._vehicle_aliases)
+        slots.movements, movement_aliases = self._match_aliases(remaining_text,self._movement_aliases)
+        slots.groupings = [grouping for grouping, pattern in GROUPING_PATTERNS.items() if pattern.search(text)]
+        slots.peak_hour = PEAK_HOUR_PATTERN.search(text) is not None
+        slots.asks_for_volume = VOLUME_PATTERN.search(text) is not None or slots.peak_hour
+        slots.asks_for_entity_count = ENTITY_COUNT_PATTERN.search(text) is not None
+        slots.has_unsupported_terms = UNSUPPORTED_PATTERN.search(remaining_text) is not None
+
+        text_without_parsed_dates = text
+        for date_phrase in date_phrases:
+            text_without_parsed_dates = text_without_parsed_dates.replace(date_phrase, " ")
+        for normalized_location, _ in self._locations:
+            text_without_parsed_dates = text_without_parsed_dates.replace(normalized_location, " ")
+        slots.has_unparsed_dates = UNPARSED_DATE_PATTERN.search(text_without_parsed_dates) is not None
+
+        # What is left once every slot is removed, templates only answer prompts that leave nothing behind
+        unconsumed_text = STUDY_ID_PATTERN.sub(" ", text_without_parsed_dates)
+        for pattern in [*GROUPING_PATTERNS.values(), PEAK_HOUR_PATTERN, VOLUME_PATTERN]:
+            unconsumed_text = pattern.sub(" ", unconsumed_text)
+        for alias in sorted([*direction_aliases, *vehicle_aliases, *movement_aliases], key=len, reverse=True):
+            unconsumed_text = remove_phrase(unconsumed_text, alias)
+        slots.unconsumed_words = [word for word in unconsumed_text.split() if word not in FILLER_WORDS]
+
+        return slots
+
+class QueryTemplateEngine:
+    """
+    Builds hand written volume queries for prompts whose intent and slots are fully recognized, so they do
+    not need an LLM. ``match`` returns ``None`` for every other prompt.
+    """
+    def __init__(self, descriptor:SchemaDescriptor) -> None:
+        self.extractor = SlotExtractor(descriptor)
+
+    def match(self, prompt:str)->TemplateMatch | None:
+        """
+        Return the templated query for the prompt, if one applies.
+
+        ### Parameters
+        1. prompt : ``str``
+            - Prompt written by the user
+
+        ### Returns
+        A ``TemplateMatch`` object, or ``None`` if the prompt should be handled by the agent.
+        """
+        slots = self.extractor.extract(prompt)
+
+        if not slots.asks_for_volume or slots.has_unsupported_terms:
+            return None
+        # Movements are only grouped on, a mentioned movement would not filter the query
+        if slots.movements or slots.has_unparsed_dates or slots.asks_for_entity_count:
+            return None
+        if not slots.study_ids and not slots.locations:
+            return None
+
+        groupings = list(slots.groupings)
+        if slots.peak_hour and "hour" not in groupings:
+            groupings.append("hour")
+
+        template_name = "volume" + "".join(f"_by_{grouping}" for grouping in groupings) + ("_peak_hour" if slots.peak_hour else "")
+
+        return TemplateMatch(
+            template_name=template_name,
+            query=self._build_query(slots,groupings),
+            slots=slots
+        )
+
+    def _build_query(self, slots:PromptSlots, groupings:list[str])->str:
+        study_columns = ["studies.miovision_id", "studies.location_name", "studies.study_date"]
+        grouping_columns = [GROUPING_COLUMNS[grouping] for grouping in groupings]
+
+        select_columns = study_columns + [f"{expression} AS {alias}" for expression, alias in grouping_columns]
+        group_columns = study_columns + [expression for expression, _ in grouping_columns]
+
+        # Only the type tables that are grouped or filtered on are joined
+        joins = [
+            "JOIN studies_directions ON studies_directions.miovision_id = studies.miovision_id",
+            "JOIN directions_movements ON directions_movements.study_direction_id = studies_directions.id",
+            "JOIN movements_vehicles ON movements_vehicles.direction_movement_id = directions_movements.id",
+            "JOIN granular_count ON granular_count.movement_vehicle_id = movements_vehicles.id",
+        ]
+        if "direction" in groupings or slots.directions:
+            joins.append("JOIN direction_types ON direction_types.id = studies_directions.direction_type_id")
+        if "movement" in groupings:
+            joins.append("JOIN movement_types ON movement_types.id = directions_movements.movement_type_id")
+        if "vehicle" in groupings or slots.vehicles:
+            joins.append("JOIN vehicles_types ON vehicles_types.id = movements_vehicles.vehicle_type_id")
+
+        conditions = []
+        study_conditions = []
+        if slots.study_ids:
+            study_conditions.append(f"studies.miovision_id IN ({', '.join(quote_literal(study_id) for study_id in slots.study_ids)})")
+        if slots.locations:
+            study_conditions.append(f"studies.location_name IN ({', '.join(quote_literal(location) for location in slots.locations)})")
+        conditions.append("(" + " OR ".join(study_conditions) + ")")
+
+        if slots.dates:
+            conditions.append(f"studies.study_date IN ({', '.join(quote_literal(study_date) for study_date in slots.dates)})")
+        if slots.directions:
+            conditions.append(f"direction_types.direction_type_name IN ({', '.join(quote_literal(direction) for direction in slots.directions)})")
+        if slots.vehicles:
+            conditions.append(f"vehicles_types.vehicle_type_name IN ({', '.join(quote_literal(vehicle) for vehicle in slots.vehicles)})")
+
+        select_clause = "SELECT "
+        order_columns = list(range(1, len(group_columns) + 1))
+        order_clause = ", ".join(str(position) for position in order_columns)
+
+        if slots.peak_hour:
+            # One row per study and remaining grouping, holding the hour with the highest volume
+            hour_position = len(study_columns) + groupings.index("hour") + 1
+            distinct_positions = [position for position in order_columns if position != hour_position]
+            distinct_expressions = [group_columns[position - 1] for position in distinct_positions]
+            select_clause = f"SELECT DISTINCT ON ({', '.join(distinct_expressions)}) "
+            order_clause = ", ".join(str(position) for position in distinct_positions) + ", total_volume DESC"
+
+        return "\n".join([
+            select_clause + ", ".join(select_columns) + ", SUM(granular_count.traffic_count) AS total_volume",
+            "FROM studies",
+            *joins,
+            "WHERE " + "\nAND ".join(conditions),
+            "GROUP BY " + ", ".join(group_columns),
+            f"ORDER BY {order_clause};",
+        ])
@@ -0,0 +1,131 @@
+from pathlib import Path
+from typing import TYPE_CHECKING
+import hashlib
+import os
+import re
+import threading
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Quoted literals/identifiers are matched first so whitespace inside them is left untouched
+_QUERY_TOKEN_PATTERN = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|\s+")
+
+def normalize_query(query:str)->str:
+    """
+    Normalize the query text so that formatting differences map onto the same cache entry.
+
+    ### Parameters
+    1. query : ``str``
+        - Query to be normalized
+
+    ### Returns
+    The query as a ``str`` with whitespace collapsed outside of quotes and the trailing terminator removed.
+    """
+    def collapse(match:re.Match)->str:
+        token = match.group(0)
+        return token if token[0] in ("'",'"') else " "
+
+    return _QUERY_TOKEN_PATTERN.sub(collapse,query).strip().rstrip(';').strip()
+
+class ResultSetCache:
+    """
+    Size-bounded on-disk cache of query results stored as Parquet files.
+
+    Entries are keyed by the normalized query text and the data generation, so a new ingestion
+    makes every older entry unreachable. Least recently used files are evicted first.
+    """
+    def __init__(self, cache_directory:Path, max_bytes:int) -> None:
+        self._cache_directory = cache_directory
+        self._max_bytes = max_bytes
+        self._file_suffix = '.parquet'
+
+        if self.is_enabled():
+            self._cache_directory.mkdir(parents=True,exist_ok=True)
+
+    def is_enabled(self)->bool:
+        return self._max_bytes > 0
+
+    def _return_entry_path(self, query:str, generation:int)->Path:
+        key_source = f'{generation}\x00{normalize_query(query)}'
+        key = hashlib.sha256(key_source.encode('utf-8')).hexdigest()
+        return self._cache_directory / f'{key}{self._file_suffix}'
+
+    def get(self, query:str, generation:int)->"pd.DataFrame | None":
+        """
+        Return the cached result for the query at the given generation.
+
+        ### Parameters
+        1. query : ``str``
+            - Query whose result is looked up
+        2. generation : ``int``
+            - Current data generation of the database
+
+        ### Returns
+        A ``pd.DataFrame`` on a hit, ``None`` on a miss.
+        """
+        if not self.is_enabled():
+            return None
+
+        import pandas as pd
+
+        entry_path = self._return_entry_path(query,generation)
+        try:
+            df = pd.read_parquet(entry_path)
+            # Refresh the modification time so eviction treats the entry as recently used
+            os.utime(entry_path)
+            return df
+        except (OSError, ValueError):
+            return None
+
+    def put(self, query:str, generation:int, df:"pd.DataFrame")->None:
+        """
+        Store the result for the query at the given generation and evict old entries if the cache is too large.
+        Results that cannot be represented in Parquet are not cached.
+
+        ### Parameters
+        1. query : ``str``
+            - Query that produced the result
+        2. generation : ``int``
+            - Data generation the result was read at
+        3. df : ``pd.DataFrame``
+            - Result to be stored
+
+        ### Effects
+        Writes into, and possibly deletes from, the cache directory
+
+        ### Returns
+        ``None``
+        """
+        if not self.is_enabled():
+            return
+
+        entry_path = self._return_entry_path(query,generation)
+        temporary_path = entry_path.with_name(f'{entry_path.stem}.{os.getpid()}.{threading.get_ident()}.tmp')
+
+        try:
+            df.to_parquet(temporary_path,index=False)
+            os.replace(temporary_path,entry_path)
+        except Exception as e:
+            print(f'[WARNING] Result not cached: {e}')
+            temporary_path.unlink(missing_ok=True)
+            return
+
+        self._evict()
+
+    def _evict(self)->None:
+        entries : list[tuple[float,int,Path]] = []
+        for entry_path in self._cache_directory.glob(f'*{self._file_suffix}'):
+            try:
+                entry_stat = entry_path.stat()
+            except OSError:
+                continue
+            entries.append((entry_stat.st_mtime,entry_stat.st_size,entry_path))
+
+        total_bytes = sum(size for _, size, _ in entries)
+
+        for _, size, entry_path in sorted(entries):
+            if total_bytes <= self._max_bytes:
+                break
+            entry_path.unlink(missing_ok=True)
+            total_bytes -= size
@@ -0,0 +1,275 @@
+from dataclasses import dataclass, asdict, field
+from pathlib import Path
+import argparse
+import json
+import os
+import tempfile
+import threading
+import psycopg2
+from psycopg2 import sql
+from dotenv import load_dotenv
+from .data_generation import read_data_generation
+from .metrics import timed_stage
+
+# Static description of the tables created by ``database_construction``, in join order
+TABLE_DESCRIPTIONS : dict[str,dict[str,str]] = {
+    "studies": {
+        "miovision_id": "INTEGER PK, Miovision study id (the number in file names such as TMC-1230846)",
+        "study_name": "VARCHAR",
+        "study_duration": "DECIMAL, length of the study in hours",
+        "study_type": "VARCHAR, e.g. TMC for intersection turning movement counts; types containing 'way' are pathway/pedestrian counts",
+        "location_name": "VARCHAR, intersection or site name",
+        "latitude": "DECIMAL",
+        "longitude": "DECIMAL",
+        "project_name": "VARCHAR, nullable",
+        "study_date": "DATE, day the study started",
+    },
+    "studies_directions": {
+        "id": "INTEGER PK",
+        "miovision_id": "INTEGER FK -> studies.miovision_id",
+        "direction_type_id": "INTEGER FK -> direction_types.id, approach direction counted in the study",
+    },
+    "directions_movements": {
+        "id": "INTEGER PK",
+        "study_direction_id": "INTEGER FK -> studies_directions.id",
+        "movement_type_id": "INTEGER FK -> movement_types.id",
+    },
+    "movements_vehicles": {
+        "id": "INTEGER PK",
+        "direction_movement_id": "INTEGER FK -> directions_movements.id",
+        "vehicle_type_id": "INTEGER FK -> vehicles_types.id",
+    },
+    "granular_count": {
+        "id": "INTEGER PK",
+        "movement_vehicle_id": "INTEGER FK -> movements_vehicles.id",
+        "time_stamp": "TIME, start of the counting interval (the date is studies.study_date)",
+        "traffic_count": "INTEGER, vehicles/people counted in the interval; intervals with a zero count are not stored",
+    },
+    "direction_types": {
+        "id": "INTEGER PK",
+        "direction_type_name": "VARCHAR",
+    },
+    "movement_types": {
+        "id": "INTEGER PK",
+        "movement_type_name": "VARCHAR",
+    },
+    "vehicles_types": {
+        "id": "INTEGER PK",
+        "vehicle_type_name": "VARCHAR",
+    },
+}
+
+JOIN_PATH = (
+    "studies -> studies_directions (miovision_id) -> directions_movements (study_direction_id = studies_directions.id) "
+    "-> movements_vehicles (direction_movement_id = directions_movements.id) "
+    "-> granular_count (movement_vehicle_id = movements_vehicles.id). "
+    "Names come from direction_types, movement_types and vehicles_types through the *_type_id columns."
+)
+
+# Value domains worth showing to the LLM, as (table, column) pairs
+DOMAIN_COLUMNS : list[tuple[str,str]] = [
+    ("direction_types", "direction_type_name"),
+    ("movement_types", "movement_type_name"),
+    ("vehicles_types", "vehicle_type_name"),
+    ("studies", "study_type"),
+]
+
+@dataclass
+class SchemaDescriptor:
+    """
+    Compact description of the database used in LLM prompts in place of the reflected schema.
+    """
+    dialect : str
+    generation : int | None
+    domains : dict[str,list[str]]
+    # Study locations and names are not rendered into prompts, they are used to recognize studies in questions
+    locations : list[str] = field(default_factory=list)
+    study_names : list[str] = field(default_factory=list)
+
+    def to_prompt(self)->str:
+        """
+        Render the descriptor as the text embedded into LLM prompts.
+
+        ### Returns
+        A ``str`` object describing tables, the join path and the value domains.
+        """
+        lines = [f"Tables ({self.dialect}):"]
+        for table_name, columns in TABLE_DESCRIPTIONS.items():
+            column_descriptions = "; ".join(f"{column} {description}" for column, description in columns.items())
+            lines.append(f"- {table_name}({column_descriptions})")
+
+        lines.append(f"Join path: {JOIN_PATH}")
+        lines.append("Known values:")
+        for domain_name, values in self.domains.items():
+            lines.append(f"- {domain_name}: {', '.join(values)}")
+
+        return "\n".join(lines)
+
+class SchemaDescriptorProvider:
+    """
+    Keeps the schema descriptor in memory and on disk, and rebuilds it from the database whenever the
+    data generation changes. A read-only snapshot shipped with the deployment can be given, so a fresh
+    process whose descriptor file is missing (e.g. a serverless cold start) does not query the schema.
+    """
+    def __init__(self, descriptor_path:Path, snapshot_path:Path | None = None) -> None:
+        self._descriptor_path = descriptor_path
+        self._snapshot_path = snapshot_path
+        self._descriptor : SchemaDescriptor | None = None
+        self._lock = threading.Lock()
+
+    def _load_from_disk(self, descriptor_path:Path)->SchemaDescriptor | None:
+        try:
+            with open(descriptor_path,'r',encoding='utf-8') as file:
+                descriptor_fields = json.load(file)
+            # Descriptors saved before locations and study names were recorded are rebuilt
+            if "locations" not in descriptor_fields or "study_names" not in descriptor_fields:
+                return None
+            return SchemaDescriptor(**descriptor_fields)
+        except (OSError, ValueError, TypeError):
+            return None
+
+    def _save_to_disk(self, descriptor:SchemaDescriptor, descriptor_path:Path)->None:
+        try:
+            descriptor_path.parent.mkdir(parents=True,exist_ok=True)
+            temporary_path = descriptor_path.with_suffix('.tmp')
+            with open(temporary_path,'w',encoding='utf-8') as file:
+                json.dump(asdict(descriptor),file)
+            os.replace(temporary_path,descriptor_path)
+        except OSError as e:
+            print(f'[WARNING] Schema descriptor not saved: {e}')
+
+    def build_descriptor(self, database_connection_string:str, generation:int | None)->SchemaDescriptor:
+        """
+        Read the value domains from the database and build a new descriptor.
+
+        ### Parameters
+        1. database_connection_string : ``str``
+            - Used to connect to the database
+        2. generation : ``int | None``
+            - Data generation the descriptor is built at
+
+        ### Returns
+        A ``SchemaDescriptor`` object
+        """
+        domains : dict[str,list[str]] = {}
+
+        with psycopg2.connect(database_connection_string) as connection:
+            with connection.cursor() as cursor:
+                for table_name, column_name in DOMAIN_COLUMNS:
+                    cursor.execute(
+                        sql.SQL("SELECT DISTINCT {column} FROM {table} WHERE {column} IS NOT NULL ORDER BY {column}").format(
+                            column=sql.Identifier(column_name),
+                            table=sql.Identifier(table_name)
+                        )
+                    )
+                    domains[f"{table_name}.{column_name}"] = [str(row[0]) for row in cursor.fetchall()]
+
+                cursor.execute("SELECT DISTINCT location_name FROM studies WHERE location_name IS NOT NULL ORDER BY location_name")
+                locations = [str(row[0]) for row in cursor.fetchall()]
+
+                cursor.execute("SELECT DISTINCT study_name FROM studies WHERE study_name IS NOT NULL ORDER BY study_name")
+                study_names = [str(row[0]) for row in cursor.fetchall()]
+
+        return SchemaDescriptor(dialect="postgresql",generation=generation,domains=domains,locations=locations,study_names=study_names)
+
+    def get_descriptor(self, database_connection_string:str, generation:int | None)->SchemaDescriptor:
+        """
+        Return the descriptor for the given data generation, using the in-memory or on-disk copy when it is
+        current and rebuilding it otherwise. Without a generation the descriptor is built once per process.
+
+        ### Parameters
+        1. database_connection_string : ``str``
+            - Used to connect to the database when the descriptor has to be rebuilt
+        2. generation : ``int | None``
+            - Current data generation of the database
+
+        ### Returns
+        A ``SchemaDescriptor`` object
+        """
+        with self._lock:
+            if self._descriptor is not None and self._descriptor.generation == generation:
+                return self._descriptor
+
+            if generation is not None:
+                descriptor_paths = [self._descriptor_path] if self._snapshot_path is None else [self._descriptor_path, self._snapshot_path]
+                for descriptor_path in descriptor_paths:
+                    disk_descriptor = self._load_from_disk(descriptor_path)
+                    if disk_descriptor is not None and disk_descriptor.generation == generation:
+                        self._descriptor = disk_descriptor
+                        return self._descriptor
+
+            return self._refresh(database_connection_string,generation)
+
+    def refresh_descriptor(self, database_connection_string:str, generation:int | None)->SchemaDescriptor:
+        """
+        Rebuild the descriptor from the database regardless of the cached copies.
+
+        ### Parameters
+        1. database_connection_string : ``str``
+            - Used to connect to the database
+        2. generation : ``int | None``
+            - Current data generation of the database
+
+        ### Effects
+        Overwrites the descriptor file on disk
+
+        ### Returns
+        A ``SchemaDescriptor`` object
+        """
+        with self._lock:
+            return self._refresh(database_connection_string,generation)
+
+    def _refresh(self, database_connection_string:str, generation:int | None)->SchemaDescriptor:
+        with timed_stage("schema"):
+            self._descriptor = self.build_descriptor(database_connection_string,generation)
+        self._save_to_disk(self._descriptor,self._descriptor_path)
+        return self._descriptor
+
+    def write_snapshot(self, database_connection_string:str, generation:int | None)->SchemaDescriptor:
+        """
+        Rebuild the descriptor from the database and write it to the snapshot path, to be shipped with the deployment.
+
+        ### Parameters
+        1. database_connection_string : ``str``
+            - Used to connect to the database
+        2. generation : ``int | None``
+            - Current data generation of the database
+
+        ### Raises
+        ``ValueError`` if the provider has no snapshot path.
+
+        ### Effects
+        Overwrites the descriptor and snapshot files on disk
+
+        ### Returns
+        A ``SchemaDescriptor`` object
+        """
+        if self._snapshot_path is None:
+            raise ValueError("No snapshot path was given")
+
+        descriptor = self.refresh_descriptor(database_connection_string,generation)
+        self._save_to_disk(descriptor,self._snapshot_path)
+        return descriptor
+
+def default_descriptor_path()->Path:
+    return Path(os.getenv("SCHEMA_DESCRIPTOR_PATH",Path(tempfile.gettempdir()) / "coe_schema_descriptor.json"))
+
+def default_snapshot_path()->Path:
+    return Path(os.getenv("SCHEMA_SNAPSHOT_PATH",Path(__file__).parent / "schema_snapshot.json"))
+
+if __name__ == "__main__":
+    # Rebuild the descriptor by hand, e.g. right after an ingestion run. With --snapshot the descriptor is
+    # also written next to the package so it ships with the next deployment.
+    parser = argparse.ArgumentParser(description="Rebuild the schema descriptor from the database.")
+    parser.add_argument("--snapshot", action="store_true", help="Also write the snapshot shipped with deployments")
+    arguments = parser.parse_args()
+
+    load_dotenv()
+    connection_string = os.environ["DATABASE_URL"]
+    provider = SchemaDescriptorProvider(default_descriptor_path(),default_snapshot_path())
+    generation = read_data_generation(connection_string)
+    if arguments.snapshot:
+        descriptor = provider.write_snapshot(connection_string,generation)
+    else:
+        descriptor = provider.refresh_descriptor(connection_string,generation)
+    print(descriptor.to_prompt())
@@ -0,0 +1,188 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Iterator, Protocol
+import threading
+import time
+import uuid
+from .query_events import QueryEvent
+
+class QueryGenerationCancelled(Exception):
+    """
+    Raised inside query generation once its cancel event has been set.
+    """
+
+class QueryGenerator(Protocol):
+    def stream_query(self, prompt:str, cancel_event:threading.Event | None = None)->Iterator[QueryEvent]:...
+
+@dataclass
+class SpeculativeQuery:
+    cancel_event : threading.Event
+    created_at : float
+    future : Future | None = None
+    # Events produced so far, kept so a client that attaches late still sees the whole stream
+    events : list[QueryEvent] = field(default_factory=list)
+    condition : threading.Condition = field(default_factory=threading.Condition)
+    is_finished : bool = False
+    on_finish : Callable[[],None] | None = None
+
+class SpeculativeQueryRunner:
+    """
+    Starts query generation for a prompt before its validation has finished. Results are kept under a
+    token until they are collected, cancelled or expire.
+    """
+    def __init__(self, generator:QueryGenerator, max_workers:int, result_ttl_seconds:float) -> None:
+        self._generator = generator
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,thread_name_prefix="speculative-query")
+        self._result_ttl_seconds = result_ttl_seconds
+        self._queries : dict[str,SpeculativeQuery] = {}
+        self._lock = threading.Lock()
+
+    def _expire_queries(self)->None:
+        now = time.monotonic()
+        with self._lock:
+            expired_tokens = [token for token, query in self._queries.items()
+                              if now - query.created_at > self._result_ttl_seconds]
+        for token in expired_tokens:
+            self.cancel(token)
+
+    def _generate(self, query:SpeculativeQuery, prompt:str)->str:
+        generated_query = None
+        try:
+            for event in self._generator.stream_query(prompt,query.cancel_event):
+                with query.condition:
+                    query.events.append(event)
+                    query.condition.notify_all()
+                if event.event_type == "query":
+                    generated_query = event.content
+            return generated_query
+        finally:
+            self._finish(query)
+
+    def _finish(self, query:SpeculativeQuery)->None:
+        # Wakes up streaming clients once generation has ended, including on errors and cancellation
+        with query.condition:
+            if query.is_finished:
+                return
+            query.is_finished = True
+            query.condition.notify_all()
+
+        if query.on_finish is not None:
+            query.on_finish()
+
+    def start(self, prompt:str, on_finish:Callable[[],None] | None = None)->str:
+        """
+        Start generating the query for the prompt in the background.
+
+        ### Parameters
+        1. prompt : ``str``
+            - Prompt used for generating the query
+        2. on_finish : ``Callable[[],None] | None``
+            - Called once generation has ended, whether it succeeded, failed or was cancelled
+
+        ### Returns
+        A ``str`` token used to collect or cancel the query.
+        """
+        self._expire_queries()
+
+        token = uuid.uuid4().hex
+        query = SpeculativeQuery(cancel_event=threading.Event(),created_at=time.monotonic(),on_finish=on_finish)
+        query.future = self._executor.submit(self._generate,query,prompt)
+
+        with self._lock:
+            self._queries[token] = query
+
+        return token
+
+    def cancel(self, token:str)->None:
+        """
+        Stop the query generation for the token and discard its result. Unknown tokens are ignored.
+
+        ### Parameters
+        1. token : ``str``
+            - Token returned by ``start``
+
+        ### Returns
+        ``None``
+        """
+        with self._lock:
+            query = self._queries.pop(token,None)
+
+        if query is not None:
+            query.cancel_event.set()
+            if query.future.cancel():
+                self._finish(query)
+
+    def _get_query(self, token:str)->SpeculativeQuery:
+        with self._lock:
+            if token not in self._queries:
+                raise KeyError(f"Query token {token} not found")
+            return self._queries[token]
+
+    def _discard_if_done(self, token:str, query:SpeculativeQuery)->None:
+        if query.future.done():
+            with self._lock:
+                self._queries.pop(token,None)
+
+    def collect(self, token:str, timeout:float | None = None)->str:
+        """
+        Wait for the query generation for the token to finish and return the query.
+
+        ### Parameters
+        1. token : ``str``
+            - Token returned by ``start``
+        2. timeout : ``float | None``
+            - Maximum number of seconds to wait, ``None`` waits until the query is ready
+
+        ### Raises
+        ``KeyError`` if the token is unknown, was cancelled or has expired. Errors raised during
+        generation are re-raised.
+
+        ### Returns
+        A ``str`` object containing the query.
+        """
+        query = self._get_query(token)
+
+        try:
+            return query.future.result(timeout=timeout)
+        finally:
+            self._discard_if_done(token,query)
+
+    def stream(self, token:str)->Iterator[QueryEvent]:
+        """
+        Yield the events of the query generation for the token, starting with the ones already produced,
+        until the final query.
+
+        ### Parameters
+        1. token : ``str``
+            - Token returned by ``start``
+
+        ### Raises
+        ``KeyError`` if the token is unknown, was cancelled or has expired. Errors raised during
+        generation are re-raised once the events produced before them have been yielded.
+
+        ### Returns
+        An ``Iterator[QueryEvent]`` object
+        """
+        # The token is checked here so unknown tokens fail before the first event is requested
+        return self._stream_events(token,self._get_query(token))
+
+    def _stream_events(self, token:str, query:SpeculativeQuery)->Iterator[QueryEvent]:
+        next_event_index = 0
+
+        try:
+            while True:
+                with query.condition:
+                    while next_event_index == len(query.events) and not query.is_finished:
+                        query.condition.wait()
+                    new_events = query.events[next_event_index:]
+                    is_done = query.is_finished
+
+                yield from new_events
+                next_event_index += len(new_events)
+
+                if is_done and next_event_index == len(query.events):
+                    # Surfaces errors raised during generation
+                    query.future.result()
+                    return
+        finally:
+            self._discard_if_done(token,query)
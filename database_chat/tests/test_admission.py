@@ -0,0 +1,220 @@
+import threading
+import time
+import pytest
+from database_chat.admission import AdmissionController, AdmissionRejectedError
+
+def wait_for_waiters(controller:AdmissionController, waiter_count:int)->None:
+    deadline = time.monotonic() + 5
+    while len(controller._waiters) != waiter_count:
+        assert time.monotonic() < deadline, f"expected {waiter_count} queued requests"
+        time.sleep(0.005)
+
+def start_waiting(controller:AdmissionController, client_id:str, priority:int, admitted:list[str])->threading.Thread:
+    def acquire_and_release():
+        controller.acquire(client_id,priority)
+        admitted.append(client_id)
+        controller.release(client_id)
+
+    thread = threading.Thread(target=acquire_and_release,daemon=True)
+    thread.start()
+    return thread
+
+def test_try_acquire_keeps_reserved_slots_free():
+    controller = AdmissionController(max_concurrency=2,max_queue_size=4,max_queued_per_client=2)
+
+    assert controller.try_acquire('a',reserve=1) is True
+    # Only one slot is left, a speculative run may not take it
+    assert controller.try_acquire('b',reserve=1) is False
+    assert controller.try_acquire('b') is True
+    assert controller.try_acquire('c') is False
+
+def test_try_acquire_does_not_skip_the_queue():
+    controller = AdmissionController(max_concurrency=1,max_queue_size=4,max_queued_per_client=2)
+    controller.acquire('a',priority=0)
+    admitted = []
+    thread = start_waiting(controller,'b',0,admitted)
+    wait_for_waiters(controller,1)
+
+    controller.release('a')
+    thread.join(timeout=5)
+
+    assert admitted == ['b']
+    assert controller.try_acquire('c') is True
+
+def test_full_queue_is_rejected():
+    controller = AdmissionController(max_concurrency=1,max_queue_size=1,max_queued_per_client=1)
+    controller.acquire('a',priority=0)
+    admitted = []
+    thread = start_waiting(controller,'b',0,admitted)
+    wait_for_waiters(controller,1)
+
+    with pytest.raises(AdmissionRejectedError) as rejection:
+        controller.acquire('c',priority=0)
+    assert rejection.value.retry_after_seconds >= 1
+
+    controller.release('a')
+    thread.join(timeout=5)
+    assert admitted == ['b']
+
+def test_client_share_of_the_queue_is_limited():
+    controller = AdmissionController(max_concurrency=1,max_queue_size=4,max_queued_per_client=1)
+    controller.acquire('a',priority=0)
+    admitted = []
+    threads = [start_waiting(controller,'b',0,admitted)]
+    wait_for_waiters(controller,1)
+
+    with pytest.raises(AdmissionRejectedError):
+        controller.acquire('b',priority=0)
+    # Other clients still get a place in the queue
+    threads.append(start_waiting(controller,'c',0,admitted))
+    wait_for_waiters(controller,2)
+
+    controller.release('a')
+    for thread in threads:
+        thread.join(timeout=5)
+    assert admitted == ['b','c']
+
+def test_waiters_are_admitted_by_priority():
+    controller = AdmissionController(max_concurrency=1,max_queue_size=4,max_queued_per_client=2)
+    controller.acquire('a',priority=0)
+    admitted = []
+    threads = [start_waiting(controller,'low',2,admitted)]
+    wait_for_waiters(controller,1)
+    threads.append(start_waiting(controller,'high',1,admitted))
+    wait_for_waiters(controller,2)
+
+    controller.release('a')
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert admitted == ['high','low']
+
+def test_clients_with_fewer_active_runs_go_first():
+    controller = AdmissionController(max_concurrency=2,max_queue_size=4,max_queued_per_client=2)
+    controller.acquire('a',priority=0)
+    controller.acquire('c',priority=0)
+    admitted = []
+    threads = [start_waiting(controller,'a',0,admitted)]
+    wait_for_waiters(controller,1)
+    threads.append(start_waiting(controller,'b',0,admitted))
+    wait_for_waiters(controller,2)
+
+    # 'a' still has a run active, so 'b' is admitted before it despite arriving later
+    controller.release('c')
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert admitted == ['b','a']
+    controller.release('a')
+
+def test_identical_prompts_are_coalesced():
+    controller = AdmissionController(max_concurrency=2,max_queue_size=4,max_queued_per_client=2)
+    run_started = threading.Event()
+    finish_run = threading.Event()
+    call_count = 0
+
+    def validate():
+        nonlocal call_count
+        call_count += 1
+        run_started.set()
+        finish_run.wait(timeout=5)
+        return True
+
+    results = {}
+    def run(client_id:str, prompt:str):
+        results[client_id] = controller.run("validate",prompt,client_id,0,validate)
+
+    leader = threading.Thread(target=run,args=('a','Total volume  for study 1'))
+    leader.start()
+    run_started.wait(timeout=5)
+    follower = threading.Thread(target=run,args=('b',' total volume for STUDY 1'))
+    follower.start()
+    # Gives the follower time to attach to the leader's run before it finishes
+    time.sleep(0.1)
+    finish_run.set()
+    leader.join(timeout=5)
+    follower.join(timeout=5)
+
+    assert results == {'a': True, 'b': True}
+    assert call_count == 1
+
+def test_coalesced_requests_share_errors():
+    controller = AdmissionController(max_concurrency=2,max_queue_size=4,max_queued_per_client=2)
+    run_started = threading.Event()
+    finish_run = threading.Event()
+
+    def validate():
+        run_started.set()
+        finish_run.wait(timeout=5)
+        raise ValueError("LLM unavailable")
+
+    errors = {}
+    def run(client_id:str):
+        try:
+            controller.run("validate","volume for study 1",client_id,0,validate)
+        except ValueError as e:
+            errors[client_id] = e
+
+    threads = [threading.Thread(target=run,args=('a',))]
+    threads[0].start()
+    run_started.wait(timeout=5)
+    threads.append(threading.Thread(target=run,args=('b',)))
+    threads[1].start()
+    time.sleep(0.1)
+    finish_run.set()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert set(errors) == {'a','b'}
+    assert errors['a'] is errors['b']
+    # The slot of the failed run was released
+    assert controller.try_acquire('c',reserve=1) is True
+
+def test_different_operations_are_not_coalesced():
+    controller = AdmissionController(max_concurrency=2,max_queue_size=4,max_queued_per_client=2)
+    run_started = threading.Event()
+    finish_run = threading.Event()
+
+    def validate():
+        run_started.set()
+        finish_run.wait(timeout=5)
+        return True
+
+    leader = threading.Thread(target=controller.run,args=("validate","volume for study 1",'a',0,validate))
+    leader.start()
+    run_started.wait(timeout=5)
+
+    # Runs on its own while the validation of the same prompt is still in flight
+    assert controller.run("suggestion","volume for study 1",'b',0,lambda: "suggestion") == "suggestion"
+    finish_run.set()
+    leader.join(timeout=5)
+
+def test_wait_times_out():
+    controller = AdmissionController(max_concurrency=1,max_queue_size=4,max_queued_per_client=2,max_wait_seconds=0.05)
+    controller.acquire('a',priority=0)
+
+    with pytest.raises(AdmissionRejectedError,match='Timed out') as rejection:
+        controller.acquire('b',priority=0)
+    assert rejection.value.retry_after_seconds >= 1
+
+    # The timed out request left the queue, so the slot goes to nobody and the next request takes it
+    assert controller._waiters == []
+    controller.release('a')
+    assert controller.try_acquire('c') is True
+
+def test_check_capacity_does_not_take_a_slot():
+    controller = AdmissionController(max_concurrency=1,max_queue_size=1,max_queued_per_client=1)
+
+    controller.check_capacity('a')
+    controller.acquire('a',priority=0)
+    controller.check_capacity('b')
+    admitted = []
+    thread = start_waiting(controller,'b',0,admitted)
+    wait_for_waiters(controller,1)
+
+    with pytest.raises(AdmissionRejectedError):
+        controller.check_capacity('c')
+
+    controller.release('a')
+    thread.join(timeout=5)
+    assert admitted == ['b']
@@ -0,0 +1,65 @@
+from pathlib import Path
+import pytest
+from database_chat.analytics_mirror import AnalyticsMirror
+
+duckdb = pytest.importorskip('duckdb')
+
+@pytest.fixture
+def analytics_mirror(tmp_path:Path)->AnalyticsMirror:
+    mirror_path = tmp_path / 'mirror.duckdb'
+    mirror = duckdb.connect(str(mirror_path))
+    try:
+        mirror.execute("CREATE TABLE data_generation (generation INTEGER)")
+        mirror.execute("INSERT INTO data_generation VALUES (1)")
+        mirror.execute("CREATE TABLE studies (miovision_id INTEGER, study_name VARCHAR)")
+        mirror.execute("INSERT INTO studies VALUES (1230846, 'Whyte Ave'), (1230900, 'Jasper Ave')")
+    finally:
+        mirror.close()
+
+    return AnalyticsMirror(mirror_path,max_rows=1_000,statement_timeout_ms=5_000)
+
+@pytest.fixture
+def local_files(tmp_path:Path)->dict[str,Path]:
+    text_path = tmp_path / 'secret.txt'
+    text_path.write_text('secret')
+    csv_path = tmp_path / 'secret.csv'
+    csv_path.write_text('value\nsecret\n')
+    parquet_path = tmp_path / 'secret.parquet'
+    connection = duckdb.connect()
+    connection.execute(f"COPY (SELECT 'secret' AS value) TO '{parquet_path}' (FORMAT PARQUET)")
+    connection.close()
+    return {'text': text_path, 'csv': csv_path, 'parquet': parquet_path}
+
+def test_aggregate_query_is_answered(analytics_mirror):
+    dataframe = analytics_mirror.execute("SELECT COUNT(*) FROM public.studies;",generation=1)
+
+    assert dataframe is not None
+    assert dataframe.columns.tolist() == ['count']
+    assert dataframe.iloc[0, 0] == 2
+
+def test_common_table_expressions_are_answered(analytics_mirror):
+    dataframe = analytics_mirror.execute(
+        "WITH named AS (SELECT * FROM studies WHERE study_name LIKE 'W%') SELECT COUNT(*) AS study_count FROM named",
+        generation=1
+    )
+
+    assert dataframe is not None
+    assert dataframe['study_count'].tolist() == [1]
+
+def test_stale_mirror_is_not_used(analytics_mirror):
+    assert analytics_mirror.execute("SELECT COUNT(*) FROM studies",generation=2) is None
+
+@pytest.mark.parametrize('query', [
+    "SELECT COUNT(*), MAX(content) FROM read_text('{text}')",
+    "SELECT COUNT(*), MAX(value) FROM read_csv('{csv}')",
+    "SELECT COUNT(*), MAX(value) FROM read_parquet('{parquet}')",
+    "SELECT COUNT(*), MAX(value) FROM '{csv}'",
+    "SELECT COUNT(*) FROM studies WHERE study_name IN (SELECT value FROM read_csv('{csv}'))",
+    "SELECT COUNT(*) FROM duckdb_settings()",
+    "SELECT COUNT(*) FROM information_schema.tables",
+    "SELECT COUNT(*) FROM unknown_table",
+])
+def test_file_and_catalog_access_is_refused(analytics_mirror, local_files, query):
+    formatted_query = query.format(**{name: path.as_posix() for name, path in local_files.items()})
+
+    assert analytics_mirror.execute(formatted_query,generation=1) is None
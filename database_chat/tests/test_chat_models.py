@@ -0,0 +1,23 @@
+from uuid import uuid4
+from langchain_core.callbacks import CallbackManager
+from database_chat.chat_models import MetricsCallbackHandler
+
+def test_chat_model_calls_are_not_tracked_when_not_recorded():
+    handler = MetricsCallbackHandler(record_llm_calls=False)
+    callback_manager = CallbackManager(handlers=[handler])
+
+    for _ in range(3):
+        callback_manager.on_chat_model_start({},[[]],run_id=uuid4())
+    handler.on_chat_model_start({},[[]],run_id=uuid4())
+
+    assert handler._start_times == {}
+
+def test_chat_model_start_times_are_released():
+    handler = MetricsCallbackHandler()
+    callback_manager = CallbackManager(handlers=[handler])
+
+    run_managers = callback_manager.on_chat_model_start({},[[]])
+    assert len(handler._start_times) == 1
+
+    run_managers[0].on_llm_error(ValueError('LLM unavailable'))
+    assert handler._start_times == {}
@@ -0,0 +1,104 @@
+from pathlib import Path
+import sqlite3
+import threading
+import time
+import pytest
+from database_chat.job_queue import QueryJobQueue, JobStatus
+
+@pytest.fixture
+def job_database_path(tmp_path:Path)->Path:
+    return tmp_path / 'jobs' / 'query_jobs.sqlite3'
+
+def generate_query(prompt:str)->str:
+    return f'SELECT 1; -- {prompt}'
+
+def test_job_succeeds(job_database_path):
+    job_queue = QueryJobQueue(generate_query,job_database_path,max_workers=2,result_ttl_seconds=60)
+    try:
+        job = job_queue.submit('volume for study 1')
+        finished_job = job_queue.wait(job.job_id,timeout=5)
+
+        assert finished_job.status == JobStatus.succeeded
+        assert finished_job.query == 'SELECT 1; -- volume for study 1'
+        assert finished_job.error is None
+        assert job_queue.get(job.job_id) == finished_job
+    finally:
+        job_queue.shutdown()
+
+def test_job_failure_is_recorded(job_database_path):
+    def failing_generate_query(prompt:str)->str:
+        raise ValueError('LLM unavailable')
+
+    job_queue = QueryJobQueue(failing_generate_query,job_database_path,max_workers=1,result_ttl_seconds=60)
+    try:
+        job = job_queue.wait(job_queue.submit('volume for study 1').job_id,timeout=5)
+
+        assert job.status == JobStatus.failed
+        assert job.query is None
+        assert 'LLM unavailable' in job.error
+    finally:
+        job_queue.shutdown()
+
+def test_wait_returns_unfinished_job_after_timeout(job_database_path):
+    finish_generation = threading.Event()
+    def slow_generate_query(prompt:str)->str:
+        finish_generation.wait(timeout=5)
+        return 'SELECT 1'
+
+    job_queue = QueryJobQueue(slow_generate_query,job_database_path,max_workers=1,result_ttl_seconds=60)
+    try:
+        first_job = job_queue.submit('first prompt')
+        second_job = job_queue.submit('second prompt')
+
+        start_time = time.monotonic()
+        job = job_queue.wait(first_job.job_id,timeout=0.1)
+        assert time.monotonic() - start_time < 2
+        assert not job.is_finished()
+        # Only one worker, the second job waits for the first one
+        assert job_queue.get(second_job.job_id).status == JobStatus.queued
+
+        finish_generation.set()
+        assert job_queue.wait(second_job.job_id,timeout=5).status == JobStatus.succeeded
+    finally:
+        finish_generation.set()
+        job_queue.shutdown()
+
+def test_unfinished_jobs_are_resumed(job_database_path):
+    QueryJobQueue(generate_query,job_database_path,max_workers=1,result_ttl_seconds=60).shutdown()
+    # Jobs left behind by a process that stopped while they were queued or running
+    with sqlite3.connect(job_database_path) as connection:
+        connection.executemany(
+            'INSERT INTO query_jobs (job_id, prompt, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?)',
+            [('running-job', 'first prompt', JobStatus.running, 1.0, 1.0),
+             ('queued-job', 'second prompt', JobStatus.queued, 2.0, 2.0)]
+        )
+    connection.close()
+
+    job_queue = QueryJobQueue(generate_query,job_database_path,max_workers=1,result_ttl_seconds=60)
+    try:
+        assert job_queue.wait('running-job',timeout=5).query == 'SELECT 1; -- first prompt'
+        assert job_queue.wait('queued-job',timeout=5).query == 'SELECT 1; -- second prompt'
+    finally:
+        job_queue.shutdown()
+
+def test_expired_results_are_purged(job_database_path):
+    job_queue = QueryJobQueue(generate_query,job_database_path,max_workers=1,result_ttl_seconds=0)
+    try:
+        job = job_queue.submit('first prompt')
+        assert job_queue.wait(job.job_id,timeout=5).status == JobStatus.succeeded
+
+        time.sleep(0.01)
+        job_queue.submit('second prompt')
+
+        with pytest.raises(KeyError):
+            job_queue.get(job.job_id)
+    finally:
+        job_queue.shutdown()
+
+def test_unknown_job(job_database_path):
+    job_queue = QueryJobQueue(generate_query,job_database_path,max_workers=1,result_ttl_seconds=60)
+    try:
+        with pytest.raises(KeyError):
+            job_queue.wait('unknown-job',timeout=0.1)
+    finally:
+        job_queue.shutdown()
@@ -0,0 +1,58 @@
+import pytest
+from database_chat.schema_descriptor import SchemaDescriptor
+from database_chat.query_templates import QueryTemplateEngine
+from database_chat.prompt_prefilter import PromptPrefilter
+
+@pytest.fixture(scope='module')
+def prompt_prefilter()->PromptPrefilter:
+    descriptor = SchemaDescriptor(
+        dialect='postgresql',
+        generation=1,
+        domains={
+            'direction_types.direction_type_name': ['Northbound', 'Southbound', 'Eastbound', 'Westbound'],
+            'movement_types.movement_type_name': ['Thru', 'Left', 'Right', 'U-Turn'],
+            'vehicles_types.vehicle_type_name': ['Lights', 'Buses', 'Articulated Trucks'],
+        },
+        locations=['Whyte Ave & 104 St'],
+        study_names=['Whyte Ave Spring Count']
+    )
+    return PromptPrefilter.from_template_engine(QueryTemplateEngine(descriptor), descriptor.locations, descriptor.study_names)
+
+@pytest.mark.parametrize('prompt', [
+    'total volume for study 1230846',
+    'northbound bus volume at Whyte Ave & 104 St by hour',
+])
+def test_fully_templated_prompts_are_accepted(prompt_prefilter, prompt):
+    assert prompt_prefilter.decide(prompt) is True
+
+@pytest.mark.parametrize('prompt', [
+    # Template misclassifications, each one has to be validated by the LLM
+    'left turn volume for study 1230846',
+    'volume for study 1230846 in 2025',
+    'how many studies are at Whyte Ave & 104 St',
+    # A template matches, but leaves words it does not understand
+    'volume for study 1230846 at the new mall entrance',
+    # Names a study and a measure without any template
+    'average volume of the Whyte Ave Spring Count',
+])
+def test_partially_understood_prompts_are_deferred(prompt_prefilter, prompt):
+    assert prompt_prefilter.decide(prompt) is None
+
+@pytest.mark.parametrize('prompt', [
+    'write me a poem about the sea',
+    'what is the capital of france',
+    'tell me a joke',
+])
+def test_unrelated_prompts_are_rejected(prompt_prefilter, prompt):
+    assert prompt_prefilter.decide(prompt) is False
+
+@pytest.mark.parametrize('prompt', [
+    'Which sites were surveyed last summer?',
+    'Where did we collect data in June?',
+    'List all surveys',
+    'Show the data you have',
+    'Which places were counted most recently?',
+    'What do you know about cycling on Whyte?',
+])
+def test_in_scope_prompts_are_not_rejected(prompt_prefilter, prompt):
+    assert prompt_prefilter.decide(prompt) is not False
@@ -0,0 +1,79 @@
+import os
+from dotenv import load_dotenv
+import pytest
+from psycopg2 import connect, errors
+from database_chat.query_guard import QueryGuard, QueryGuardConfiguration, QueryRejectedError
+
+# generate_series over constants is planned with its exact row count and a cost of one per 100 rows
+LARGE_QUERY = "SELECT g FROM generate_series(1,100000) g;"
+
+@pytest.fixture(scope='module')
+def test_database_connection_string()->str:
+    load_dotenv()
+    url_key = 'LOCAL_DATABASE_URL'
+    if url_key not in os.environ:
+        pytest.skip(f"{url_key} not found in environment variables")
+    return os.environ[url_key]
+
+@pytest.fixture
+def db_connection(test_database_connection_string):
+    db_connection = connect(test_database_connection_string)
+    yield db_connection
+    db_connection.close()
+
+def query_guard(max_total_cost:float = 100_000, max_estimated_rows:int = 1_000, auto_limit:bool = True)->QueryGuard:
+    return QueryGuard(QueryGuardConfiguration(
+        max_total_cost=max_total_cost,
+        max_estimated_rows=max_estimated_rows,
+        statement_timeout_ms=50,
+        auto_limit=auto_limit
+    ))
+
+def test_query_within_limits_is_unchanged(db_connection):
+    with db_connection.cursor() as db_cursor:
+        statement, plan_estimate = query_guard().prepare_query(db_cursor,"SELECT g FROM generate_series(1,10) g;")
+
+        assert statement.as_string(db_connection) == "SELECT g FROM generate_series(1,10) g"
+        assert plan_estimate.estimated_rows == 10
+        assert plan_estimate.row_limit_applied is None
+
+def test_large_query_is_limited(db_connection):
+    with db_connection.cursor() as db_cursor:
+        statement, plan_estimate = query_guard().prepare_query(db_cursor,LARGE_QUERY)
+
+        assert plan_estimate.row_limit_applied == 1_000
+        assert plan_estimate.estimated_rows == 1_000
+        db_cursor.execute(statement)
+        assert len(db_cursor.fetchall()) == 1_000
+
+def test_large_query_is_rejected_without_auto_limit(db_connection):
+    with db_connection.cursor() as db_cursor, pytest.raises(QueryRejectedError,match='row count'):
+        query_guard(auto_limit=False).prepare_query(db_cursor,LARGE_QUERY)
+
+def test_costly_query_is_rejected_after_limiting(db_connection):
+    # The whole series is sorted before the limit applies, so limiting does not lower the cost
+    costly_query = "SELECT g FROM generate_series(1,100000) g ORDER BY g DESC"
+
+    with db_connection.cursor() as db_cursor, pytest.raises(QueryRejectedError,match='cost'):
+        query_guard(max_total_cost=5_000).prepare_query(db_cursor,costly_query)
+
+def test_transaction_times_out(db_connection):
+    with db_connection.cursor() as db_cursor:
+        query_guard().configure_transaction(db_connection,db_cursor)
+
+        with pytest.raises(errors.QueryCanceled):
+            db_cursor.execute("SELECT pg_sleep(1)")
+
+    db_connection.rollback()
+    # The timeout only applied to the guarded transaction
+    with db_connection.cursor() as db_cursor:
+        db_cursor.execute("SHOW statement_timeout")
+        assert db_cursor.fetchone()[0] != '50ms'
+
+def test_transaction_is_read_only(db_connection):
+    with db_connection.cursor() as db_cursor:
+        query_guard().configure_transaction(db_connection,db_cursor)
+
+        with pytest.raises(errors.ReadOnlySqlTransaction):
+            db_cursor.execute("CREATE TABLE query_guard_test (id INTEGER)")
+    db_connection.rollback()
@@ -0,0 +1,63 @@
+import os
+from dotenv import load_dotenv
+import pytest
+from psycopg2 import connect
+from database_chat.query_preview import has_top_level_order_by, paginate_query
+
+# Hash aggregation returns the groups in no particular order
+UNORDERED_QUERY = "SELECT g % 37 AS remainder, COUNT(*) AS row_count FROM generate_series(1,1000) g GROUP BY g % 37;"
+
+@pytest.fixture(scope='module')
+def test_database_connection_string()->str:
+    load_dotenv()
+    url_key = 'LOCAL_DATABASE_URL'
+    if url_key not in os.environ:
+        pytest.skip(f"{url_key} not found in environment variables")
+    return os.environ[url_key]
+
+@pytest.fixture
+def db_connection(test_database_connection_string):
+    db_connection = connect(test_database_connection_string)
+    yield db_connection
+    db_connection.close()
+
+def fetch_all_pages(db_connection,query:str,page_size:int)->list[tuple]:
+    rows = []
+    with db_connection.cursor() as db_cursor:
+        while True:
+            db_cursor.execute(paginate_query(query,page_size,len(rows),stable_order=True))
+            page_rows = db_cursor.fetchall()
+            rows.extend(page_rows)
+            if len(page_rows) < page_size:
+                return rows
+
+@pytest.mark.parametrize('query, expected', [
+    ("SELECT * FROM studies ORDER BY miovision_id DESC;", True),
+    ("SELECT a FROM t UNION SELECT b FROM u ORDER BY 1", True),
+    ("SELECT * FROM studies", False),
+    ("SELECT * FROM (SELECT * FROM studies ORDER BY miovision_id) AS s", False),
+    ("SELECT string_agg(name, ',' ORDER BY name), rank() OVER (ORDER BY id) FROM t", False),
+    ("SELECT 'order by' AS \"ORDER BY\" FROM t -- ORDER BY id", False),
+])
+def test_has_top_level_order_by(query, expected):
+    assert has_top_level_order_by(query) is expected
+
+def test_query_order_is_kept():
+    statement = paginate_query("SELECT * FROM studies ORDER BY miovision_id;",10,20,stable_order=True)
+
+    assert "preview_page::text" not in repr(statement)
+
+def test_pages_return_every_row_once(db_connection):
+    with db_connection.cursor() as db_cursor:
+        db_cursor.execute(UNORDERED_QUERY)
+        expected_rows = db_cursor.fetchall()
+
+    rows = fetch_all_pages(db_connection,UNORDERED_QUERY,page_size=5)
+
+    assert len(rows) == len(expected_rows)
+    assert sorted(rows) == sorted(expected_rows)
+
+def test_pages_follow_query_order(db_connection):
+    rows = fetch_all_pages(db_connection,"SELECT g FROM generate_series(1,23) g ORDER BY g DESC",page_size=5)
+
+    assert rows == [(g,) for g in range(23,0,-1)]
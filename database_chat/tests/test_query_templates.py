@@ -0,0 +1,74 @@
+import pytest
+from datetime import date
+from database_chat.schema_descriptor import SchemaDescriptor
+from database_chat.query_templates import QueryTemplateEngine
+
+@pytest.fixture(scope='module')
+def template_engine()->QueryTemplateEngine:
+    descriptor = SchemaDescriptor(
+        dialect='postgresql',
+        generation=1,
+        domains={
+            'direction_types.direction_type_name': ['Northbound', 'Southbound', 'Eastbound', 'Westbound'],
+            'movement_types.movement_type_name': ['Thru', 'Left', 'Right', 'U-Turn', 'Hard Left'],
+            'vehicles_types.vehicle_type_name': ['Lights', 'Buses', 'Articulated Trucks'],
+        },
+        locations=['Whyte Ave & 104 St']
+    )
+    return QueryTemplateEngine(descriptor)
+
+def test_study_volume(template_engine):
+    template_match = template_engine.match('total volume for study 1230846')
+
+    assert template_match is not None
+    assert template_match.template_name == 'volume'
+    assert 'studies.miovision_id IN (1230846)' in template_match.query
+
+def test_filters_and_groupings(template_engine):
+    template_match = template_engine.match('northbound bus volume at Whyte Ave & 104 St on May 6, 2025 by hour')
+
+    assert template_match is not None
+    assert template_match.template_name == 'volume_by_hour'
+    assert template_match.slots.dates == [date(2025, 5, 6)]
+    assert "direction_types.direction_type_name IN ('Northbound')" in template_match.query
+    assert "vehicles_types.vehicle_type_name IN ('Buses')" in template_match.query
+    assert template_match.slots.unconsumed_words == []
+
+@pytest.mark.parametrize('prompt', [
+    'left turn volume for study 1230846',
+    'through traffic for study 1230846',
+    'u-turn counts at Whyte Ave & 104 St',
+])
+def test_movement_mentions_are_not_templated(template_engine, prompt):
+    # Movements are only grouped on, the template would return the volume of every movement
+    assert template_engine.match(prompt) is None
+
+@pytest.mark.parametrize('prompt', [
+    'volume at Whyte Ave & 104 St in May 2025',
+    'volume for study 1230846 in 2025',
+    'traffic volume for study 1230846 on 2025-13-45',
+    'volume for study 1230846 on 5/6/2025',
+    'volume for study 1230846 last week',
+    'volume at Whyte Ave & 104 St in march',
+])
+def test_unparsed_dates_are_not_templated(template_engine, prompt):
+    assert template_engine.match(prompt) is None
+
+@pytest.mark.parametrize('prompt', [
+    'how many studies are at Whyte Ave & 104 St',
+    'number of directions counted in study 1230846',
+    'how many distinct locations have a total volume over 1000',
+])
+def test_entity_counts_are_not_templated(template_engine, prompt):
+    assert template_engine.match(prompt) is None
+
+def test_vehicle_counts_are_templated(template_engine):
+    template_match = template_engine.match('how many trucks at study 1230846')
+
+    assert template_match is not None
+    assert "vehicles_types.vehicle_type_name IN ('Articulated Trucks')" in template_match.query
+
+def test_unconsumed_words(template_engine):
+    slots = template_engine.extractor.extract('volume for study 1230846 at the new mall entrance')
+
+    assert slots.unconsumed_words == ['new', 'mall', 'entrance']
@@ -0,0 +1,62 @@
+from pathlib import Path
+import os
+import pandas as pd
+from database_chat.result_cache import ResultSetCache, normalize_query
+
+QUERY = "SELECT direction, SUM(volume) FROM volumes GROUP BY direction;"
+
+def result(row_count:int = 3)->pd.DataFrame:
+    return pd.DataFrame({'direction': [f'direction {index}' for index in range(row_count)], 'volume': range(row_count)})
+
+def entry_paths(cache_directory:Path)->list[Path]:
+    return sorted(cache_directory.glob('*'))
+
+def test_normalize_query_keeps_quoted_whitespace():
+    assert normalize_query("SELECT  *\nFROM t WHERE name = 'Whyte  Ave' ;") == "SELECT * FROM t WHERE name = 'Whyte  Ave'"
+
+def test_disabled_cache(tmp_path):
+    cache = ResultSetCache(tmp_path / 'cache',max_bytes=0)
+    cache.put(QUERY,1,result())
+
+    assert cache.get(QUERY,1) is None
+    assert not (tmp_path / 'cache').exists()
+
+def test_hit_across_formatting(tmp_path):
+    cache = ResultSetCache(tmp_path,max_bytes=10_000_000)
+    cache.put(QUERY,1,result())
+
+    cached_result = cache.get("SELECT direction,  SUM(volume)\nFROM volumes GROUP BY direction",1)
+    pd.testing.assert_frame_equal(cached_result,result())
+
+def test_new_generation_misses(tmp_path):
+    cache = ResultSetCache(tmp_path,max_bytes=10_000_000)
+    cache.put(QUERY,1,result())
+
+    assert cache.get(QUERY,2) is None
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    probe_cache = ResultSetCache(tmp_path / 'probe',max_bytes=10_000_000)
+    probe_cache.put(QUERY,1,result())
+    entry_bytes = entry_paths(tmp_path / 'probe')[0].stat().st_size
+
+    cache = ResultSetCache(tmp_path / 'cache',max_bytes=int(entry_bytes * 2.5))
+    cache.put("SELECT 1",1,result())
+    cache.put("SELECT 2",1,result())
+    for entry_path in entry_paths(tmp_path / 'cache'):
+        os.utime(entry_path,(0,0))
+
+    # Reading an entry makes it the most recently used one
+    cache.get("SELECT 1",1)
+    cache.put("SELECT 3",1,result())
+
+    assert cache.get("SELECT 2",1) is None
+    assert cache.get("SELECT 1",1) is not None
+    assert cache.get("SELECT 3",1) is not None
+    assert len(entry_paths(tmp_path / 'cache')) == 2
+
+def test_unrepresentable_result_is_not_cached(tmp_path):
+    cache = ResultSetCache(tmp_path,max_bytes=10_000_000)
+    cache.put(QUERY,1,pd.DataFrame({'mixed': [1, 'a']}))
+
+    assert cache.get(QUERY,1) is None
+    assert entry_paths(tmp_path) == []
@@ -0,0 +1,139 @@
+from concurrent.futures import TimeoutError
+from typing import Iterator
+import threading
+import pytest
+from database_chat.query_events import QueryEvent
+from database_chat.speculative_queries import SpeculativeQueryRunner, QueryGenerationCancelled
+
+class FakeQueryGenerator:
+    """
+    Streams a token, then waits for ``release`` before finishing with the query or the configured error.
+    """
+    def __init__(self, error:Exception | None = None) -> None:
+        self.released = threading.Event()
+        self.started = threading.Event()
+        self.error = error
+
+    def stream_query(self, prompt:str, cancel_event:threading.Event | None = None)->Iterator[QueryEvent]:
+        self.started.set()
+        yield QueryEvent(event_type="token",content="SELECT")
+
+        while not self.released.wait(timeout=0.01):
+            if cancel_event is not None and cancel_event.is_set():
+                raise QueryGenerationCancelled()
+
+        if self.error is not None:
+            raise self.error
+        yield QueryEvent(event_type="query",content=f"SELECT 1 -- {prompt}")
+
+class FinishCounter:
+    def __init__(self) -> None:
+        self.count = 0
+        self.finished = threading.Event()
+
+    def __call__(self)->None:
+        self.count += 1
+        self.finished.set()
+
+def test_collect_returns_query_once():
+    generator = FakeQueryGenerator()
+    runner = SpeculativeQueryRunner(generator,max_workers=1,result_ttl_seconds=60)
+    on_finish = FinishCounter()
+
+    token = runner.start('volume for study 1',on_finish=on_finish)
+    generator.released.set()
+
+    assert runner.collect(token,timeout=5) == 'SELECT 1 -- volume for study 1'
+    assert on_finish.count == 1
+    with pytest.raises(KeyError):
+        runner.collect(token)
+
+def test_collect_timeout_keeps_query():
+    generator = FakeQueryGenerator()
+    runner = SpeculativeQueryRunner(generator,max_workers=1,result_ttl_seconds=60)
+
+    token = runner.start('volume for study 1')
+    with pytest.raises(TimeoutError):
+        runner.collect(token,timeout=0.05)
+
+    generator.released.set()
+    assert runner.collect(token,timeout=5) == 'SELECT 1 -- volume for study 1'
+
+def test_late_stream_sees_every_event():
+    generator = FakeQueryGenerator()
+    runner = SpeculativeQueryRunner(generator,max_workers=1,result_ttl_seconds=60)
+
+    token = runner.start('volume for study 1')
+    generator.started.wait(timeout=5)
+    events = runner.stream(token)
+    generator.released.set()
+
+    assert [(event.event_type, event.content) for event in events] == [
+        ("token","SELECT"),
+        ("query","SELECT 1 -- volume for study 1")
+    ]
+
+def test_stream_reraises_generation_errors():
+    generator = FakeQueryGenerator(error=ValueError('LLM unavailable'))
+    runner = SpeculativeQueryRunner(generator,max_workers=1,result_ttl_seconds=60)
+    on_finish = FinishCounter()
+
+    token = runner.start('volume for study 1',on_finish=on_finish)
+    events = runner.stream(token)
+    generator.released.set()
+
+    assert next(events).content == "SELECT"
+    with pytest.raises(ValueError):
+        next(events)
+    assert on_finish.count == 1
+
+def test_cancel_stops_running_generation():
+    generator = FakeQueryGenerator()
+    runner = SpeculativeQueryRunner(generator,max_workers=1,result_ttl_seconds=60)
+    on_finish = FinishCounter()
+
+    token = runner.start('volume for study 1',on_finish=on_finish)
+    generator.started.wait(timeout=5)
+    runner.cancel(token)
+
+    assert on_finish.finished.wait(timeout=5)
+    assert on_finish.count == 1
+    with pytest.raises(KeyError):
+        runner.stream(token)
+
+def test_cancel_before_generation_starts():
+    generator = FakeQueryGenerator()
+    runner = SpeculativeQueryRunner(generator,max_workers=1,result_ttl_seconds=60)
+    first_on_finish = FinishCounter()
+    second_on_finish = FinishCounter()
+
+    first_token = runner.start('first prompt',on_finish=first_on_finish)
+    # The only worker is busy, so the second generation never starts
+    second_token = runner.start('second prompt',on_finish=second_on_finish)
+    runner.cancel(second_token)
+
+    # Slots held by cancelled queries are released even if their generation never ran
+    assert second_on_finish.count == 1
+    generator.released.set()
+    assert runner.collect(first_token,timeout=5) == 'SELECT 1 -- first prompt'
+    assert second_on_finish.count == 1
+
+def test_cancel_unknown_token_is_ignored():
+    runner = SpeculativeQueryRunner(FakeQueryGenerator(),max_workers=1,result_ttl_seconds=60)
+
+    runner.cancel('unknown-token')
+    with pytest.raises(KeyError):
+        runner.collect('unknown-token')
+
+def test_expired_queries_are_cancelled():
+    generator = FakeQueryGenerator()
+    runner = SpeculativeQueryRunner(generator,max_workers=2,result_ttl_seconds=0)
+    on_finish = FinishCounter()
+
+    expired_token = runner.start('first prompt',on_finish=on_finish)
+    runner.start('second prompt')
+
+    assert on_finish.finished.wait(timeout=5)
+    with pytest.raises(KeyError):
+        runner.collect(expired_token)
+    generator.released.set()
@@ -0,0 +1,83 @@
+from typing import Any
+import json
+import threading
+from langchain_core.tools import BaseTool
+
+# Tools whose output only depends on the schema, so it can be shared across requests within a data generation
+CACHEABLE_TOOL_NAMES = {"sql_db_list_tables", "sql_db_schema"}
+
+class ToolResultCache:
+    """
+    In-process cache of tool outputs keyed by tool name and arguments. The cache is cleared whenever the
+    data generation changes.
+    """
+    def __init__(self) -> None:
+        self._results : dict[tuple[str,str],str] = {}
+        self._generation : int | None = None
+        self._lock = threading.Lock()
+
+    def _key(self, tool_name:str, tool_arguments:dict[str,Any])->tuple[str,str]:
+        normalized_arguments = {}
+        for name, value in tool_arguments.items():
+            if name == "table_names" and isinstance(value, str):
+                value = ",".join(sorted(table_name.strip() for table_name in value.split(",")))
+            elif isinstance(value, str):
+                value = value.strip()
+            normalized_arguments[name] = value
+        return tool_name, json.dumps(normalized_arguments,sort_keys=True,default=str)
+
+    def set_generation(self, generation:int | None)->None:
+        with self._lock:
+            if generation != self._generation:
+                self._results.clear()
+                self._generation = generation
+
+    def get(self, tool_name:str, tool_arguments:dict[str,Any])->str | None:
+        with self._lock:
+            return self._results.get(self._key(tool_name,tool_arguments))
+
+    def put(self, tool_name:str, tool_arguments:dict[str,Any], result:str)->None:
+        with self._lock:
+            self._results[self._key(tool_name,tool_arguments)] = result
+
+class MemoizedTool(BaseTool):
+    """
+    Wraps a tool so repeated calls with the same arguments are answered from a ``ToolResultCache``.
+    """
+    inner : BaseTool
+    cache : Any
+
+    def _run(self, **kwargs:Any)->str:
+        cached_result = self.cache.get(self.name,kwargs)
+        if cached_result is not None:
+            return cached_result
+
+        result = self.inner.run(kwargs)
+        # Errors are returned as text by the SQL tools and should not be remembered
+        if isinstance(result, str) and not result.startswith("Error"):
+            self.cache.put(self.name,kwargs,result)
+        return result
+
+def memoize_tools(tools:list[BaseTool], cache:ToolResultCache)->list[BaseTool]:
+    """
+    Replace the schema tools in the list with memoized wrappers. Other tools are returned unchanged.
+
+    ### Parameters
+    1. tools : ``list[BaseTool]``
+        - Tools given to the agent
+    2. cache : ``ToolResultCache``
+        - Cache shared by the wrappers
+
+    ### Returns
+    A ``list[BaseTool]`` object
+    """
+    return [
+        MemoizedTool(
+            name=tool.name,
+            description=tool.description,
+            args_schema=tool.args_schema,
+            inner=tool,
+            cache=cache
+        ) if tool.name in CACHEABLE_TOOL_NAMES else tool
+        for tool in tools
+    ]
@@ -1,13 +1,17 @@
 import providers.tables_providers as tables
 from providers.types_providers import MovementsProvider, VehiclesProvider, DirectionsProvider, BaseTypesProvider, BaseFolderValidator, BaseTypeConfiguration
-from providers.database_providers import PostgresDatabaseConnection, DatabaseTableWriter, DatabaseTypesWriter, DatabaseUpdater
+from providers.database_providers import PostgresDatabaseConnection, SQLiteDatabaseConnection, DatabaseTableWriter, create_database_connection, DatabaseTypesWriter, DatabaseUpdater, DataGenerationWriter
 from pathlib import Path
 from providers.core_providers import CoreDataProvider, StudiesDirectionsProvider, StudiesProvider, DirectionsMovementsProvider, VehiclesAndGranularCountsProvider
 from providers.core_providers import TransactionContext, CoreDataWriter
-from providers.extraction_providers import StudiesExtractor, DirectionsExtractor, MovementsExtractor, GranularExtractor
-from dataclasses import dataclass
+from providers.extraction_providers import StudiesExtractor, DirectionsExtractor, MovementsExtractor, GranularExtractor, ChecksumExtractor
+from providers.reconciliation_providers import ReconciliationProvider, ExpectedTotalsExtractor, ChecksumVerifier
+from providers.analytics_mirror_providers import AnalyticsMirrorWriter
+from dataclasses import dataclass, field
+import argparse
 import dotenv
 import os
+import sys
 
 
 def get_connection_string(connection_string:str)->str:
@@ -18,20 +22,33 @@ def get_connection_string(connection_string:str)->str:
     except KeyError as e:
         raise e
 
+def return_schema_objects()->list[tables.SchemaObject]:
+    return [
+        # Lookup tables first, the volume functions read them
+        tables.VolumeLookupTables(),
+        tables.VolumeIndexes(),
+        tables.VolumeFunctions()
+    ]
+
 @dataclass
 class ApplicationConfiguration:
     db_connection_string : str
-    miovision_base_folder_name : str
+    miovision_base_folder_names : list[str]
     vehicle_class_total_volume_sheet_name : str
     validation_extension : str
     intitialize_tables : bool
     intitialize_types : bool
+    reconcile_totals : bool = False
+    analytics_mirror_path : str | None = None
+    # Excel keeps a "~$<name>" lock file next to every open workbook
+    excluded_file_patterns : list[str] = field(default_factory=lambda: ['~$*'])
     
 
 class App:
     """Orchestration class that abstracts the flow of the database construction."""
     def __init__(self, app_configuration: ApplicationConfiguration) -> None:
-        self._database_connection = PostgresDatabaseConnection(connection_string=app_configuration.db_connection_string)
+        # sqlite:///<path> runs the ingestion on the embedded backend, e.g. for dry runs and benchmarks
+        self._database_connection = create_database_connection(app_configuration.db_connection_string)
         
         self.app_configuration = app_configuration
         
@@ -39,8 +56,9 @@ class App:
         
         self._db_updater = DatabaseUpdater(self._database_connection)
         
-        self._base_validator = BaseFolderValidator(base_folder_path=Path(app_configuration.miovision_base_folder_name),
-                                                   validation_extension=app_configuration.validation_extension)
+        self._base_validator = BaseFolderValidator(base_folder_path=[Path(folder_name) for folder_name in app_configuration.miovision_base_folder_names],
+                                                   validation_extension=app_configuration.validation_extension,
+                                                   exclude_patterns=app_configuration.excluded_file_patterns)
         
         self._context = self._return_transaction_context()
     
@@ -76,7 +94,8 @@ class App:
         """
         self.database_writer = DatabaseTableWriter(
                                 database_connection=self._database_connection,
-                                tables=self._initial_tables
+                                tables=self._initial_tables,
+                                schema_objects=return_schema_objects()
                                 )
         
         self.database_writer.create_tables()
@@ -120,7 +139,10 @@ class App:
                 context=self._context,
                 db_connection=self._db_updater,
                 base_validator=self._base_validator,
-                extractor=GranularExtractor()
+                extractor=GranularExtractor(),
+                checksum_extractor=ChecksumExtractor(),
+                expected_totals_extractor=(ExpectedTotalsExtractor(self.app_configuration.vehicle_class_total_volume_sheet_name)
+                                           if self.app_configuration.reconcile_totals else None)
             )
         ]
     
@@ -191,7 +213,11 @@ class App:
             tables.StudiesDirectionsTable(),
             tables.DirectionsMovementsTable(),
             tables.MovementVehiclesTable(),
-            tables.GranularCountTable()
+            tables.GranularCountTable(),
+            
+            # Metadata tables
+            tables.DataGenerationTable(),
+            tables.StudyChecksumsTable()
         ]
     
     def _populate_core_tables(self, core_providers: list[CoreDataProvider])->None:
@@ -207,10 +233,80 @@ class App:
         ### Returns
         ``None``
         """
+        # Databases initialized before checksums were recorded are missing the checksums table
+        DatabaseTableWriter(
+            database_connection=self._database_connection,
+            tables=[tables.StudyChecksumsTable()]
+        ).create_tables()
+        
         writer = CoreDataWriter(core_providers)
         
         writer.write_data()
     
+    def _bump_data_generation(self)->None:
+        """
+        Record a new data generation so that readers caching query results know the data changed.
+        
+        ### Arguments
+        None
+        
+        ### External Effects
+        Inserts a row into the data generation table, creating the table if it is missing
+        
+        ### Returns
+        ``None``
+        """
+        generation_writer = DataGenerationWriter(
+            db_connection=self._database_connection,
+            data_generation_table=tables.DataGenerationTable()
+        )
+        
+        generation = generation_writer.bump_generation()
+        print(f"Data generation bumped to {generation}")
+    
+    def _write_analytics_mirror(self)->None:
+        """
+        Export the ingested tables to the DuckDB mirror read by the chat backend for aggregate queries.
+        
+        ### Arguments
+        None
+        
+        ### External Effects
+        Replaces the DuckDB file at the configured mirror path
+        
+        ### Returns
+        ``None``
+        """
+        mirror_writer = AnalyticsMirrorWriter(
+            db_connection_string=self.app_configuration.db_connection_string,
+            mirror_path=Path(self.app_configuration.analytics_mirror_path)
+        )
+        
+        mirror_writer.write_mirror()
+    
+    def _reconcile_totals(self)->None:
+        """
+        Compare the totals collected while ingesting the Excel files with the ingested totals and print the discrepancies.
+        
+        ### Arguments
+        None
+        
+        ### External Effects
+        None
+        
+        ### Returns
+        ``None``
+        """
+        reconciliation_provider = ReconciliationProvider(db_connection=self._database_connection)
+        
+        report = reconciliation_provider.reconcile(self._context.get_expected_totals())
+        
+        if report.is_consistent():
+            print(f"Totals of {len(report.study_totals)} studies match the Excel files")
+        else:
+            print(f"Study totals not matching the Excel files:\n{report.study_discrepancies.to_string(index=False)}")
+            print(f"Direction and vehicle class totals not matching the Excel files:\n{report.direction_vehicle_discrepancies.to_string(index=False)}")
+    
     def run(self)->None:
         """Runs the main flow of the application
         
@@ -231,17 +327,95 @@ class App:
             self._intitialize_base_providers(self._base_validator)
         core_providers = self._return_core_providers()
         self._populate_core_tables(core_providers)
+        self._bump_data_generation()
+        
+        # Written after the bump so the mirror carries the generation it was exported at. The mirror is exported
+        # from Postgres, dry runs on the embedded backend skip it
+        if self.app_configuration.analytics_mirror_path is not None:
+            if isinstance(self._database_connection, SQLiteDatabaseConnection):
+                print("Analytics mirror is only exported from Postgres, skipped")
+            else:
+                self._write_analytics_mirror()
+        
+        if self.app_configuration.reconcile_totals:
+            self._reconcile_totals()
         
     
+def verify_checksums(db_connection_string:str)->bool:
+    """
+    Compare the checksums recorded at ingestion with the granular counts in the database, without reading any Excel file.
+    
+    ### Arguments
+    ``db_connection_string`` -- Database to be verified
+    
+    ### External Effects
+    None
+    
+    ### Returns
+    ``True`` if every checksummed study matches its checksums, ``False`` otherwise
+    """
+    database_connection = create_database_connection(db_connection_string)
+    if not database_connection.is_existing_table(tables.PredefinedTableNames.study_checksums.value):
+        print("No checksums recorded, ingest the studies first")
+        return False
+    
+    verifier = ChecksumVerifier(database_connection)
+    
+    mismatches = verifier.verify()
+    study_count = verifier.checksummed_study_count()
+    
+    if mismatches.empty:
+        print(f"Checksums of {study_count} studies verified")
+        return True
+    
+    mismatching_study_count = mismatches[tables.StudyChecksumsTableColumns.miovision_id.value].nunique()
+    print(f"{mismatching_study_count} of {study_count} studies do not match their checksums:\n{mismatches.to_string(index=False)}")
+    return False
+    
+def initialize_schema_objects(db_connection_string:str)->None:
+    """
+    Create the volume lookup tables, indexes and ``study_directional_volumes`` on an existing database.
+    Ingestion never runs this DDL, databases are only changed when this command is run explicitly.
+    
+    ### Arguments
+    ``db_connection_string`` -- Database the schema objects are created in
+    
+    ### External Effects
+    Creates or replaces the schema objects owned by this repo, the volume functions maintained outside it are left untouched
+    
+    ### Returns
+    ``None``
+    """
+    DatabaseTableWriter(
+        database_connection=create_database_connection(db_connection_string),
+        tables=[],
+        schema_objects=return_schema_objects()
+    ).create_tables()
+    
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the traffic count database from the Miovision files.")
+    parser.add_argument("command", nargs="?", choices=["ingest", "verify", "init-schema"], default="ingest",
+                        help="ingest the Miovision files, verify the ingested studies against their checksums, "
+                             "or create the volume lookup tables, indexes and functions")
+    arguments = parser.parse_args()
+    
+    if arguments.command == "verify":
+        sys.exit(0 if verify_checksums(get_connection_string('LOCAL_DATABASE_URL')) else 1)
+    
+    if arguments.command == "init-schema":
+        initialize_schema_objects(get_connection_string('LOCAL_DATABASE_URL'))
+        sys.exit(0)
     
     app_configuration = ApplicationConfiguration(
                             db_connection_string = get_connection_string('LOCAL_DATABASE_URL'),
-                            miovision_base_folder_name = 'Miovision 2025',
+                            # Folders are searched recursively, several year or season folders are separated like PATH entries
+                            miovision_base_folder_names = os.getenv('MIOVISION_FOLDERS','Miovision 2025').split(os.pathsep),
                             vehicle_class_total_volume_sheet_name = 'Total Volume Class Breakdown',
                             validation_extension = '.xlsx',
                             intitialize_tables = False,
-                            intitialize_types = False
+                            intitialize_types = False,
+                            reconcile_totals = True,
+                            analytics_mirror_path = os.getenv('ANALYTICS_MIRROR_PATH')
                         )
     
     application = App(app_configuration=app_configuration)
@@ -0,0 +1,109 @@
+from pathlib import Path
+from psycopg2 import connect
+from psycopg2.sql import SQL, Identifier
+from .tables_providers import PredefinedTableNames
+import pandas as pd
+import os
+import tqdm
+
+# DuckDB types of the Postgres column types used by the tables, anything else is mirrored as text
+POSTGRES_TO_DUCKDB_TYPES = {
+    'smallint': 'SMALLINT',
+    'integer': 'INTEGER',
+    'bigint': 'BIGINT',
+    'numeric': 'DOUBLE',
+    'real': 'REAL',
+    'double precision': 'DOUBLE',
+    'boolean': 'BOOLEAN',
+    'character varying': 'VARCHAR',
+    'character': 'VARCHAR',
+    'text': 'VARCHAR',
+    'date': 'DATE',
+    'time without time zone': 'TIME',
+    'timestamp without time zone': 'TIMESTAMP',
+    'timestamp with time zone': 'TIMESTAMPTZ'
+}
+
+class AnalyticsMirrorWriter:
+    """
+    Copies the tables into a DuckDB file, on which the chat backend runs read-only aggregate queries instead of
+    the operational database. The mirror is written next to its final path and swapped in once complete, so
+    readers never see a partially written mirror.
+    """
+    def __init__(self, db_connection_string:str, mirror_path:Path, table_names:list[str] | None = None, batch_size:int = 100_000) -> None:
+        self._db_connection_string = db_connection_string
+        self._mirror_path = Path(mirror_path)
+        self._table_names = table_names if table_names is not None else [table_name.value for table_name in PredefinedTableNames]
+        self._batch_size = batch_size
+
+    def _return_columns(self, cursor, table_name:str)->list[tuple[str,str]]:
+        cursor.execute("""
+            SELECT column_name, data_type FROM information_schema.columns
+            WHERE table_schema = 'public' AND table_name = %s
+            ORDER BY ordinal_position;
+        """, [table_name])
+        return cursor.fetchall()
+
+    def _copy_table(self, connection, mirror, table_name:str, columns:list[tuple[str,str]])->int:
+        column_names = [column_name for column_name, _ in columns]
+        quoted_columns = ', '.join(f'"{column_name}" {POSTGRES_TO_DUCKDB_TYPES.get(data_type, "VARCHAR")}' for column_name, data_type in columns)
+        mirror.execute(f'CREATE TABLE "{table_name}" ({quoted_columns})')
+
+        # Decimals are read as floats, the mirror is meant for aggregates, not exact arithmetic
+        select_columns = SQL(', ').join(
+            SQL('{}::double precision').format(Identifier(column_name)) if data_type == 'numeric' else Identifier(column_name)
+            for column_name, data_type in columns
+        )
+
+        row_count = 0
+        # A named cursor streams the table from the server instead of loading it into memory at once
+        with connection.cursor(name=f'mirror_{table_name}') as cursor:
+            cursor.itersize = self._batch_size
+            cursor.execute(SQL('SELECT {} FROM {}').format(select_columns, Identifier(table_name)))
+
+            while rows := cursor.fetchmany(self._batch_size):
+                batch = pd.DataFrame(rows, columns=column_names)
+                mirror.register('mirror_batch', batch)
+                mirror.execute(f'INSERT INTO "{table_name}" SELECT * FROM mirror_batch')
+                mirror.unregister('mirror_batch')
+                row_count += len(rows)
+
+        return row_count
+
+    def write_mirror(self)->Path:
+        """
+        Copy every table that exists in the database into a new mirror and replace the previous one.
+
+        ### Arguments
+        No outside arguments
+
+        ### External Effects
+        Writes the DuckDB file at the mirror path
+
+        ### Returns
+        ``Path`` -- Path of the written mirror
+        """
+        # Optional dependency, only needed when a mirror is configured
+        import duckdb
+
+        temporary_path = self._mirror_path.with_name(f'{self._mirror_path.name}.tmp')
+        temporary_path.unlink(missing_ok=True)
+        self._mirror_path.parent.mkdir(parents=True, exist_ok=True)
+
+        print(f"Writing analytics mirror {self._mirror_path}")
+        with connect(self._db_connection_string) as connection:
+            mirror = duckdb.connect(str(temporary_path))
+            try:
+                with connection.cursor() as cursor:
+                    table_columns = {table_name: self._return_columns(cursor, table_name) for table_name in self._table_names}
+
+                for table_name, columns in tqdm.tqdm(table_columns.items()):
+                    if len(columns) > 0:
+                        self._copy_table(connection, mirror, table_name, columns)
+
+                mirror.execute('CHECKPOINT')
+            finally:
+                mirror.close()
+
+        os.replace(temporary_path, self._mirror_path)
+        return self._mirror_path
@@ -1,9 +1,10 @@
 from typing import Protocol, Any
 from .types_providers import BaseFolderValidator
 from .tables_providers import PredefinedTableNames, StudiesTableColumns, StudiesDirectionsTableColumns, PredefinedTableLabels, MovementsDirectionsTableColumns
-from .tables_providers import GranularCountsTableColumns, MovementVehiclesTableColumns
+from .tables_providers import GranularCountsTableColumns, MovementVehiclesTableColumns, StudyChecksumsTableColumns
 from .database_providers import DatabaseConnection, DatabaseUpdater
-from .extraction_providers import StudiesExtractor, DirectionsExtractor, MovementsExtractor, GranularExtractor
+from .extraction_providers import StudiesExtractor, DirectionsExtractor, MovementsExtractor, GranularExtractor, ChecksumExtractor, StudyChecksumFields
+from .reconciliation_providers import ExpectedTotalsExtractor, ExpectedTotals
 import tqdm
 
 
@@ -20,8 +21,17 @@ class TransactionContext:
         self._studies_direction_movement_id_mapping : dict[tuple,int] = {}
         self._studies_dir_mov_veh_id_mapping : dict[tuple,int] = {}
         
+        # Totals of the files read during this run, compared with the database once ingestion has finished
+        self._expected_totals : list[ExpectedTotals] = []
+        
         self._db_connection = db_connection
 
+    def add_expected_totals(self, expected_totals: ExpectedTotals)->None:
+        self._expected_totals.append(expected_totals)
+    
+    def get_expected_totals(self)->list[ExpectedTotals]:
+        return list(self._expected_totals)
+
     def update_dir_mov_veh_id_mapping(self, miovision_id: int, direction_name: str, movement_name : str, vehicle_name: str, id: int) -> None:
         key = (miovision_id,direction_name,movement_name,vehicle_name)
         self._studies_dir_mov_veh_id_mapping[key] = id
@@ -146,14 +156,14 @@ class CoreDataWriter:
 
 class StudiesDirectionsProvider:
     def __init__(self, base_validator: BaseFolderValidator, context: TransactionContext, database_connection : DatabaseUpdater, directions_extractor : DirectionsExtractor) -> None:
-        self._paths = base_validator.get_files()
+        self._base_validator = base_validator
         self._context = context
         self._db_connection = database_connection
         self._extractor = directions_extractor
     
     def write_data(self)->None:
         print(f"Populating {PredefinedTableNames.studies_directions.value}")
-        for path in tqdm.tqdm(self._paths):
+        for path in tqdm.tqdm(self._base_validator.iter_files()):
             directions = self._extractor.extract_fields(path=path)
             for direction in directions:
                 id = self._db_connection.update_db_and_return_id(
@@ -173,14 +183,14 @@ class StudiesDirectionsProvider:
 
 class DirectionsMovementsProvider:
     def __init__(self, base_validator: BaseFolderValidator, db_connection: DatabaseUpdater, extractor: MovementsExtractor, context: TransactionContext) -> None:
-        self._paths = base_validator.get_files()
+        self._base_validator = base_validator
         self._db_connection = db_connection
         self._extractor = extractor
         self._context = context
     
     def write_data(self)->None:
         print(f"Populating {PredefinedTableNames.directions_movements.value}")
-        for path in tqdm.tqdm(self._paths):
+        for path in tqdm.tqdm(self._base_validator.iter_files()):
             extracted_data = self._extractor.extract_fields(
                 path,
                 self._context.get_path_directions(str(path))
@@ -207,15 +217,43 @@ class DirectionsMovementsProvider:
                 self._context.update_path_movements_mapping(path=str(path),movement=direction_movement.movement_name)
 
 class VehiclesAndGranularCountsProvider:
-    def __init__(self, context: TransactionContext, db_connection: DatabaseUpdater, base_validator: BaseFolderValidator, extractor: GranularExtractor) -> None:
-        self._paths = base_validator.get_files()
+    def __init__(self, context: TransactionContext, db_connection: DatabaseUpdater, base_validator: BaseFolderValidator, extractor: GranularExtractor,
+                 checksum_extractor: ChecksumExtractor | None = None, expected_totals_extractor: ExpectedTotalsExtractor | None = None) -> None:
+        self._base_validator = base_validator
         self._context = context
         self._db_connection = db_connection
         self._extractor = extractor
+        self._checksum_extractor = checksum_extractor
+        self._expected_totals_extractor = expected_totals_extractor
+    
+    def _write_checksums(self, checksums: list[StudyChecksumFields])->None:
+        for checksum in checksums:
+            # Identical checksums from an earlier run are not written twice
+            self._db_connection.update_db_and_return_id(
+                table_name=PredefinedTableNames.study_checksums.value,
+                labels=[
+                    StudyChecksumsTableColumns.miovision_id.value,
+                    StudyChecksumsTableColumns.direction_name.value,
+                    StudyChecksumsTableColumns.movement_name.value,
+                    StudyChecksumsTableColumns.vehicle_name.value,
+                    StudyChecksumsTableColumns.row_count.value,
+                    StudyChecksumsTableColumns.count_sum.value,
+                    StudyChecksumsTableColumns.content_hash.value
+                ],
+                values=[
+                    checksum.miovision_id,
+                    checksum.direction_name,
+                    checksum.movement_name,
+                    checksum.vehicle_name,
+                    checksum.row_count,
+                    checksum.count_sum,
+                    checksum.content_hash
+                ]
+            )
     
     def write_data(self)->None:
         print(f"Populating {PredefinedTableNames.movements_vehicles.value} and {PredefinedTableNames.granular_count.value}.")
-        for path in tqdm.tqdm(self._paths):
+        for path in tqdm.tqdm(self._base_validator.iter_files()):
             vehicle_granular_counts = self._extractor.extract_fields(
                 path=path,
                 directions=self._context.get_path_directions(path=str(path)),
@@ -223,6 +261,7 @@ class VehiclesAndGranularCountsProvider:
                 vehicles=self._context.get_all_vehicles()
             )
             
+            granular_rows : list[list[Any]] = []
             for vehicle_granular_count in vehicle_granular_counts:
                 try:
                     movement_vehicle_id = self._context.get_movement_vehicle_id(
@@ -251,30 +290,41 @@ class VehiclesAndGranularCountsProvider:
                                                                 vehicle_name=vehicle_granular_count.vehicle_name,
                                                                 id=int(movement_vehicle_id))
                     
-                self._db_connection.update_db(
-                        table_name=PredefinedTableNames.granular_count.value,
-                        labels=[
-                            GranularCountsTableColumns.movement_vehicle_id.value,
-                            GranularCountsTableColumns.time_stamp.value,
-                            GranularCountsTableColumns.traffic_count.value
-                        ],
-                        values=[
-                            movement_vehicle_id,
-                            vehicle_granular_count.time.time(),
-                            vehicle_granular_count.traffic_count
-                        ]
-                    )
+                granular_rows.append([
+                    movement_vehicle_id,
+                    vehicle_granular_count.time.time(),
+                    vehicle_granular_count.traffic_count
+                ])
+            
+            # One batched insert per file instead of one statement and commit per granular count
+            self._db_connection.update_db_many(
+                table_name=PredefinedTableNames.granular_count.value,
+                labels=[
+                    GranularCountsTableColumns.movement_vehicle_id.value,
+                    GranularCountsTableColumns.time_stamp.value,
+                    GranularCountsTableColumns.traffic_count.value
+                ],
+                rows=granular_rows
+            )
+            
+            if self._checksum_extractor is not None:
+                # Computed from the rows just written, so verification needs no Excel parsing
+                self._write_checksums(self._checksum_extractor.extract_fields(vehicle_granular_counts))
+            
+            if self._expected_totals_extractor is not None:
+                # Directional totals come from the counts extracted above, only the breakdown sheet is read again
+                self._context.add_expected_totals(self._expected_totals_extractor.extract_from_granular_counts(path, vehicle_granular_counts))
 
 class StudiesProvider:
     def __init__(self, base_validator: BaseFolderValidator, database_connection : DatabaseConnection, studies_extractor : StudiesExtractor) -> None:
-        self._paths = base_validator.get_files()
+        self._base_validator = base_validator
         self._db_connection = database_connection
         self._studies_extractor = studies_extractor
     
     def write_data(self)->None:
         print(f"Populating {PredefinedTableNames.studies.value}")
         with self._db_connection as connection:
-            for path in tqdm.tqdm(self._paths):
+            for path in tqdm.tqdm(self._base_validator.iter_files()):
                 study_fields = self._studies_extractor.extract_fields(path)
                 
                 table_name=PredefinedTableNames.studies.value
@@ -1,7 +1,13 @@
 from typing import Protocol, Self, Any
 from psycopg2 import connect, sql
-from .tables_providers import Table
+from psycopg2.extras import execute_values
+from datetime import date, datetime, time
+from decimal import Decimal
+from pathlib import Path
+from .tables_providers import Table, SchemaObject, DataGenerationTableColumns
 from .types_providers import BaseTypeConfiguration
+import re
+import sqlite3
 import tqdm
 
 
@@ -16,11 +22,17 @@ class DatabaseConnection(Protocol):
     
     def insert_new_information(self,table_name:str,labels:list[str],values:list[Any])->bool:...
     
+    def insert_many_information(self,table_name:str,labels:list[str],rows:list[list[Any]])->bool:...
+    
     def create_table(self,query:sql.Composed)->bool:...
     
+    def create_schema_object(self,schema_object:SchemaObject)->bool:...
+    
     def is_existing_attr_in_table(self, attr_name: str, attr_value: str, table_name: str)->bool:...
     
     def are_existing_attributes_in_table(self, attr_labels : list[str], attr_values: list[Any], table_name: str)->bool:...
+    
+    def execute_query(self, query: sql.Composed, values: list[Any] | None = None)->list[tuple]:...
 
 class PostgresDatabaseConnection:
     def __init__(self,connection_string:str) -> None:
@@ -56,6 +68,36 @@ class PostgresDatabaseConnection:
             print(f'Error occured when trying to insert into {table_name}: {e}')
             return False
     
+    def insert_many_information(self,table_name:str,labels:list[str],rows:list[list[Any]])->bool:
+        """ Inserts many rows in batched statements instead of one statement per row.
+        
+        ### Arguments
+        ``table_name`` -- Table to be inserted into
+        
+        ``labels`` -- Columns of the values in each row
+        
+        ``rows`` -- Values of each row, in the order of ``labels``
+        
+        ### External Effects
+        Rows are inserted into the table, to be committed by the caller
+        
+        ### Returns
+        ``True`` if all rows were inserted, ``False`` otherwise
+        """
+        try:
+            query = sql.SQL("INSERT INTO {} ({}) VALUES %s").format(
+                sql.Identifier(table_name),
+                sql.SQL(',').join(map(sql.Identifier, labels))
+            )
+            execute_values(self.cursor,query,rows,page_size=1000)
+            if not self.context_manager_used:
+                print('[WARNING] ContextManager not used for DatabaseConnection. Changes may not be commited. \nCall commit() explicity to commit changes.')
+            
+            return True
+        except Exception as e:
+            print(f'Error occured when trying to insert into {table_name}: {e}')
+            return False
+    
     def commit(self)->None:
         self.connection.commit()
         return
@@ -106,6 +148,9 @@ class PostgresDatabaseConnection:
             print(f'Exception occured when: {e}')
             return False
     
+    def create_schema_object(self,schema_object:SchemaObject)->bool:
+        return self.create_table(schema_object.get_initialization_query())
+    
     def is_existing_attr_in_table(self, attr_name: str, attr_value: str, table_name: str)->bool:
         """ Checks if the given attribute name and value pair exist in the given table.
         
@@ -167,10 +212,223 @@ class PostgresDatabaseConnection:
             
         return self.cursor.fetchall()
 
+    def execute_query(self, query: sql.Composed, values: list[Any] | None = None)->list[tuple]:
+        """ Runs a read-only query and returns all of its rows.
+        
+        ### Arguments
+        ``query`` -- Query to be run
+        
+        ``values`` -- Values bound to the placeholders of the query
+        
+        ### External Effects
+        None
+        
+        ### Returns
+        ``list[tuple]`` -- Rows returned by the query
+        """
+        self.cursor.execute(query,values)
+        return self.cursor.fetchall()
+
+def render_sqlite_query(query:sql.Composable)->str:
+    """ Renders a query composed with ``psycopg2.sql`` for SQLite, with ``?`` placeholders.
+    
+    ### Arguments
+    ``query`` -- Query built from ``SQL``, ``Identifier``, ``Literal`` and ``Composed`` parts
+    
+    ### External Effects
+    None
+    
+    ### Returns
+    ``str`` -- The query in SQLite syntax
+    """
+    if isinstance(query,sql.Composed):
+        return ''.join(render_sqlite_query(part) for part in query.seq)
+    if isinstance(query,sql.SQL):
+        return re.sub(r'%%|%s', lambda match: '%' if match.group() == '%%' else '?', query.string)
+    if isinstance(query,sql.Identifier):
+        return '.'.join('"{}"'.format(name.replace('"','""')) for name in query.strings)
+    if isinstance(query,sql.Literal):
+        value = query.wrapped
+        if value is None:
+            return 'NULL'
+        if isinstance(value,(int,float)):
+            return str(value)
+        return "'{}'".format(str(value).replace("'","''"))
+    if isinstance(query,sql.Placeholder):
+        return '?' if query.name is None else f':{query.name}'
+    
+    raise TypeError(f'Cannot render {type(query).__name__} for SQLite')
+
+def _adapt_sqlite_value(value:Any)->Any:
+    # Dates and times are stored as ISO strings, which compare the same way as the Postgres types
+    if isinstance(value,(date,datetime,time)):
+        return value.isoformat()
+    if isinstance(value,Decimal):
+        return float(value)
+    if hasattr(value,'item'):
+        # numpy scalars read from the Excel files
+        return value.item()
+    return value
+
+class SQLiteDatabaseConnection:
+    """ Embedded backend with the same behaviour as ``PostgresDatabaseConnection``, for tests, benchmarks and dry runs.
+    
+    The table definitions are shared with Postgres: identity columns become SQLite rowid aliases. Schema objects
+    that need Postgres (functions, generated columns) are skipped, indexes are created without ``INCLUDE`` columns.
+    """
+    def __init__(self,database_path:str | Path = ':memory:') -> None:
+        self.connection = sqlite3.connect(database_path)
+        self.connection.execute('PRAGMA foreign_keys = ON')
+        self.cursor = self.connection.cursor()
+        self.context_manager_used = False
+    
+    def __enter__(self):
+        self.context_manager_used = True
+        return self 
+    
+    def __exit__(self, exc_type: str, exc_val: Exception, exc_tb)->None:
+        if not exc_type:
+            self.context_manager_used = False
+            self.commit()
+        else:
+            raise Exception(f'Error occured: {exc_val}')
+    
+    def _execute(self, query:sql.Composable, values:list[Any] | None = None)->sqlite3.Cursor:
+        return self.cursor.execute(render_sqlite_query(query),[_adapt_sqlite_value(value) for value in values or []])
+    
+    def insert_new_information(self,table_name:str,labels:list[str],values:list[Any])->bool:
+        try:
+            query = sql.SQL("INSERT INTO {} ({}) VALUES ({})").format(
+                sql.Identifier(table_name),
+                sql.SQL(',').join(map(sql.Identifier, labels)),
+                sql.SQL(',').join(sql.SQL('%s') for _ in values)
+            )
+            self._execute(query,values)
+            if not self.context_manager_used:
+                print('[WARNING] ContextManager not used for DatabaseConnection. Changes may not be commited. \nCall commit() explicity to commit changes.')
+            
+            return True
+        except Exception as e:
+            print(f'Error occured when trying to insert into {table_name}: {e}')
+            return False
+    
+    def insert_many_information(self,table_name:str,labels:list[str],rows:list[list[Any]])->bool:
+        try:
+            query = sql.SQL("INSERT INTO {} ({}) VALUES ({})").format(
+                sql.Identifier(table_name),
+                sql.SQL(',').join(map(sql.Identifier, labels)),
+                sql.SQL(',').join(sql.SQL('%s') for _ in labels)
+            )
+            self.cursor.executemany(render_sqlite_query(query),([_adapt_sqlite_value(value) for value in row] for row in rows))
+            if not self.context_manager_used:
+                print('[WARNING] ContextManager not used for DatabaseConnection. Changes may not be commited. \nCall commit() explicity to commit changes.')
+            
+            return True
+        except Exception as e:
+            print(f'Error occured when trying to insert into {table_name}: {e}')
+            return False
+    
+    def commit(self)->None:
+        self.connection.commit()
+        return
+    
+    def are_existing_attributes_in_table(self, attr_labels : list[str], attr_values: list[Any], table_name: str)->bool:
+        query = sql.SQL("SELECT 1 FROM {} WHERE {} LIMIT 1").format(
+            sql.Identifier(table_name),
+            sql.SQL(' AND ').join(
+                [sql.SQL("{0} = %s").format(sql.Identifier(label)) for label in attr_labels]
+            )
+        )
+        
+        return self._execute(query,attr_values).fetchone() is not None
+    
+    def is_existing_table(self,table_name:str)->bool:
+        self.cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",(table_name,))
+        return self.cursor.fetchone() is not None
+    
+    def create_table(self,query:sql.Composed)->bool:
+        # Identity columns are declared as the INTEGER primary key, which SQLite numbers itself
+        statement = re.sub(r'INTEGER\s+GENERATED\s+ALWAYS\s+AS\s+IDENTITY','INTEGER',render_sqlite_query(query),flags=re.IGNORECASE)
+        try:
+            self.cursor.executescript(statement)
+            return True
+        except Exception as e:
+            print(f'Exception occured when: {e}')
+            return False
+    
+    def create_schema_object(self,schema_object:SchemaObject)->bool:
+        statement = render_sqlite_query(schema_object.get_initialization_query())
+        
+        if re.search(r'\b(FUNCTION|GENERATED)\b',statement,flags=re.IGNORECASE):
+            print(f'[INFO] {schema_object.get_object_name()} requires Postgres, skipped for SQLite')
+            return True
+        
+        # Covering columns are a Postgres feature, SQLite indexes only the key columns
+        statement = re.sub(r'\s+INCLUDE\s*\([^)]*\)','',statement,flags=re.IGNORECASE)
+        try:
+            self.cursor.executescript(statement)
+            return True
+        except Exception as e:
+            print(f'Exception occured when: {e}')
+            return False
+    
+    def is_existing_attr_in_table(self, attr_name: str, attr_value: str, table_name: str)->bool:
+        if not self.is_existing_table(table_name):
+            raise Exception(f'Table {table_name} does not exist.')
+        
+        return self.are_existing_attributes_in_table([attr_name],[attr_value],table_name)
+    
+    def select_existing_attributes(self, table_name : str, query_attr : list[str],where_labels : list[str] | None = None, where_values : list[Any] | None = None)->list[tuple]:
+        if where_labels is not None and where_values is not None:
+            if len(where_labels) != len(where_values):
+                raise Exception("len() of where_labels must equal that of where_values.")
+            
+            query = sql.SQL("SELECT {} FROM {} WHERE {}").format(
+                sql.SQL(', ').join(map(sql.Identifier,query_attr)),
+                sql.Identifier(table_name),
+                sql.SQL(' AND ').join([
+                    sql.SQL('{} = %s').format(sql.Identifier(label))  
+                    for label in where_labels
+                    ])
+            )
+            
+            return self._execute(query,where_values).fetchall()
+        
+        query = sql.SQL("SELECT {} FROM {}").format(
+            sql.SQL(', ').join(map(sql.Identifier,query_attr)),
+            sql.Identifier(table_name)
+        )
+        
+        return self._execute(query).fetchall()
+    
+    def execute_query(self, query: sql.Composed, values: list[Any] | None = None)->list[tuple]:
+        return self._execute(query,values).fetchall()
+
+def create_database_connection(connection_string:str)->DatabaseConnection:
+    """ Opens a connection on the backend named by the connection string.
+    
+    ### Arguments
+    ``connection_string`` -- ``sqlite:///<path>`` (or ``sqlite://`` for an in-memory database) for the embedded
+    backend, a Postgres connection string otherwise
+    
+    ### External Effects
+    None
+    
+    ### Returns
+    ``DatabaseConnection`` -- Connection on the matching backend
+    """
+    sqlite_prefix = 'sqlite://'
+    if connection_string.startswith(sqlite_prefix):
+        database_path = connection_string.removeprefix(sqlite_prefix).removeprefix('/')
+        return SQLiteDatabaseConnection(database_path or ':memory:')
+    
+    return PostgresDatabaseConnection(connection_string)
+
 class DatabaseTableWriter:
-    def __init__(self,database_connection:DatabaseConnection,tables:list[Table]) -> None:
+    def __init__(self,database_connection:DatabaseConnection,tables:list[Table],schema_objects:list[SchemaObject] | None = None) -> None:
         self.connection = database_connection
         self.tables = tables
+        self.schema_objects = schema_objects if schema_objects is not None else []
     
     def create_tables(self)->None:
         with self.connection:
@@ -182,6 +440,11 @@ class DatabaseTableWriter:
                 
                 if not is_success:
                     raise Exception(f'Table creation query failed for table {table.get_table_name()}')
+            
+            # Schema objects depend on the tables and are written to be safe to create again
+            for schema_object in self.schema_objects:
+                if not self.connection.create_schema_object(schema_object):
+                    raise Exception(f'Creation query failed for {schema_object.get_object_name()}')
 
 class DatabaseTypesWriter:
     def __init__(self,database_connection:DatabaseConnection,providers_info:list[BaseTypeConfiguration]) -> None:
@@ -248,4 +511,57 @@ class DatabaseUpdater:
                 labels=labels,
                 values=values
             )
-        
\ No newline at end of file
+    
+    def update_db_many(self,table_name : str, labels : list[str], rows : list[list[Any]])->None:
+        with self._db_connection as connection:
+            is_success = connection.insert_many_information(
+                table_name=table_name,
+                labels=labels,
+                rows=rows
+            )
+        
+        if not is_success:
+            raise Exception(f'Bulk insert of {len(rows)} rows into {table_name} failed')
+        
+
+class DataGenerationWriter:
+    """Records a new data generation after every ingestion so readers can tell when cached results are stale."""
+    def __init__(self, db_connection: DatabaseConnection, data_generation_table: Table) -> None:
+        self._db_connection = db_connection
+        self._table = data_generation_table
+    
+    def bump_generation(self)->int:
+        """Insert a row holding the next generation number, creating the table first if needed.
+        
+        ### Arguments
+        No outside arguments
+        
+        ### External Effects
+        Writes into the data generation table of the linked database
+        
+        ### Returns
+        ``int`` -- The new generation number
+        """
+        table_name = self._table.get_table_name()
+        
+        with self._db_connection as connection:
+            if not connection.is_existing_table(table_name):
+                is_success = connection.create_table(self._table.get_initialization_query())
+                if not is_success:
+                    raise Exception(f'Table creation query failed for table {table_name}')
+            
+            existing_generations = connection.select_existing_attributes(
+                table_name=table_name,
+                query_attr=[DataGenerationTableColumns.generation.value]
+            )
+            next_generation = max([row[0] for row in existing_generations], default=0) + 1
+            
+            is_success = connection.insert_new_information(
+                table_name=table_name,
+                labels=[DataGenerationTableColumns.generation.value],
+                values=[next_generation]
+            )
+            if not is_success:
+                raise Exception(f'Data generation {next_generation} not written into {table_name}')
+        
+        return next_generation
\ No newline at end of file
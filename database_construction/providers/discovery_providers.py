@@ -0,0 +1,133 @@
+from concurrent.futures import ThreadPoolExecutor, Future
+from collections import deque
+from dataclasses import dataclass
+from fnmatch import fnmatch
+from pathlib import Path
+from typing import Iterator
+import hashlib
+import os
+
+FINGERPRINT_CHUNK_BYTES = 1024 * 1024
+
+@dataclass(frozen=True)
+class DiscoveredFile:
+    path : Path
+    size : int
+    modified_time : float
+    # md5 of the file contents, unchanged files keep their fingerprint across renames and moves
+    fingerprint : str
+
+def fingerprint_file(path:Path)->DiscoveredFile:
+    """
+    Stat the file and hash its contents.
+
+    ### Arguments
+    ``path`` -- File to be fingerprinted
+
+    ### External Effects
+    None
+
+    ### Returns
+    ``DiscoveredFile`` -- Size, modification time and fingerprint of the file
+    """
+    stat_result = path.stat()
+    content_hash = hashlib.md5()
+    with open(path, 'rb') as file:
+        while chunk := file.read(FINGERPRINT_CHUNK_BYTES):
+            content_hash.update(chunk)
+
+    return DiscoveredFile(path=path, size=stat_result.st_size, modified_time=stat_result.st_mtime, fingerprint=content_hash.hexdigest())
+
+class FileDiscoveryProvider:
+    """
+    Lazily walks one or more folder trees and yields the files matching the include patterns, so that
+    files can be processed while the rest of a large (e.g. network mounted) archive is still being listed.
+    """
+    def __init__(self, roots:list[Path], include_patterns:list[str], exclude_patterns:list[str] | None = None,
+                 recursive:bool = True, max_workers:int = 8) -> None:
+        for root in roots:
+            if not root.is_dir():
+                raise Exception(f'{root} is not a directory')
+
+        self._roots = roots
+        self._include_patterns = include_patterns
+        self._exclude_patterns = exclude_patterns if exclude_patterns is not None else []
+        self._recursive = recursive
+        self._max_workers = max_workers
+
+    def _is_excluded(self, relative_path:str, name:str)->bool:
+        return any(fnmatch(name, pattern) or fnmatch(relative_path, pattern) for pattern in self._exclude_patterns)
+
+    def _is_included(self, relative_path:str, name:str)->bool:
+        return any(fnmatch(name, pattern) or fnmatch(relative_path, pattern) for pattern in self._include_patterns)
+
+    def iter_paths(self)->Iterator[Path]:
+        """
+        Yield the matching files of every root, in name order within each folder. Files reachable
+        from more than one root are only yielded once.
+
+        ### Arguments
+        No outside arguments
+
+        ### External Effects
+        None
+
+        ### Returns
+        ``Iterator[Path]`` -- Matching files, yielded as they are found
+        """
+        seen_paths : set[Path] = set()
+
+        for root in self._roots:
+            # Folders still to be listed, with their path relative to the root
+            pending_folders : list[tuple[Path, str]] = [(root, '')]
+
+            while pending_folders:
+                folder, relative_folder = pending_folders.pop()
+                with os.scandir(folder) as entries:
+                    sorted_entries = sorted(entries, key=lambda entry: entry.name)
+
+                subfolders : list[tuple[Path, str]] = []
+                for entry in sorted_entries:
+                    relative_path = f'{relative_folder}{entry.name}'
+                    if self._is_excluded(relative_path, entry.name):
+                        continue
+
+                    if entry.is_dir(follow_symlinks=False):
+                        if self._recursive:
+                            subfolders.append((Path(entry.path), f'{relative_path}/'))
+                    elif entry.is_file() and self._is_included(relative_path, entry.name):
+                        path = Path(entry.path)
+                        resolved_path = path.resolve()
+                        if resolved_path not in seen_paths:
+                            seen_paths.add(resolved_path)
+                            yield path
+
+                # Reversed so that the stack lists subfolders in name order
+                pending_folders.extend(reversed(subfolders))
+
+    def iter_files(self)->Iterator[DiscoveredFile]:
+        """
+        Yield the matching files with their fingerprints, in the order of ``iter_paths``. Files are stat-ed
+        and hashed in a thread pool, at most a few files ahead of the consumer.
+
+        ### Arguments
+        No outside arguments
+
+        ### External Effects
+        None
+
+        ### Returns
+        ``Iterator[DiscoveredFile]`` -- Fingerprinted files, yielded as they are ready
+        """
+        max_pending = self._max_workers * 2
+
+        with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+            pending : deque[Future[DiscoveredFile]] = deque()
+
+            for path in self.iter_paths():
+                pending.append(executor.submit(fingerprint_file, path))
+                if len(pending) >= max_pending:
+                    yield pending.popleft().result()
+
+            while pending:
+                yield pending.popleft().result()
@@ -3,6 +3,7 @@ from typing import Protocol
 from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
+import hashlib
 
 @dataclass
 class StudiesFields:
@@ -50,6 +51,16 @@ class GranularFields:
     time : datetime
     traffic_count : int
     
+@dataclass
+class StudyChecksumFields:
+    miovision_id : int
+    direction_name : str
+    movement_name : str
+    vehicle_name : str
+    row_count : int
+    count_sum : int
+    content_hash : str
+
 class StudiesExtractor:
     def __init__(self) -> None:
         pass
@@ -221,4 +232,35 @@ class GranularExtractor:
                     ))
                         
                         
-        return granular_counts        
\ No newline at end of file
+        return granular_counts
+
+class ChecksumExtractor:
+    def __init__(self) -> None:
+        pass
+    
+    @staticmethod
+    def content_hash(time_counts : list[tuple[datetime,int]]) -> str:
+        # Same digest as md5(string_agg(time_stamp::text || ':' || traffic_count::text, ',' ORDER BY time_stamp, traffic_count)) in Postgres,
+        # time_stamp is a TIME column so rows of a multi-day study are ordered by time of day only
+        content = ','.join(f'{time.time().isoformat()}:{int(traffic_count)}' for time, traffic_count in sorted(time_counts, key=lambda time_count: (time_count[0].time(), int(time_count[1]))))
+        return hashlib.md5(content.encode('utf-8')).hexdigest()
+    
+    def extract_fields(self, granular_counts : list[GranularFields]) -> list[StudyChecksumFields]:
+        grouped_counts : dict[tuple[int,str,str,str],list[tuple[datetime,int]]] = {}
+        
+        for granular_count in granular_counts:
+            key = (granular_count.miovision_id, granular_count.direction_name, granular_count.movement_name, granular_count.vehicle_name)
+            grouped_counts.setdefault(key, []).append((granular_count.time, granular_count.traffic_count))
+        
+        return [
+            StudyChecksumFields(
+                miovision_id=miovision_id,
+                direction_name=direction_name,
+                movement_name=movement_name,
+                vehicle_name=vehicle_name,
+                row_count=len(time_counts),
+                count_sum=int(sum(traffic_count for _, traffic_count in time_counts)),
+                content_hash=self.content_hash(time_counts)
+            )
+            for (miovision_id, direction_name, movement_name, vehicle_name), time_counts in grouped_counts.items()
+        ]
@@ -0,0 +1,416 @@
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from enum import StrEnum
+from pathlib import Path
+from psycopg2.sql import SQL, Identifier, Placeholder
+from .database_providers import DatabaseConnection
+from .extraction_providers import MiovisionExtractor, GranularFields
+from .tables_providers import PredefinedTableNames, PredefinedTableLabels, StudiesTableColumns, StudiesDirectionsTableColumns
+from .tables_providers import MovementsDirectionsTableColumns, MovementVehiclesTableColumns, GranularCountsTableColumns, StudyChecksumsTableColumns
+import pandas as pd
+
+class ReconciliationColumns(StrEnum):
+    miovision_id = 'miovision_id'
+    direction_name = 'direction_name'
+    vehicle_name = 'vehicle_name'
+    expected_count = 'expected_count'
+    database_count = 'database_count'
+    difference = 'difference'
+    found_in = 'found_in'
+
+STUDY_KEYS = [ReconciliationColumns.miovision_id.value]
+DIRECTION_VEHICLE_KEYS = [ReconciliationColumns.miovision_id.value, ReconciliationColumns.direction_name.value, ReconciliationColumns.vehicle_name.value]
+
+@dataclass
+class ExpectedTotals:
+    miovision_id : int
+    study_total : int
+    # One row per direction and vehicle class: direction_name, vehicle_name, expected_count
+    direction_vehicle_totals : pd.DataFrame
+
+@dataclass
+class ReconciliationReport:
+    # Every compared key with both counts, see find_total_discrepancies()
+    study_totals : pd.DataFrame
+    direction_vehicle_totals : pd.DataFrame
+
+    @property
+    def study_discrepancies(self)->pd.DataFrame:
+        return self.study_totals[self.study_totals[ReconciliationColumns.difference.value] != 0]
+
+    @property
+    def direction_vehicle_discrepancies(self)->pd.DataFrame:
+        return self.direction_vehicle_totals[self.direction_vehicle_totals[ReconciliationColumns.difference.value] != 0]
+
+    def is_consistent(self)->bool:
+        return self.study_discrepancies.empty and self.direction_vehicle_discrepancies.empty
+
+class ExpectedTotalsExtractor:
+    def __init__(self, total_volume_breakdown_sheet:str = 'Total Volume Class Breakdown') -> None:
+        self._total_volume_breakdown_sheet = total_volume_breakdown_sheet
+
+    def _extract_study_total(self, breakdown_rows:pd.DataFrame)->int:
+        # Rows of the breakdown sheet read without a header, the first column holds the row labels
+        total_volume_row_label = 'Grand Total'
+
+        total_values_df = breakdown_rows[breakdown_rows[breakdown_rows.columns[0]] == total_volume_row_label][breakdown_rows.columns[1:]]
+        total_values_series : pd.Series[float] = pd.to_numeric(total_values_df.iloc[0])
+
+        # Last value of the series is double counted in the sum, so need to substract it
+        return int(total_values_series.sum() - (2 * total_values_series.iloc[-1]))
+
+    def _extract_direction_vehicle_totals(self, sheets:dict[str,pd.DataFrame])->pd.DataFrame:
+        direction_type_indicator = 'bound'
+        # Rows of the directional sheets read without a header: title, movements, vehicle classes, then the granular counts
+        vehicle_row_index = 2
+        direction_totals : list[pd.DataFrame] = []
+
+        for sheet_name, sheet_rows in sheets.items():
+            if direction_type_indicator not in sheet_name:
+                continue
+
+            count_columns = sheet_rows.iloc[:, 1:]
+            vehicle_names = count_columns.iloc[vehicle_row_index]
+            granular_counts = count_columns.iloc[vehicle_row_index + 1:].astype(int)
+
+            direction_totals.append(pd.DataFrame({
+                ReconciliationColumns.direction_name.value: sheet_name,
+                ReconciliationColumns.vehicle_name.value: vehicle_names.to_numpy(),
+                ReconciliationColumns.expected_count.value: granular_counts.sum(axis=0).to_numpy()
+            }))
+
+        return self._sum_direction_vehicle_totals(direction_totals)
+
+    def _sum_direction_vehicle_totals(self, direction_totals:list[pd.DataFrame])->pd.DataFrame:
+        if not direction_totals:
+            return pd.DataFrame(columns=[ReconciliationColumns.direction_name.value, ReconciliationColumns.vehicle_name.value, ReconciliationColumns.expected_count.value])
+
+        return (pd.concat(direction_totals, ignore_index=True)
+                  .groupby([ReconciliationColumns.direction_name.value, ReconciliationColumns.vehicle_name.value], as_index=False)
+                  [ReconciliationColumns.expected_count.value].sum())
+
+    def extract_fields(self, path:Path)->ExpectedTotals:
+        """
+        Read the workbook once and extract the totals of its breakdown and directional sheets.
+
+        ### Arguments
+        ``path`` -- Miovision file
+
+        ### External Effects
+        None
+
+        ### Returns
+        ``ExpectedTotals`` -- Study total and direction/vehicle class totals of the file
+        """
+        try:
+            sheets = pd.read_excel(path, sheet_name=None, header=None)
+
+            return ExpectedTotals(
+                miovision_id=int(MiovisionExtractor.get_miovision_id_string(path)),
+                study_total=self._extract_study_total(sheets[self._total_volume_breakdown_sheet]),
+                direction_vehicle_totals=self._extract_direction_vehicle_totals(sheets)
+            )
+        except Exception as e:
+            raise Exception(f'Error occurred when extracting expected totals of {path}: {e}')
+
+    def extract_from_granular_counts(self, path:Path, granular_counts:list[GranularFields])->ExpectedTotals:
+        """
+        Extract the expected totals of a file whose granular counts were already extracted for ingestion, only the
+        breakdown sheet is read.
+
+        ### Arguments
+        ``path`` -- Miovision file
+
+        ``granular_counts`` -- Granular counts extracted from the directional sheets of the file
+
+        ### External Effects
+        None
+
+        ### Returns
+        ``ExpectedTotals`` -- Study total of the breakdown sheet and direction/vehicle class totals of the granular counts
+        """
+        try:
+            breakdown_rows = pd.read_excel(path, sheet_name=self._total_volume_breakdown_sheet, header=None)
+
+            granular_df = pd.DataFrame({
+                ReconciliationColumns.direction_name.value: [count.direction_name for count in granular_counts],
+                ReconciliationColumns.vehicle_name.value: [count.vehicle_name for count in granular_counts],
+                ReconciliationColumns.expected_count.value: [int(count.traffic_count) for count in granular_counts]
+            })
+
+            return ExpectedTotals(
+                miovision_id=int(MiovisionExtractor.get_miovision_id_string(path)),
+                study_total=self._extract_study_total(breakdown_rows),
+                direction_vehicle_totals=self._sum_direction_vehicle_totals([granular_df] if granular_counts else [])
+            )
+        except Exception as e:
+            raise Exception(f'Error occurred when extracting expected totals of {path}: {e}')
+
+def extract_expected_totals(paths:list[Path], extractor:ExpectedTotalsExtractor | None = None, max_workers:int | None = None)->list[ExpectedTotals]:
+    """
+    Extract the expected totals of Miovision files outside of an ingestion run.
+
+    ### Arguments
+    ``paths`` -- Miovision files
+
+    ``extractor`` -- Extractor to be used, one with the default breakdown sheet name otherwise
+
+    ``max_workers`` -- Processes reading the workbooks, 1 reads them in the calling process
+
+    ### External Effects
+    None
+
+    ### Returns
+    ``list[ExpectedTotals]`` -- Totals of every file, in the order of ``paths``
+    """
+    extractor = extractor if extractor is not None else ExpectedTotalsExtractor()
+
+    # Reading the workbooks dominates the run time, so the files are read in parallel processes
+    if max_workers == 1 or len(paths) <= 1:
+        return [extractor.extract_fields(path) for path in paths]
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(extractor.extract_fields, paths))
+
+class DatabaseTotalsProvider:
+    def __init__(self, db_connection:DatabaseConnection) -> None:
+        self._db_connection = db_connection
+
+        # Totals of every study, direction and vehicle class in one grouped statement. The studies are bound as an
+        # IN list rather than ``= ANY(array)``, so the statement also runs on the SQLite backend
+        self._query_template = SQL("""
+            SELECT s.{studies_miovision_id}, dt.{direction_name}, vt.{vehicle_name}, SUM(g.{traffic_count})
+            FROM {studies} s
+            JOIN {studies_directions} sd ON s.{studies_miovision_id} = sd.{sd_miovision_id}
+            JOIN {direction_types} dt ON dt.id = sd.{direction_type_id}
+            JOIN {directions_movements} dm ON sd.id = dm.{study_direction_id}
+            JOIN {movements_vehicles} mv ON dm.id = mv.{direction_movement_id}
+            JOIN {vehicles_types} vt ON vt.id = mv.{vehicle_type_id}
+            JOIN {granular_count} g ON mv.id = g.{movement_vehicle_id}
+            WHERE s.{studies_miovision_id} IN ({miovision_ids})
+            GROUP BY s.{studies_miovision_id}, dt.{direction_name}, vt.{vehicle_name};
+        """)
+        self._query_identifiers = dict(
+            studies_miovision_id = Identifier(StudiesTableColumns.miovision_id.value),
+            direction_name = Identifier(PredefinedTableLabels.direction_types.value),
+            vehicle_name = Identifier(PredefinedTableLabels.vehicles_types.value),
+            traffic_count = Identifier(GranularCountsTableColumns.traffic_count.value),
+            studies = Identifier(PredefinedTableNames.studies.value),
+            studies_directions = Identifier(PredefinedTableNames.studies_directions.value),
+            sd_miovision_id = Identifier(StudiesDirectionsTableColumns.miovision_id.value),
+            direction_types = Identifier(PredefinedTableNames.direction_types.value),
+            direction_type_id = Identifier(StudiesDirectionsTableColumns.direction_type_id.value),
+            directions_movements = Identifier(PredefinedTableNames.directions_movements.value),
+            study_direction_id = Identifier(MovementsDirectionsTableColumns.study_direction_id.value),
+            movements_vehicles = Identifier(PredefinedTableNames.movements_vehicles.value),
+            direction_movement_id = Identifier(MovementVehiclesTableColumns.direction_movement_id.value),
+            vehicles_types = Identifier(PredefinedTableNames.vehicles_types.value),
+            vehicle_type_id = Identifier(MovementVehiclesTableColumns.vehicle_type_id.value),
+            granular_count = Identifier(PredefinedTableNames.granular_count.value),
+            movement_vehicle_id = Identifier(GranularCountsTableColumns.movement_vehicle_id.value)
+        )
+
+    def return_direction_vehicle_totals(self, miovision_ids:list[int])->pd.DataFrame:
+        """
+        Sum the granular counts of the given studies per direction and vehicle class.
+
+        ### Arguments
+        ``miovision_ids`` -- Studies to be summed
+
+        ### External Effects
+        None
+
+        ### Returns
+        ``pd.DataFrame`` -- Columns miovision_id, direction_name, vehicle_name and database_count
+        """
+        query = self._query_template.format(
+            miovision_ids = SQL(', ').join([Placeholder()] * len(miovision_ids)),
+            **self._query_identifiers
+        )
+        rows = self._db_connection.execute_query(query, [int(miovision_id) for miovision_id in miovision_ids])
+
+        return pd.DataFrame(rows, columns=[*DIRECTION_VEHICLE_KEYS, ReconciliationColumns.database_count.value]).astype(
+            {ReconciliationColumns.miovision_id.value: int, ReconciliationColumns.database_count.value: int}
+        )
+
+def find_total_discrepancies(expected:pd.DataFrame, actual:pd.DataFrame, keys:list[str])->pd.DataFrame:
+    """
+    Outer join of expected and database counts on ``keys``; counts missing on one side are taken as 0.
+
+    ### Arguments
+    ``expected`` -- ``keys`` and expected_count columns
+
+    ``actual`` -- ``keys`` and database_count columns
+
+    ``keys`` -- Columns identifying a count
+
+    ### External Effects
+    None
+
+    ### Returns
+    ``pd.DataFrame`` -- ``keys``, expected_count, database_count, difference (database - expected) and found_in
+    (both, expected_only or database_only)
+    """
+    merged = expected.merge(actual, on=keys, how='outer', indicator=ReconciliationColumns.found_in.value)
+    merged[ReconciliationColumns.found_in.value] = merged[ReconciliationColumns.found_in.value].map(
+        {'both': 'both', 'left_only': 'expected_only', 'right_only': 'database_only'}
+    )
+
+    for count_column in (ReconciliationColumns.expected_count.value, ReconciliationColumns.database_count.value):
+        merged[count_column] = merged[count_column].fillna(0).astype(int)
+
+    merged[ReconciliationColumns.difference.value] = merged[ReconciliationColumns.database_count.value] - merged[ReconciliationColumns.expected_count.value]
+
+    columns = [*keys, ReconciliationColumns.expected_count.value, ReconciliationColumns.database_count.value,
+               ReconciliationColumns.difference.value, ReconciliationColumns.found_in.value]
+    return merged[columns].sort_values(keys, ignore_index=True)
+
+class ReconciliationProvider:
+    """Compares the totals of the Excel files with the totals ingested into the database."""
+    def __init__(self, db_connection:DatabaseConnection) -> None:
+        self._database_totals = DatabaseTotalsProvider(db_connection)
+
+    def reconcile(self, expected_totals:list[ExpectedTotals])->ReconciliationReport:
+        """
+        Compare the expected totals of the Excel files with the database totals.
+
+        ### Arguments
+        ``expected_totals`` -- Totals collected during ingestion, or read with ``extract_expected_totals``
+
+        ### External Effects
+        None
+
+        ### Returns
+        ``ReconciliationReport`` -- Study and direction/vehicle class totals of both sides
+        """
+        if len(expected_totals) == 0:
+            raise Exception('No files provided for reconciliation')
+        
+        miovision_ids = [totals.miovision_id for totals in expected_totals]
+
+        database_direction_vehicle_totals = self._database_totals.return_direction_vehicle_totals(miovision_ids)
+        database_study_totals = database_direction_vehicle_totals.groupby(STUDY_KEYS, as_index=False)[ReconciliationColumns.database_count.value].sum()
+
+        expected_study_totals = pd.DataFrame({
+            ReconciliationColumns.miovision_id.value: miovision_ids,
+            ReconciliationColumns.expected_count.value: [totals.study_total for totals in expected_totals]
+        })
+        expected_direction_vehicle_totals = pd.concat(
+            [totals.direction_vehicle_totals.assign(**{ReconciliationColumns.miovision_id.value: totals.miovision_id}) for totals in expected_totals],
+            ignore_index=True
+        ).astype({ReconciliationColumns.miovision_id.value: int, ReconciliationColumns.expected_count.value: int})
+
+        return ReconciliationReport(
+            study_totals=find_total_discrepancies(expected_study_totals, database_study_totals, STUDY_KEYS),
+            direction_vehicle_totals=find_total_discrepancies(expected_direction_vehicle_totals, database_direction_vehicle_totals, DIRECTION_VEHICLE_KEYS)
+        )
+
+class ChecksumVerifier:
+    """Compares the checksums recorded at ingestion with aggregates of the ingested granular counts."""
+    def __init__(self, db_connection:DatabaseConnection) -> None:
+        self._db_connection = db_connection
+
+        # One pass over the granular counts of every checksummed study, keys missing on either side are kept
+        self._query = SQL("""
+            WITH actual AS (
+                SELECT s.{studies_miovision_id} AS miovision_id,
+                       dt.{direction_type_name} AS direction_name,
+                       mt.{movement_type_name} AS movement_name,
+                       vt.{vehicle_type_name} AS vehicle_name,
+                       COUNT(*) AS row_count,
+                       SUM(g.{traffic_count}) AS count_sum,
+                       md5(string_agg(g.{time_stamp}::text || ':' || g.{traffic_count}::text, ',' ORDER BY g.{time_stamp}, g.{traffic_count})) AS content_hash
+                FROM {studies} s
+                JOIN {studies_directions} sd ON s.{studies_miovision_id} = sd.{sd_miovision_id}
+                JOIN {direction_types} dt ON dt.id = sd.{direction_type_id}
+                JOIN {directions_movements} dm ON sd.id = dm.{study_direction_id}
+                JOIN {movement_types} mt ON mt.id = dm.{movement_type_id}
+                JOIN {movements_vehicles} mv ON dm.id = mv.{direction_movement_id}
+                JOIN {vehicles_types} vt ON vt.id = mv.{vehicle_type_id}
+                JOIN {granular_count} g ON mv.id = g.{movement_vehicle_id}
+                WHERE s.{studies_miovision_id} IN (SELECT {c_miovision_id} FROM {study_checksums})
+                GROUP BY 1, 2, 3, 4
+            )
+            SELECT COALESCE(c.{c_miovision_id}, a.miovision_id),
+                   COALESCE(c.{c_direction_name}, a.direction_name),
+                   COALESCE(c.{c_movement_name}, a.movement_name),
+                   COALESCE(c.{c_vehicle_name}, a.vehicle_name),
+                   c.{c_row_count}, a.row_count,
+                   c.{c_count_sum}, a.count_sum,
+                   c.{c_content_hash}, a.content_hash
+            FROM {study_checksums} c
+            FULL OUTER JOIN actual a
+                ON c.{c_miovision_id} = a.miovision_id
+                AND c.{c_direction_name} = a.direction_name
+                AND c.{c_movement_name} = a.movement_name
+                AND c.{c_vehicle_name} = a.vehicle_name
+            WHERE c.id IS NULL
+                OR a.miovision_id IS NULL
+                OR c.{c_row_count} <> a.row_count
+                OR c.{c_count_sum} <> a.count_sum
+                OR c.{c_content_hash} <> a.content_hash
+            ORDER BY 1, 2, 3, 4;
+        """).format(
+            studies_miovision_id = Identifier(StudiesTableColumns.miovision_id.value),
+            direction_type_name = Identifier(PredefinedTableLabels.direction_types.value),
+            movement_type_name = Identifier(PredefinedTableLabels.movement_types.value),
+            vehicle_type_name = Identifier(PredefinedTableLabels.vehicles_types.value),
+            traffic_count = Identifier(GranularCountsTableColumns.traffic_count.value),
+            time_stamp = Identifier(GranularCountsTableColumns.time_stamp.value),
+            studies = Identifier(PredefinedTableNames.studies.value),
+            studies_directions = Identifier(PredefinedTableNames.studies_directions.value),
+            sd_miovision_id = Identifier(StudiesDirectionsTableColumns.miovision_id.value),
+            direction_types = Identifier(PredefinedTableNames.direction_types.value),
+            direction_type_id = Identifier(StudiesDirectionsTableColumns.direction_type_id.value),
+            directions_movements = Identifier(PredefinedTableNames.directions_movements.value),
+            study_direction_id = Identifier(MovementsDirectionsTableColumns.study_direction_id.value),
+            movement_types = Identifier(PredefinedTableNames.movement_types.value),
+            movement_type_id = Identifier(MovementsDirectionsTableColumns.movement_type_id.value),
+            movements_vehicles = Identifier(PredefinedTableNames.movements_vehicles.value),
+            direction_movement_id = Identifier(MovementVehiclesTableColumns.direction_movement_id.value),
+            vehicles_types = Identifier(PredefinedTableNames.vehicles_types.value),
+            vehicle_type_id = Identifier(MovementVehiclesTableColumns.vehicle_type_id.value),
+            granular_count = Identifier(PredefinedTableNames.granular_count.value),
+            movement_vehicle_id = Identifier(GranularCountsTableColumns.movement_vehicle_id.value),
+            study_checksums = Identifier(PredefinedTableNames.study_checksums.value),
+            c_miovision_id = Identifier(StudyChecksumsTableColumns.miovision_id.value),
+            c_direction_name = Identifier(StudyChecksumsTableColumns.direction_name.value),
+            c_movement_name = Identifier(StudyChecksumsTableColumns.movement_name.value),
+            c_vehicle_name = Identifier(StudyChecksumsTableColumns.vehicle_name.value),
+            c_row_count = Identifier(StudyChecksumsTableColumns.row_count.value),
+            c_count_sum = Identifier(StudyChecksumsTableColumns.count_sum.value),
+            c_content_hash = Identifier(StudyChecksumsTableColumns.content_hash.value)
+        )
+
+    def checksummed_study_count(self)->int:
+        rows = self._db_connection.execute_query(SQL("SELECT COUNT(DISTINCT {miovision_id}) FROM {study_checksums}").format(
+            miovision_id = Identifier(StudyChecksumsTableColumns.miovision_id.value),
+            study_checksums = Identifier(PredefinedTableNames.study_checksums.value)
+        ))
+        return int(rows[0][0])
+
+    def verify(self)->pd.DataFrame:
+        """
+        Find the direction/movement/vehicle class groups whose ingested rows differ from their checksum.
+
+        ### Arguments
+        No outside arguments
+
+        ### External Effects
+        None
+
+        ### Returns
+        ``pd.DataFrame`` -- One row per mismatching group with the recorded and actual row count, count sum and
+        content hash; a missing side is ``None``. Empty when every checksummed study is intact.
+        """
+        rows = self._db_connection.execute_query(self._query)
+
+        return pd.DataFrame(rows, columns=[
+            StudyChecksumsTableColumns.miovision_id.value,
+            StudyChecksumsTableColumns.direction_name.value,
+            StudyChecksumsTableColumns.movement_name.value,
+            StudyChecksumsTableColumns.vehicle_name.value,
+            'expected_row_count', 'actual_row_count',
+            'expected_count_sum', 'actual_count_sum',
+            'expected_content_hash', 'actual_content_hash'
+        ])
@@ -1,5 +1,5 @@
 from typing import Protocol, TypedDict
-from psycopg2.sql import SQL, Identifier, Composed
+from psycopg2.sql import SQL, Identifier, Composed, Literal
 from enum import StrEnum, auto
 
 class Table(Protocol):
@@ -15,6 +15,10 @@ class PredefinedTableNames(StrEnum):
     vehicles_types = auto()
     movement_types = auto()
     direction_types = auto()
+    data_generation = auto()
+    study_checksums = auto()
+    direction_headings = auto()
+    movement_heading_offsets = auto()
     
 class PredefinedTableLabels(StrEnum):
     vehicles_types = "vehicle_type_name"
@@ -49,6 +53,19 @@ class GranularCountsTableColumns(StrEnum):
     time_stamp = auto()
     traffic_count = auto()
 
+class StudyChecksumsTableColumns(StrEnum):
+    miovision_id = auto()
+    direction_name = auto()
+    movement_name = auto()
+    vehicle_name = auto()
+    row_count = auto()
+    count_sum = auto()
+    content_hash = auto()
+
+class DataGenerationTableColumns(StrEnum):
+    generation = auto()
+    created_at = auto()
+
 class StudiesTable:
     def __init__(self) -> None:
         self.table_name = PredefinedTableNames.studies.value
@@ -260,4 +277,262 @@ class GranularCountTable:
         return self.table_name
     
     def get_initialization_query(self)->Composed:
-        return self.query
\ No newline at end of file
+        return self.query
+
+class DataGenerationTable:
+    def __init__(self) -> None:
+        self.table_name = PredefinedTableNames.data_generation.value
+        self.query = SQL("""
+            CREATE TABLE {data_generation}(
+                id INTEGER GENERATED ALWAYS AS IDENTITY,
+                {generation} INTEGER NOT NULL,
+                {created_at} TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY(id)
+            );
+        """).format(
+            data_generation=Identifier(self.table_name),
+            generation=Identifier(DataGenerationTableColumns.generation.value),
+            created_at=Identifier(DataGenerationTableColumns.created_at.value)
+        )
+    
+    def get_table_name(self)->str:
+        return self.table_name
+    
+    def get_initialization_query(self)->Composed:
+        return self.query
+
+class StudyChecksumsTable:
+    def __init__(self) -> None:
+        self.table_name = PredefinedTableNames.study_checksums.value
+        self.query = SQL("""
+            CREATE TABLE {study_checksums}(
+                id INTEGER GENERATED ALWAYS AS IDENTITY,
+                {miovision_id} INTEGER NOT NULL,
+                {direction_name} VARCHAR(20) NOT NULL,
+                {movement_name} VARCHAR(100) NOT NULL,
+                {vehicle_name} VARCHAR(100) NOT NULL,
+                {row_count} INTEGER NOT NULL,
+                {count_sum} BIGINT NOT NULL,
+                {content_hash} CHAR(32) NOT NULL,
+                PRIMARY KEY(id),
+                CONSTRAINT fk_studies
+                FOREIGN KEY({miovision_id})
+                REFERENCES {studies_table}({studies_miovision_id})
+            );
+        """).format(
+            study_checksums=Identifier(self.table_name),
+            miovision_id=Identifier(StudyChecksumsTableColumns.miovision_id.value),
+            direction_name=Identifier(StudyChecksumsTableColumns.direction_name.value),
+            movement_name=Identifier(StudyChecksumsTableColumns.movement_name.value),
+            vehicle_name=Identifier(StudyChecksumsTableColumns.vehicle_name.value),
+            row_count=Identifier(StudyChecksumsTableColumns.row_count.value),
+            count_sum=Identifier(StudyChecksumsTableColumns.count_sum.value),
+            content_hash=Identifier(StudyChecksumsTableColumns.content_hash.value),
+            studies_table=Identifier(PredefinedTableNames.studies.value),
+            studies_miovision_id=Identifier(StudiesTableColumns.miovision_id.value)
+        )
+    
+    def get_table_name(self)->str:
+        return self.table_name
+    
+    def get_initialization_query(self)->Composed:
+        return self.query
+
+class SchemaObject(Protocol):
+    """Indexes, functions and derived columns created after the tables, with statements safe to run repeatedly."""
+    def get_initialization_query(self)->Composed:...
+    def get_object_name(self)->str:...
+
+class DirectionHeadingsTableColumns(StrEnum):
+    direction_type_name = auto()
+    heading_id = auto()
+
+class MovementHeadingOffsetsTableColumns(StrEnum):
+    movement_type_name = auto()
+    heading_offset = auto()
+
+class StudyTypeIndicators(StrEnum):
+    # Study types containing this indicator are pedestrian/bicycle ways rather than intersections
+    pedway = "way"
+
+# Headings numbered clockwise from Southbound, as on the Miovision study page, the opposite of heading h is (h + 3) % 8 + 1
+DIRECTION_HEADINGS : dict[str,int] = {
+    'Southbound': 1,
+    'Southwestbound': 2,
+    'Westbound': 3,
+    'Northwestbound': 4,
+    'Northbound': 5,
+    'Northeastbound': 6,
+    'Eastbound': 7,
+    'Southeastbound': 8
+}
+
+# Eighth turns clockwise a movement adds to the heading of its approach
+MOVEMENT_HEADING_OFFSETS : dict[str,int] = {
+    'Thru': 0,
+    'Bear Right': 1,
+    'Right': 2,
+    'Hard Right': 3,
+    'U-Turn': 4,
+    'Hard Left': 5,
+    'Left': 6,
+    'Bear Left': 7
+}
+
+class VolumeLookupTables:
+    """
+    Explicit heading numbers read by ``study_directional_volumes``. They are kept apart from
+    ``direction_types.directional_id``, whose numbering belongs to the volume functions maintained outside the repo.
+    Movements without an offset (e.g. pedestrians on a crosswalk) do not leave through another leg.
+    """
+    def __init__(self) -> None:
+        direction_headings = SQL(', ').join(
+            SQL('({}, {})').format(Literal(direction_name), Literal(heading_id)) for direction_name, heading_id in DIRECTION_HEADINGS.items()
+        )
+        movement_heading_offsets = SQL(', ').join(
+            SQL('({}, {})').format(Literal(movement_name), Literal(heading_offset)) for movement_name, heading_offset in MOVEMENT_HEADING_OFFSETS.items()
+        )
+        
+        self.query = SQL("""
+            CREATE TABLE IF NOT EXISTS {direction_headings}(
+                {direction_type_name} VARCHAR(20) PRIMARY KEY,
+                {heading_id} INTEGER NOT NULL
+            );
+            INSERT INTO {direction_headings}({direction_type_name}, {heading_id}) VALUES {direction_heading_values}
+            ON CONFLICT ({direction_type_name}) DO UPDATE SET {heading_id} = EXCLUDED.{heading_id};
+            
+            CREATE TABLE IF NOT EXISTS {movement_heading_offsets}(
+                {movement_type_name} VARCHAR(20) PRIMARY KEY,
+                {heading_offset} INTEGER NOT NULL
+            );
+            INSERT INTO {movement_heading_offsets}({movement_type_name}, {heading_offset}) VALUES {movement_heading_offset_values}
+            ON CONFLICT ({movement_type_name}) DO UPDATE SET {heading_offset} = EXCLUDED.{heading_offset};
+        """).format(
+            direction_headings=Identifier(PredefinedTableNames.direction_headings.value),
+            direction_type_name=Identifier(DirectionHeadingsTableColumns.direction_type_name.value),
+            heading_id=Identifier(DirectionHeadingsTableColumns.heading_id.value),
+            direction_heading_values=direction_headings,
+            movement_heading_offsets=Identifier(PredefinedTableNames.movement_heading_offsets.value),
+            movement_type_name=Identifier(MovementHeadingOffsetsTableColumns.movement_type_name.value),
+            heading_offset=Identifier(MovementHeadingOffsetsTableColumns.heading_offset.value),
+            movement_heading_offset_values=movement_heading_offsets
+        )
+    
+    def get_object_name(self)->str:
+        return "volume_lookup_tables"
+    
+    def get_initialization_query(self)->Composed:
+        return self.query
+
+class VolumeIndexes:
+    """Indexes on the foreign keys walked from a study down to its granular counts."""
+    def __init__(self) -> None:
+        self.query = SQL("""
+            CREATE INDEX IF NOT EXISTS {sd_index} ON {studies_directions}({sd_miovision_id});
+            CREATE INDEX IF NOT EXISTS {dm_index} ON {directions_movements}({study_direction_id});
+            CREATE INDEX IF NOT EXISTS {mv_index} ON {movements_vehicles}({direction_movement_id});
+            CREATE INDEX IF NOT EXISTS {g_index} ON {granular_count}({movement_vehicle_id}) INCLUDE ({traffic_count}, {time_stamp});
+        """).format(
+            sd_index=Identifier(f"{PredefinedTableNames.studies_directions.value}_{StudiesDirectionsTableColumns.miovision_id.value}_idx"),
+            studies_directions=Identifier(PredefinedTableNames.studies_directions.value),
+            sd_miovision_id=Identifier(StudiesDirectionsTableColumns.miovision_id.value),
+            dm_index=Identifier(f"{PredefinedTableNames.directions_movements.value}_{MovementsDirectionsTableColumns.study_direction_id.value}_idx"),
+            directions_movements=Identifier(PredefinedTableNames.directions_movements.value),
+            study_direction_id=Identifier(MovementsDirectionsTableColumns.study_direction_id.value),
+            mv_index=Identifier(f"{PredefinedTableNames.movements_vehicles.value}_{MovementVehiclesTableColumns.direction_movement_id.value}_idx"),
+            movements_vehicles=Identifier(PredefinedTableNames.movements_vehicles.value),
+            direction_movement_id=Identifier(MovementVehiclesTableColumns.direction_movement_id.value),
+            # Covering index, the volume and checksum aggregates never read the table itself
+            g_index=Identifier(f"{PredefinedTableNames.granular_count.value}_{GranularCountsTableColumns.movement_vehicle_id.value}_idx"),
+            granular_count=Identifier(PredefinedTableNames.granular_count.value),
+            movement_vehicle_id=Identifier(GranularCountsTableColumns.movement_vehicle_id.value),
+            traffic_count=Identifier(GranularCountsTableColumns.traffic_count.value),
+            time_stamp=Identifier(GranularCountsTableColumns.time_stamp.value)
+        )
+    
+    def get_object_name(self)->str:
+        return "volume_indexes"
+    
+    def get_initialization_query(self)->Composed:
+        return self.query
+
+class VolumeFunctions:
+    """
+    ``study_directional_volumes(miovision_ids)`` returns the in and out volume of every direction of the given
+    studies (all studies for ``NULL``) from one scan of their granular counts. It is created next to
+    ``get_in_volume``, ``get_out_volume`` and the ``pedway_*_volume_calculation`` functions, which are maintained
+    outside the repo and left untouched.
+    
+    The in volume of a direction is the traffic of its approach, the out volume the traffic leaving through the
+    leg that approach enters from, i.e. every movement whose heading after the turn is the opposite heading.
+    On pedways all traffic keeps its heading. Directions without a heading in ``direction_headings`` are left out.
+    """
+    def __init__(self) -> None:
+        self.query = SQL("""
+            -- Only the function owned by this repo is dropped, CREATE OR REPLACE cannot change its return type
+            DROP FUNCTION IF EXISTS study_directional_volumes(INTEGER[]);
+            
+            CREATE FUNCTION study_directional_volumes(miovision_ids INTEGER[] DEFAULT NULL)
+            RETURNS TABLE(miovision_id INTEGER, direction_type_id INTEGER, in_volume INTEGER, out_volume INTEGER)
+            LANGUAGE sql STABLE AS $$
+                WITH heading_volumes AS (
+                    SELECT sd.{sd_miovision_id} AS miovision_id,
+                           dh.{heading_id} AS approach_id,
+                           (dh.{heading_id} - 1 + CASE WHEN s.{study_type} LIKE {pedway_pattern} THEN 0 ELSE mo.{heading_offset} END) % 8 + 1 AS exit_heading_id,
+                           SUM(g.{traffic_count}) AS volume
+                    FROM {studies} s
+                    JOIN {studies_directions} sd ON s.{studies_miovision_id} = sd.{sd_miovision_id}
+                    JOIN {direction_types} dt ON dt.id = sd.{direction_type_id}
+                    JOIN {direction_headings} dh ON dh.{direction_type_name} = dt.{direction_type_label}
+                    JOIN {directions_movements} dm ON sd.id = dm.{study_direction_id}
+                    JOIN {movement_types} mt ON mt.id = dm.{movement_type_id}
+                    LEFT JOIN {movement_heading_offsets} mo ON mo.{movement_type_name} = mt.{movement_type_label}
+                    JOIN {movements_vehicles} mv ON dm.id = mv.{direction_movement_id}
+                    JOIN {granular_count} g ON mv.id = g.{movement_vehicle_id}
+                    WHERE miovision_ids IS NULL OR s.{studies_miovision_id} = ANY(miovision_ids)
+                    GROUP BY 1, 2, 3
+                )
+                SELECT sd.{sd_miovision_id},
+                       sd.{direction_type_id},
+                       COALESCE(SUM(hv.volume) FILTER (WHERE hv.approach_id = dh.{heading_id} AND hv.exit_heading_id IS NOT NULL), 0)::INTEGER,
+                       COALESCE(SUM(hv.volume) FILTER (WHERE hv.exit_heading_id = (dh.{heading_id} + 3) % 8 + 1), 0)::INTEGER
+                FROM {studies_directions} sd
+                JOIN {direction_types} dt ON dt.id = sd.{direction_type_id}
+                JOIN {direction_headings} dh ON dh.{direction_type_name} = dt.{direction_type_label}
+                LEFT JOIN heading_volumes hv ON hv.miovision_id = sd.{sd_miovision_id}
+                WHERE miovision_ids IS NULL OR sd.{sd_miovision_id} = ANY(miovision_ids)
+                GROUP BY sd.{sd_miovision_id}, sd.{direction_type_id}, dh.{heading_id};
+            $$;
+        """).format(
+            pedway_pattern=Literal(f"%{StudyTypeIndicators.pedway.value}%"),
+            studies=Identifier(PredefinedTableNames.studies.value),
+            studies_miovision_id=Identifier(StudiesTableColumns.miovision_id.value),
+            study_type=Identifier(StudiesTableColumns.study_type.value),
+            studies_directions=Identifier(PredefinedTableNames.studies_directions.value),
+            sd_miovision_id=Identifier(StudiesDirectionsTableColumns.miovision_id.value),
+            direction_type_id=Identifier(StudiesDirectionsTableColumns.direction_type_id.value),
+            direction_types=Identifier(PredefinedTableNames.direction_types.value),
+            direction_type_label=Identifier(PredefinedTableLabels.direction_types.value),
+            direction_headings=Identifier(PredefinedTableNames.direction_headings.value),
+            direction_type_name=Identifier(DirectionHeadingsTableColumns.direction_type_name.value),
+            heading_id=Identifier(DirectionHeadingsTableColumns.heading_id.value),
+            directions_movements=Identifier(PredefinedTableNames.directions_movements.value),
+            study_direction_id=Identifier(MovementsDirectionsTableColumns.study_direction_id.value),
+            movement_type_id=Identifier(MovementsDirectionsTableColumns.movement_type_id.value),
+            movement_types=Identifier(PredefinedTableNames.movement_types.value),
+            movement_type_label=Identifier(PredefinedTableLabels.movement_types.value),
+            movement_heading_offsets=Identifier(PredefinedTableNames.movement_heading_offsets.value),
+            movement_type_name=Identifier(MovementHeadingOffsetsTableColumns.movement_type_name.value),
+            heading_offset=Identifier(MovementHeadingOffsetsTableColumns.heading_offset.value),
+            movements_vehicles=Identifier(PredefinedTableNames.movements_vehicles.value),
+            direction_movement_id=Identifier(MovementVehiclesTableColumns.direction_movement_id.value),
+            granular_count=Identifier(PredefinedTableNames.granular_count.value),
+            movement_vehicle_id=Identifier(GranularCountsTableColumns.movement_vehicle_id.value),
+            traffic_count=Identifier(GranularCountsTableColumns.traffic_count.value)
+        )
+    
+    def get_object_name(self)->str:
+        return "volume_functions"
+    
+    def get_initialization_query(self)->Composed:
+        return self.query
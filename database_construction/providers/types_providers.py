@@ -1,5 +1,6 @@
-from typing import Protocol, TypedDict
+from typing import Protocol, TypedDict, Iterator
 from pathlib import Path
+from .discovery_providers import FileDiscoveryProvider, DiscoveredFile
 import pandas as pd
 import tqdm
 
@@ -12,24 +13,49 @@ class BaseTypeConfiguration(TypedDict):
     base_type_provider:BaseTypesProvider
 
 class BaseFolderValidator:
-    def __init__(self,base_folder_path:Path,validation_extension:str) -> None:
-        if not base_folder_path.is_dir():
-            raise Exception('Base Folder is not a directory')
+    """
+    Discovers the Miovision files under one or more base folders, including their subfolders. Files without
+    the validation extension, or matching an exclude pattern (e.g. Excel lock files), are skipped.
+    Discovery is lazy and shared, every provider iterating the files replays what was already found.
+    """
+    def __init__(self,base_folder_path:Path | list[Path],validation_extension:str,exclude_patterns:list[str] | None = None,max_workers:int = 8) -> None:
+        base_folder_paths = base_folder_path if isinstance(base_folder_path,list) else [base_folder_path]
         
-        _files = [child for child in base_folder_path.iterdir()]
-        
-        for file in _files:
-            if validation_extension != file.suffix:
-                raise Exception(f'{file} does not contain the {validation_extension} extension.')
-        
-        self._files = _files
+        self._discovery = FileDiscoveryProvider(
+            roots=base_folder_paths,
+            include_patterns=[f'*{validation_extension}'],
+            exclude_patterns=exclude_patterns,
+            max_workers=max_workers
+        )
+        self._discovered_files = self._discovery.iter_files()
+        self._files : list[DiscoveredFile] = []
+        self._is_discovery_complete = False
+    
+    def iter_discovered_files(self)->Iterator[DiscoveredFile]:
+        index = 0
+        while True:
+            if index < len(self._files):
+                yield self._files[index]
+                index += 1
+            elif self._is_discovery_complete:
+                return
+            else:
+                discovered_file = next(self._discovered_files,None)
+                if discovered_file is None:
+                    self._is_discovery_complete = True
+                else:
+                    self._files.append(discovered_file)
+    
+    def iter_files(self)->Iterator[Path]:
+        for discovered_file in self.iter_discovered_files():
+            yield discovered_file.path
     
     def get_files(self)->list[Path]:
-        return self._files
+        return list(self.iter_files())
 
 class DirectionsProvider:
     def __init__(self,base_folder:BaseFolderValidator) -> None:
-        self.excel_files = base_folder.get_files()
+        self._base_folder = base_folder
         self.directions : set[str] | None = None
     
     def return_directions_per_file(self,path:Path)->list[str]:
@@ -48,7 +74,7 @@ class DirectionsProvider:
     def get_directions(self)->list[str]:
         if self.directions is None:
             self.directions = set()
-            for path in tqdm.tqdm(self.excel_files):
+            for path in tqdm.tqdm(self._base_folder.iter_files()):
                 file_directions = self.return_directions_per_file(path)
                 self.directions.update(file_directions)
         
@@ -59,7 +85,7 @@ class DirectionsProvider:
 
 class VehiclesProvider:
     def __init__(self,base_file:BaseFolderValidator,total_volume_breakdown_sheet:str) -> None:
-        self.excel_files = base_file.get_files()
+        self._base_folder = base_file
         self.total_volume_breakdown_sheet = total_volume_breakdown_sheet
         self.vehicles : set[str] | None = None
     
@@ -87,7 +113,7 @@ class VehiclesProvider:
     def get_vehicles(self)->list[str]:
         if self.vehicles is None:
             self.vehicles = set()
-            for file in tqdm.tqdm(self.excel_files):
+            for file in tqdm.tqdm(self._base_folder.iter_files()):
                 file_vehicles = self.__return_vehicles_per_file(file)
                 self.vehicles.update(file_vehicles)
         
@@ -98,7 +124,7 @@ class VehiclesProvider:
 
 class MovementsProvider:
     def __init__(self,base_folder:BaseFolderValidator,directions_provider:DirectionsProvider) -> None:
-        self.excel_files = base_folder.get_files()
+        self._base_folder = base_folder
         self.directions_provider = directions_provider
         self.movements : set[str] | None = None
         
@@ -129,7 +155,7 @@ class MovementsProvider:
     def get_movements(self)->list[str]:
         if self.movements is None:
             self.movements = set()
-            for file in tqdm.tqdm(self.excel_files):
+            for file in tqdm.tqdm(self._base_folder.iter_files()):
                 file_movements = self.__return_movements_per_file(file)
                 self.movements.update(file_movements)
         
@@ -1,5 +1,6 @@
 from typing import Protocol
 from .volume_provider import DirectionalVolumeAttr
+import pandas as pd
 from pathlib import Path
 from psycopg2 import connect
 from dotenv import load_dotenv
@@ -15,9 +16,13 @@ class VolumeQueryProvider(Protocol):
     def get_roadway_volume_query(self)->Composed:...
     
     def get_pedway_volume_query(self)->Composed:...
+    
+    def get_batch_volume_query(self)->Composed:...
 
 class DatabaseVolumeProvider(Protocol):
     def return_volumes(self, file_path: Path)->dict[str,DirectionalVolumeAttr]:...
+    
+    def return_all_volumes(self, miovision_ids: list[int] | None = None)->dict[int,dict[str,DirectionalVolumeAttr]]:...
 
 class ConnectionStringProvider(Protocol):
     def get_connection_string(self)->str:...
@@ -33,6 +38,17 @@ class LocalConnectionStringProvider:
         
         return os.environ[self._env_key_label]
 
+# Every study and direction from one scan of the granular counts, pedways are handled by the stored study type
+STUDY_DIRECTIONAL_VOLUMES_BATCH_QUERY = SQL("""
+                          SELECT v.miovision_id, dt.{direction_type_name}, v.out_volume, v.in_volume
+                            FROM study_directional_volumes(%(miovision_ids)s::INTEGER[]) v
+                            JOIN {directions_table} dt on dt.id = v.direction_type_id
+                            ORDER BY v.miovision_id;
+                          """).format(
+                              direction_type_name = Identifier(PredefinedTableLabels.direction_types.value),
+                              directions_table = Identifier(PredefinedTableNames.direction_types.value)
+                          )
+
 class MiovisionDBQueryProvider:
     def __init__(self) -> None:
         self._roadway_query = SQL("""
@@ -71,17 +87,47 @@ class MiovisionDBQueryProvider:
                               direction_type_id = Identifier(StudiesDirectionsTableColumns.direction_type_id.value)
                           )
 
+        # Every study and direction in one set-based statement instead of the volume functions per row
+        self._batch_query = STUDY_DIRECTIONAL_VOLUMES_BATCH_QUERY
+
     def get_roadway_volume_query(self):
         return self._roadway_query
     
     def get_pedway_volume_query(self)->Composed:
         return self._pedway_query
+    
+    def get_batch_volume_query(self)->Composed:
+        return self._batch_query
+
+class StudyDirectionalVolumesQueryProvider:
+    """Reads the volumes from ``study_directional_volumes()``, which handles pedways by the stored study type."""
+    def __init__(self) -> None:
+        self._study_query = SQL("""
+                          SELECT dt.{direction_type_name}, v.out_volume, v.in_volume
+                            FROM study_directional_volumes(ARRAY[%s]::INTEGER[]) v
+                            JOIN {directions_table} dt on dt.id = v.direction_type_id;
+                          """).format(
+                              direction_type_name = Identifier(PredefinedTableLabels.direction_types.value),
+                              directions_table = Identifier(PredefinedTableNames.direction_types.value)
+                          )
+
+        self._batch_query = STUDY_DIRECTIONAL_VOLUMES_BATCH_QUERY
+
+    def get_roadway_volume_query(self)->Composed:
+        return self._study_query
+    
+    def get_pedway_volume_query(self)->Composed:
+        return self._study_query
+    
+    def get_batch_volume_query(self)->Composed:
+        return self._batch_query
 
 class MiovisionDBVolumeProvider:
-    def __init__(self, connection_string: ConnectionStringProvider, query_provider: MiovisionDBQueryProvider) -> None:
+    def __init__(self, connection_string: ConnectionStringProvider, query_provider: VolumeQueryProvider) -> None:
         self._connection = connect(connection_string.get_connection_string())
         self._roadway_query = query_provider.get_roadway_volume_query()
         self._pedway_query = query_provider.get_pedway_volume_query()
+        self._batch_query = query_provider.get_batch_volume_query()
         self._cursor = self._connection.cursor()
     
     def shutdown_connection(self)->None:
@@ -106,21 +152,86 @@ class MiovisionDBVolumeProvider:
         volume_mapping : dict[str,DirectionalVolumeAttr] = {}
         
         for direction_name, out_volume, in_volume in results:
-            if not isinstance(direction_name,str):
-                raise Exception("direction_name is not a string")
-            
-            if not isinstance(out_volume, int):
-                raise Exception("out_volume is not an integer")
+            self._add_directional_volume(volume_mapping, direction_name, out_volume, in_volume)
             
-            if not isinstance(in_volume, int):
-                raise Exception("in_volume is not an integer")
-            
-            if in_volume == 0:
-                continue
-            
-            directional_attributes = DirectionalVolumeAttr(total_volume = out_volume+in_volume,
-                                                           in_volume = in_volume,
-                                                           out_volume = out_volume)
-            volume_mapping[direction_name] = directional_attributes
-            
-        return volume_mapping
\ No newline at end of file
+        return volume_mapping
+    
+    def return_all_volumes(self, miovision_ids: list[int] | None = None)->dict[int,dict[str,DirectionalVolumeAttr]]:
+        """
+        Return the in/out volumes of every direction of every study with a single query.
+        
+        ### Arguments
+        1. miovision_ids : ``list[int] | None``
+            - Studies to return, all studies when ``None``
+        
+        ### Returns
+        A ``dict`` from miovision_id to the same mapping ``return_volumes`` returns for the study's workbook
+        """
+        self._cursor.execute(self._batch_query,{"miovision_ids": miovision_ids})
+        
+        volume_mappings : dict[int,dict[str,DirectionalVolumeAttr]] = {}
+        for miovision_id, direction_name, out_volume, in_volume in self._cursor.fetchall():
+            volume_mapping = volume_mappings.setdefault(miovision_id, {})
+            self._add_directional_volume(volume_mapping, direction_name, out_volume, in_volume)
+        
+        return volume_mappings
+    
+    def _add_directional_volume(self, volume_mapping: dict[str,DirectionalVolumeAttr], direction_name, out_volume, in_volume)->None:
+        if not isinstance(direction_name,str):
+            raise Exception("direction_name is not a string")
+        
+        if not isinstance(out_volume, int):
+            raise Exception("out_volume is not an integer")
+        
+        if not isinstance(in_volume, int):
+            raise Exception("in_volume is not an integer")
+        
+        if in_volume == 0:
+            return
+        
+        directional_attributes = DirectionalVolumeAttr(total_volume = out_volume+in_volume,
+                                                       in_volume = in_volume,
+                                                       out_volume = out_volume)
+        volume_mapping[direction_name] = directional_attributes
+
+def volume_mappings_to_frame(volume_mappings: dict[int,dict[str,DirectionalVolumeAttr]])->pd.DataFrame:
+    """
+    Flatten volume mappings into one row per study and direction.
+    """
+    rows = [
+        {'miovision_id': int(miovision_id), 'direction': direction_name, **volume_attributes}
+        for miovision_id, volume_mapping in volume_mappings.items()
+        for direction_name, volume_attributes in volume_mapping.items()
+    ]
+    return pd.DataFrame(rows, columns=['miovision_id', 'direction', 'total_volume', 'in_volume', 'out_volume'])
+
+def find_volume_discrepancies(expected: dict[int,dict[str,DirectionalVolumeAttr]], actual: dict[int,dict[str,DirectionalVolumeAttr]])->pd.DataFrame:
+    """
+    Compare expected and actual volumes of many studies at once.
+    
+    ### Arguments
+    1. expected : ``dict[int,dict[str,DirectionalVolumeAttr]]``
+        - Reference volumes keyed by miovision_id, e.g. scraped from Miovision
+    2. actual : ``dict[int,dict[str,DirectionalVolumeAttr]]``
+        - Volumes keyed by miovision_id, e.g. from ``return_all_volumes``
+    
+    ### Returns
+    A ``pd.DataFrame`` with one row per study and direction whose volumes differ or that is missing on one side,
+    empty when everything matches. Studies missing from ``actual`` entirely are reported as well.
+    """
+    volume_columns = ['total_volume', 'in_volume', 'out_volume']
+    merged_df = volume_mappings_to_frame(expected).merge(
+        volume_mappings_to_frame(actual),
+        on=['miovision_id', 'direction'],
+        how='outer',
+        suffixes=('_expected', '_actual'),
+        indicator=True
+    )
+    
+    expected_values = merged_df[[f'{column}_expected' for column in volume_columns]].to_numpy()
+    actual_values = merged_df[[f'{column}_actual' for column in volume_columns]].to_numpy()
+    is_discrepancy = (merged_df['_merge'] != 'both').to_numpy() | (expected_values != actual_values).any(axis=1)
+    
+    discrepancies_df = merged_df[is_discrepancy].reset_index(drop=True)
+    discrepancies_df['found_in'] = discrepancies_df.pop('_merge').map({'both': 'both', 'left_only': 'expected_only', 'right_only': 'actual_only'})
+    return discrepancies_df
\ No newline at end of file
@@ -0,0 +1,31 @@
+import os
+from dotenv import load_dotenv
+import pytest
+from psycopg2 import connect
+from providers.analytics_mirror_providers import AnalyticsMirrorWriter
+from providers.tables_providers import PredefinedTableNames
+
+duckdb = pytest.importorskip('duckdb')
+
+@pytest.fixture(scope='module')
+def test_database_connection_string()->str:
+    load_dotenv()
+    url_key = 'LOCAL_DATABASE_URL'
+    assert url_key in os.environ, f"{url_key} not found in environment variables"
+    return os.environ[url_key]
+
+def test_mirror_matches_database(test_database_connection_string, tmp_path):
+    mirror_path = AnalyticsMirrorWriter(test_database_connection_string, tmp_path / 'mirror.duckdb', batch_size=1_000).write_mirror()
+
+    assert not (tmp_path / 'mirror.duckdb.tmp').exists()
+
+    granular_count = PredefinedTableNames.granular_count.value
+    with connect(test_database_connection_string) as connection, connection.cursor() as cursor:
+        cursor.execute(f'SELECT COUNT(*), SUM(traffic_count) FROM {granular_count};')
+        expected_totals = cursor.fetchone()
+
+    mirror = duckdb.connect(str(mirror_path), read_only=True)
+    try:
+        assert mirror.execute(f'SELECT COUNT(*), SUM(traffic_count) FROM {granular_count}').fetchone() == expected_totals
+    finally:
+        mirror.close()
@@ -0,0 +1,125 @@
+import pytest
+import asyncio
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from .volume_provider import AsyncHtmlVolumeScraper, ConcurrentHtmlVolumeProvider, DirectionalVolumeAttr, VolumeScrapingError
+
+STUDY_VOLUMES : dict[str,dict[str,tuple[int,int]]] = {
+    "1230846": {"1": (9, 17268), "3": (10185, 10468), "5": (21650, 2), "7": (7331, 11437)},
+    "1230900": {"1": (120, 80), "3": (0, 40), "5": (75, 95), "7": (60, 40)},
+}
+
+def study_page(directions_volumes:dict[str,tuple[int,int]])->str:
+    # Mimics the SVG labels of the Miovision study page
+    labels = []
+    for direction_id, (in_volume, out_volume) in directions_volumes.items():
+        labels.append(f'<text class="enter_total" data-direction="{direction_id}">In: {in_volume}</text>')
+        labels.append(f'<text class="exit_total" data-direction="{direction_id}">Out: {out_volume}</text>')
+        labels.append(f'<text class="direction_total" data-direction="{direction_id}">Total: {in_volume + out_volume}</text>')
+    return f'<html><body><svg>{"".join(labels)}</svg></body></html>'
+
+class StudyPageHandler(BaseHTTPRequestHandler):
+    active_requests = 0
+    max_active_requests = 0
+    failed_paths : set[str] = set()
+    lock = threading.Lock()
+
+    def do_GET(self):
+        cls = type(self)
+        if self.path == '/favicon.ico':
+            self.send_error(404)
+            return
+
+        with cls.lock:
+            cls.active_requests += 1
+            cls.max_active_requests = max(cls.max_active_requests, cls.active_requests)
+
+        try:
+            time.sleep(0.2)
+            study_id = self.path.strip('/').split('/')[-1].removeprefix('flaky-')
+
+            # Flaky pages are served without any volumes the first time they are requested
+            if self.path.strip('/').startswith('flaky-') and self.path not in cls.failed_paths:
+                cls.failed_paths.add(self.path)
+                body = '<html><body>Loading...</body></html>'
+            else:
+                body = study_page(STUDY_VOLUMES[study_id])
+
+            encoded_body = body.encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html')
+            self.send_header('Content-Length', str(len(encoded_body)))
+            self.end_headers()
+            self.wfile.write(encoded_body)
+        finally:
+            with cls.lock:
+                cls.active_requests -= 1
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture(scope='module')
+def base_url():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StudyPageHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}/'
+    server.shutdown()
+
+@pytest.fixture
+def expected_volumes()->dict[str,dict[str,DirectionalVolumeAttr]]:
+    return {
+        "1230846": {
+            "Southbound": {'total_volume': 17277, 'in_volume': 9, 'out_volume': 17268},
+            "Westbound": {'total_volume': 20653, 'in_volume': 10185, 'out_volume': 10468},
+            "Northbound": {'total_volume': 21652, 'in_volume': 21650, 'out_volume': 2},
+            "Eastbound": {'total_volume': 18768, 'in_volume': 7331, 'out_volume': 11437}
+        },
+        "1230900": {
+            "Southbound": {'total_volume': 200, 'in_volume': 120, 'out_volume': 80},
+            "Northbound": {'total_volume': 170, 'in_volume': 75, 'out_volume': 95},
+            "Eastbound": {'total_volume': 100, 'in_volume': 60, 'out_volume': 40}
+        }
+    }
+
+def test_concurrent_provider(base_url, expected_volumes):
+    provider = ConcurrentHtmlVolumeProvider(base_url=base_url, authenticator=None, max_concurrency=2)
+    assert provider.get_volumes(list(expected_volumes)) == expected_volumes
+
+def test_bounded_concurrency(base_url):
+    urls = [f'{base_url}{study_id}' for study_id in STUDY_VOLUMES for _ in range(3)]
+    StudyPageHandler.max_active_requests = 0
+
+    async def scrape():
+        async with AsyncHtmlVolumeScraper(None, max_concurrency=2) as scraper:
+            return await asyncio.gather(*(scraper.return_directions_volumes(url) for url in urls))
+
+    results = asyncio.run(scrape())
+    assert len(results) == len(urls)
+    assert StudyPageHandler.max_active_requests == 2
+
+def test_retry(base_url, expected_volumes):
+    async def scrape():
+        async with AsyncHtmlVolumeScraper(None, max_attempts=2, retry_delay_seconds=0.1, selector_timeout_ms=1_000) as scraper:
+            return await scraper.return_directions_volumes(f'{base_url}flaky-1230846')
+
+    directions_volumes = asyncio.run(scrape())
+    assert dict(directions_volumes)["1"] == expected_volumes["1230846"]["Southbound"]
+
+def test_retries_exhausted(base_url):
+    async def scrape():
+        async with AsyncHtmlVolumeScraper(None, max_attempts=1, selector_timeout_ms=1_000) as scraper:
+            return await scraper.return_directions_volumes(f'{base_url}flaky-1230900')
+
+    with pytest.raises(Exception, match="failed after 1 attempts"):
+        asyncio.run(scrape())
+
+def test_failed_study_keeps_batch(base_url, expected_volumes):
+    # Study 0 has no page, the handler fails and the page never shows volumes
+    provider = ConcurrentHtmlVolumeProvider(base_url=base_url, authenticator=None, max_attempts=1, selector_timeout_ms=1_000)
+    
+    with pytest.raises(VolumeScrapingError) as scraping_error:
+        provider.get_volumes(["1230846", "0"])
+    assert scraping_error.value.volumes == {"1230846": expected_volumes["1230846"]}
+    assert list(scraping_error.value.errors) == ["0"]
@@ -0,0 +1,41 @@
+from datetime import datetime
+import hashlib
+from providers.extraction_providers import ChecksumExtractor, GranularFields
+
+def granular_count(movement_name:str, hour:int, minute:int, traffic_count:int, day:int = 6)->GranularFields:
+    return GranularFields(miovision_id=1230846,
+                          direction_name='Northbound',
+                          movement_name=movement_name,
+                          vehicle_name='Lights',
+                          time=datetime(2025, 5, day, hour, minute),
+                          traffic_count=traffic_count)
+
+def test_checksum_extractor():
+    granular_counts = [
+        granular_count('Right', 7, 15, 4),
+        granular_count('Right', 7, 0, 3),
+        granular_count('Thru', 7, 0, 10)
+    ]
+    
+    checksums = {checksum.movement_name: checksum for checksum in ChecksumExtractor().extract_fields(granular_counts)}
+    
+    assert checksums['Right'].row_count == 2
+    assert checksums['Right'].count_sum == 7
+    # Rows are hashed in time order, the same way the database recomputes the hash
+    assert checksums['Right'].content_hash == hashlib.md5(b'07:00:00:3,07:15:00:4').hexdigest()
+    assert checksums['Thru'].row_count == 1
+    assert checksums['Thru'].count_sum == 10
+
+def test_multi_day_checksum():
+    granular_counts = [
+        granular_count('Thru', 23, 45, 2),
+        granular_count('Thru', 0, 0, 5, day=7),
+        granular_count('Thru', 7, 0, 9),
+        granular_count('Thru', 7, 0, 1, day=7)
+    ]
+    
+    checksum, = ChecksumExtractor().extract_fields(granular_counts)
+    
+    assert checksum.row_count == 4
+    # The database only stores the time of day, rows of different days are ordered by time then count
+    assert checksum.content_hash == hashlib.md5(b'00:00:00:5,07:00:00:1,07:00:00:9,23:45:00:2').hexdigest()
@@ -1,6 +1,7 @@
 import pytest
+from psycopg2 import connect
 from .database_provider import DatabaseVolumeProvider, ConnectionStringProvider, VolumeQueryProvider
-from .database_provider import MiovisionDBVolumeProvider, LocalConnectionStringProvider, MiovisionDBQueryProvider
+from .database_provider import MiovisionDBVolumeProvider, LocalConnectionStringProvider, MiovisionDBQueryProvider, StudyDirectionalVolumesQueryProvider, find_volume_discrepancies
 from pathlib import Path
 from .volume_provider import DirectionalVolumeAttr
 
@@ -20,6 +21,10 @@ def query_provider()->VolumeQueryProvider:
 def volume_provider(query_provider,connection_string_provider)->DatabaseVolumeProvider:
     return MiovisionDBVolumeProvider(connection_string_provider,query_provider)
 
+@pytest.fixture(scope='module')
+def study_directional_volume_provider(connection_string_provider)->DatabaseVolumeProvider:
+    return MiovisionDBVolumeProvider(connection_string_provider,StudyDirectionalVolumesQueryProvider())
+
 @pytest.fixture(scope='module')
 def dummy_path()->Path:
     return Path('Granular Miovision Files/TMC-1230846.xlsx')
@@ -74,4 +79,34 @@ def test_db_volume_roadway(dummy_path, volume_provider, expected_result):
     
 def test_db_volume_pedway(pedway_path,pedway_expected_result,volume_provider):
     pedway_result = volume_provider.return_volumes(pedway_path)
-    assert pedway_result == pedway_expected_result, f"{pedway_result} does not match {pedway_expected_result}"
\ No newline at end of file
+    assert pedway_result == pedway_expected_result, f"{pedway_result} does not match {pedway_expected_result}"
+
+def test_db_volume_batch(volume_provider, expected_result, pedway_expected_result):
+    expected_results = {1230846: expected_result, 1210264: pedway_expected_result}
+    batch_results = volume_provider.return_all_volumes(list(expected_results))
+    discrepancies = find_volume_discrepancies(expected_results, batch_results)
+    assert discrepancies.empty, f"Inconsistent volumes:\n{discrepancies.to_string()}"
+    assert batch_results == expected_results
+
+def test_study_directional_volumes(dummy_path, pedway_path, study_directional_volume_provider, expected_result, pedway_expected_result):
+    assert study_directional_volume_provider.return_volumes(dummy_path) == expected_result
+    assert study_directional_volume_provider.return_volumes(pedway_path) == pedway_expected_result
+
+def test_study_directional_volumes_match_functions(connection_string_provider, volume_provider):
+    # Every study, compared against get_in_volume/get_out_volume and the pedway functions one study at a time
+    with connect(connection_string_provider.get_connection_string()) as connection, connection.cursor() as cursor:
+        cursor.execute("SELECT miovision_id, study_type FROM studies;")
+        studies = cursor.fetchall()
+    
+    function_results = {miovision_id: volume_provider.return_volumes(Path(f'{study_type}-{miovision_id}.xlsx')) for miovision_id, study_type in studies}
+    discrepancies = find_volume_discrepancies(function_results, volume_provider.return_all_volumes())
+    assert len(function_results) > 0
+    assert discrepancies.empty, f"study_directional_volumes() differs from the volume functions:\n{discrepancies.to_string()}"
+
+def test_volume_discrepancies(expected_result):
+    actual_result = {direction: dict(volumes) for direction, volumes in expected_result.items()}
+    actual_result["Westbound"]["in_volume"] += 1
+    del actual_result["Eastbound"]
+    
+    discrepancies = find_volume_discrepancies({1230846: expected_result}, {1230846: actual_result})
+    assert sorted(zip(discrepancies['direction'], discrepancies['found_in'])) == [("Eastbound", "expected_only"), ("Westbound", "both")]
@@ -0,0 +1,56 @@
+from datetime import datetime
+from pathlib import Path
+import pandas as pd
+import pytest
+from providers.extraction_providers import GranularExtractor
+from providers.reconciliation_providers import ExpectedTotalsExtractor, ReconciliationColumns, extract_expected_totals
+
+BREAKDOWN_SHEET = 'Total Volume Class Breakdown'
+
+def directional_rows(counts:list[tuple[int,int]])->list[list]:
+    rows = [['Turning Movement Count', None, None],
+            ['Movement', 'Right', 'Unnamed: 2'],
+            [None, 'Lights', 'Buses']]
+    for index, (lights, buses) in enumerate(counts):
+        rows.append([datetime(2025, 5, 6, 7, 15 * index), lights, buses])
+    return rows
+
+@pytest.fixture
+def miovision_file(tmp_path:Path)->Path:
+    path = tmp_path / 'Roadway-1230846.xlsx'
+    sheets = {
+        BREAKDOWN_SHEET: [['Class', 'Northbound', 'Eastbound', 'Total'],
+                          ['Grand Total', 9, 12, 21],
+                          ['Lights', 6, 9, 15]],
+        'Northbound': directional_rows([(1, 2), (2, 0), (3, 1)]),
+        'Eastbound': directional_rows([(4, 0), (5, 3)]),
+    }
+    with pd.ExcelWriter(path) as writer:
+        for sheet_name, rows in sheets.items():
+            pd.DataFrame(rows).to_excel(writer, sheet_name=sheet_name, header=False, index=False)
+    return path
+
+def sorted_totals(totals:pd.DataFrame)->list[tuple]:
+    return sorted(totals[[ReconciliationColumns.direction_name.value, ReconciliationColumns.vehicle_name.value, ReconciliationColumns.expected_count.value]]
+                  .itertuples(index=False, name=None))
+
+def test_expected_totals_of_workbook(miovision_file):
+    expected_totals, = extract_expected_totals([miovision_file])
+
+    assert expected_totals.miovision_id == 1230846
+    # Grand total row minus the double counted total column
+    assert expected_totals.study_total == 9 + 12 + 21 - 2 * 21
+    assert sorted_totals(expected_totals.direction_vehicle_totals) == [
+        ('Eastbound', 'Buses', 3), ('Eastbound', 'Lights', 9),
+        ('Northbound', 'Buses', 3), ('Northbound', 'Lights', 6),
+    ]
+
+def test_expected_totals_from_granular_counts(miovision_file):
+    granular_counts = GranularExtractor().extract_fields(miovision_file, ['Northbound', 'Eastbound'], ['Right'], ['Lights', 'Buses'])
+    extractor = ExpectedTotalsExtractor(BREAKDOWN_SHEET)
+
+    from_granular_counts = extractor.extract_from_granular_counts(miovision_file, granular_counts)
+    from_workbook = extractor.extract_fields(miovision_file)
+
+    assert from_granular_counts.study_total == from_workbook.study_total
+    assert sorted_totals(from_granular_counts.direction_vehicle_totals) == sorted_totals(from_workbook.direction_vehicle_totals)
@@ -0,0 +1,42 @@
+from pathlib import Path
+import hashlib
+import pytest
+from providers.discovery_providers import FileDiscoveryProvider
+from providers.types_providers import BaseFolderValidator
+
+@pytest.fixture
+def archive(tmp_path:Path)->list[Path]:
+    files = {
+        '2024/Spring/1230846.xlsx': b'spring',
+        '2024/Spring/~$1230846.xlsx': b'lock',
+        '2024/Fall/1230900.xlsx': b'fall',
+        '2024/notes.txt': b'notes',
+        '2025/1210264.xlsx': b'2025',
+    }
+    for relative_path, content in files.items():
+        path = tmp_path / relative_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(content)
+
+    return [tmp_path / '2024', tmp_path / '2025']
+
+def test_discovery(archive):
+    discovery = FileDiscoveryProvider(archive, include_patterns=['*.xlsx'], exclude_patterns=['~$*'], max_workers=2)
+    discovered_files = list(discovery.iter_files())
+
+    assert [file.path.name for file in discovered_files] == ['1230900.xlsx', '1230846.xlsx', '1210264.xlsx']
+    assert discovered_files[0].fingerprint == hashlib.md5(b'fall').hexdigest()
+    assert discovered_files[0].size == 4
+
+def test_overlapping_roots(archive):
+    discovery = FileDiscoveryProvider([*archive, archive[0] / 'Fall'], include_patterns=['*.xlsx'], exclude_patterns=['~$*', 'Spring'])
+
+    assert [path.name for path in discovery.iter_paths()] == ['1230900.xlsx', '1210264.xlsx']
+
+def test_base_folder_validator_replays_discovery(archive):
+    validator = BaseFolderValidator(archive, '.xlsx', exclude_patterns=['~$*'])
+
+    first_file = next(validator.iter_files())
+    # A second consumer starting mid discovery sees every file, the first one included
+    assert validator.get_files()[0] == first_file
+    assert [path.name for path in validator.iter_files()] == ['1230900.xlsx', '1230846.xlsx', '1210264.xlsx']
@@ -1,8 +1,9 @@
 import pytest
+import os
 from pathlib import Path
 
-from .database_provider import ConnectionStringProvider, DatabaseVolumeProvider, LocalConnectionStringProvider, MiovisionDBQueryProvider, MiovisionDBVolumeProvider, VolumeQueryProvider
-from .volume_provider import Authenticator, CredentialsProvider, HtmlAuthenticator, HtmlVolumeProvider, HtmlVolumeScraper, LocalCredentialsProvider, VolumeProvider, VolumeScraper
+from .database_provider import ConnectionStringProvider, DatabaseVolumeProvider, LocalConnectionStringProvider, MiovisionDBQueryProvider, MiovisionDBVolumeProvider, StudyDirectionalVolumesQueryProvider, VolumeQueryProvider
+from .volume_provider import Authenticator, CachedVolumeProvider, CredentialsProvider, HtmlAuthenticator, HtmlVolumeProvider, HtmlVolumeScraper, LocalCredentialsProvider, VolumeProvider, VolumeScraper
 
 def excel_files()->list[Path]:
     test_files_directory = Path('Granular Miovision Files')
@@ -33,12 +34,13 @@ def scraper(authenticator)->VolumeScraper:
     return HtmlVolumeScraper(authenticator)
 
 
-@pytest.fixture
+@pytest.fixture(scope='module')
 def online_volume_provider(miovision_base_url, scraper)-> VolumeProvider:
     volume_provider = HtmlVolumeProvider(base_url=miovision_base_url,
                                          scraper=scraper)
     
-    return volume_provider
+    # Published study volumes do not change, set VOLUME_CACHE_REFRESH=1 to scrape every study again
+    return CachedVolumeProvider(volume_provider, refresh=os.environ.get('VOLUME_CACHE_REFRESH') == '1')
 
 @pytest.fixture(scope='module')
 def env_key()->str:
@@ -56,6 +58,10 @@ def query_provider()->VolumeQueryProvider:
 def db_volume_provider(query_provider,connection_string_provider)->DatabaseVolumeProvider:
     return MiovisionDBVolumeProvider(connection_string_provider,query_provider)
 
+@pytest.fixture(scope='module')
+def study_directional_volume_provider(connection_string_provider)->DatabaseVolumeProvider:
+    return MiovisionDBVolumeProvider(connection_string_provider,StudyDirectionalVolumesQueryProvider())
+
 def get_miovision_id(stem:str)->str:
     type_id = stem.split('-')
     assert len(type_id) == 2, "Stem is not of type '<label>-<id>'"
@@ -67,4 +73,12 @@ def test_in_out_volumes(path: Path, online_volume_provider,db_volume_provider):
     online_result = online_volume_provider.get_volume(miovision_id)
     db_result = db_volume_provider.return_volumes(path)
     
-    assert online_result == db_result, f"Inconsistent result for {miovision_id}"
\ No newline at end of file
+    assert online_result == db_result, f"Inconsistent result for {miovision_id}"
+
+@pytest.mark.parametrize("path",excel_files())
+def test_study_directional_volumes(path: Path, online_volume_provider, study_directional_volume_provider):
+    miovision_id = get_miovision_id(path.stem)
+    online_result = online_volume_provider.get_volume(miovision_id)
+    db_result = study_directional_volume_provider.return_volumes(path)
+    
+    assert online_result == db_result, f"study_directional_volumes() inconsistent with the reference volumes for {miovision_id}"
\ No newline at end of file
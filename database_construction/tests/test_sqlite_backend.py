@@ -0,0 +1,178 @@
+import pytest
+from datetime import date, datetime, time
+import pandas as pd
+import providers.tables_providers as tables
+from psycopg2 import sql
+from providers.database_providers import SQLiteDatabaseConnection, DatabaseTableWriter, DatabaseTypesWriter, DatabaseUpdater, DataGenerationWriter
+from providers.database_providers import create_database_connection
+from providers.types_providers import BaseTypeConfiguration
+from main import App, ApplicationConfiguration
+
+class StaticTypesProvider:
+    def __init__(self, values:list[str]) -> None:
+        self._values = values
+    
+    def return_information(self)->list[str]:
+        return self._values
+
+@pytest.fixture
+def database_connection(tmp_path)->SQLiteDatabaseConnection:
+    connection = create_database_connection(f'sqlite:///{tmp_path / "coe.sqlite3"}')
+    assert isinstance(connection, SQLiteDatabaseConnection)
+    
+    DatabaseTableWriter(
+        database_connection=connection,
+        tables=[
+            tables.MovementTypesTable(),
+            tables.VehicleTypesTable(),
+            tables.DirectionsTypesTable(),
+            tables.StudiesTable(),
+            tables.StudiesDirectionsTable(),
+            tables.DirectionsMovementsTable(),
+            tables.MovementVehiclesTable(),
+            tables.GranularCountTable(),
+            tables.DataGenerationTable(),
+            tables.StudyChecksumsTable()
+        ],
+        schema_objects=[tables.VolumeLookupTables(), tables.VolumeIndexes(), tables.VolumeFunctions()]
+    ).create_tables()
+    
+    return connection
+
+def test_tables_created(database_connection):
+    assert database_connection.is_existing_table(tables.PredefinedTableNames.granular_count.value)
+    assert not database_connection.is_existing_table('missing_table')
+
+def test_types_writer(database_connection):
+    DatabaseTypesWriter(database_connection, [
+        BaseTypeConfiguration(base_type_table_name=tables.PredefinedTableNames.direction_types.value,
+                              base_type_label_name=tables.PredefinedTableLabels.direction_types.value,
+                              base_type_provider=StaticTypesProvider(['Northbound', 'Southbound']))
+    ]).write_into_tables()
+    
+    rows = database_connection.select_existing_attributes(
+        table_name=tables.PredefinedTableNames.direction_types.value,
+        query_attr=['id', tables.PredefinedTableLabels.direction_types.value]
+    )
+    
+    assert rows == [(1, 'Northbound'), (2, 'Southbound')]
+
+def test_updater_and_bulk_insert(database_connection):
+    updater = DatabaseUpdater(database_connection)
+    
+    with database_connection as connection:
+        connection.insert_new_information(
+            table_name=tables.PredefinedTableNames.studies.value,
+            labels=[column.value for column in tables.StudiesTableColumns if column != tables.StudiesTableColumns.project_name],
+            values=[1230846, 'Study', 24.0, 'TMC', 'Location', 53.5, -113.5, date(2025, 5, 6)]
+        )
+    
+    study_direction_id = updater.update_db_and_return_id(
+        table_name=tables.PredefinedTableNames.studies_directions.value,
+        labels=[tables.StudiesDirectionsTableColumns.miovision_id.value],
+        values=[1230846]
+    )
+    # Existing rows are not inserted again
+    assert updater.update_db_and_return_id(
+        table_name=tables.PredefinedTableNames.studies_directions.value,
+        labels=[tables.StudiesDirectionsTableColumns.miovision_id.value],
+        values=[1230846]
+    ) == study_direction_id
+    
+    direction_movement_id = updater.update_db_and_return_id(
+        table_name=tables.PredefinedTableNames.directions_movements.value,
+        labels=[tables.MovementsDirectionsTableColumns.study_direction_id.value],
+        values=[study_direction_id]
+    )
+    movement_vehicle_id = updater.update_db_and_return_id(
+        table_name=tables.PredefinedTableNames.movements_vehicles.value,
+        labels=[tables.MovementVehiclesTableColumns.direction_movement_id.value],
+        values=[direction_movement_id]
+    )
+    
+    updater.update_db_many(
+        table_name=tables.PredefinedTableNames.granular_count.value,
+        labels=[
+            tables.GranularCountsTableColumns.movement_vehicle_id.value,
+            tables.GranularCountsTableColumns.time_stamp.value,
+            tables.GranularCountsTableColumns.traffic_count.value
+        ],
+        rows=[[movement_vehicle_id, time(7, minute), minute + 1] for minute in range(0, 60, 15)]
+    )
+    
+    rows = database_connection.select_existing_attributes(
+        table_name=tables.PredefinedTableNames.granular_count.value,
+        query_attr=[tables.GranularCountsTableColumns.time_stamp.value, tables.GranularCountsTableColumns.traffic_count.value],
+        where_labels=[tables.GranularCountsTableColumns.movement_vehicle_id.value],
+        where_values=[movement_vehicle_id]
+    )
+    
+    assert rows == [('07:00:00', 1), ('07:15:00', 16), ('07:30:00', 31), ('07:45:00', 46)]
+
+def test_bulk_insert_rejects_invalid_rows(database_connection):
+    # Foreign keys are enforced like on Postgres
+    with pytest.raises(Exception, match='Bulk insert'):
+        DatabaseUpdater(database_connection).update_db_many(
+            table_name=tables.PredefinedTableNames.granular_count.value,
+            labels=[tables.GranularCountsTableColumns.movement_vehicle_id.value, tables.GranularCountsTableColumns.time_stamp.value, tables.GranularCountsTableColumns.traffic_count.value],
+            rows=[[999, time(7, 0), 1]]
+        )
+
+def test_data_generation(database_connection):
+    writer = DataGenerationWriter(database_connection, tables.DataGenerationTable())
+    
+    assert writer.bump_generation() == 1
+    assert writer.bump_generation() == 2
+
+def write_miovision_file(path):
+    directional_rows = [['Turning Movement Count', None, None],
+                        ['Movement', 'Right', None],
+                        [None, 'Lights', 'Buses'],
+                        [datetime(2025, 5, 6, 7, 0), 4, 1],
+                        [datetime(2025, 5, 6, 7, 15), 5, 0]]
+    sheets = {
+        'Summary': [['Study Name', 'Whyte Ave Spring Count'],
+                    ['Project', None],
+                    ['Start Time', datetime(2025, 5, 6, 7, 0)],
+                    ['End Time', datetime(2025, 5, 6, 8, 0)],
+                    ['Location', 'Whyte Ave & 104 St'],
+                    ['Latitude and Longitude', '53.5,-113.5']],
+        'Total Volume Class Breakdown': [['Class', 'Northbound', 'Eastbound', 'Approach Total', 'Total'],
+                                         ['Grand Total', 10, 10, 20, 20],
+                                         ['Lights', 9, 9, 18, 18],
+                                         ['% Lights', 90, 90, 90, 90],
+                                         ['Buses', 1, 1, 2, 2]],
+        'Northbound': directional_rows,
+        'Eastbound': directional_rows,
+    }
+    with pd.ExcelWriter(path) as writer:
+        for sheet_name, rows in sheets.items():
+            pd.DataFrame(rows).to_excel(writer, sheet_name=sheet_name, header=False, index=False)
+
+def test_app_dry_run(tmp_path, capsys):
+    miovision_folder = tmp_path / 'Miovision 2025'
+    miovision_folder.mkdir()
+    write_miovision_file(miovision_folder / 'Roadway-1230846.xlsx')
+    database_path = tmp_path / 'dry_run.sqlite3'
+    
+    App(ApplicationConfiguration(
+        db_connection_string=f'sqlite:///{database_path}',
+        miovision_base_folder_names=[str(miovision_folder)],
+        vehicle_class_total_volume_sheet_name='Total Volume Class Breakdown',
+        validation_extension='.xlsx',
+        intitialize_tables=True,
+        intitialize_types=True,
+        reconcile_totals=True,
+        analytics_mirror_path=str(tmp_path / 'mirror.duckdb')
+    )).run()
+    
+    assert "Totals of 1 studies match the Excel files" in capsys.readouterr().out
+    assert not (tmp_path / 'mirror.duckdb').exists()
+    
+    database_connection = SQLiteDatabaseConnection(database_path)
+    rows = database_connection.execute_query(sql.SQL("SELECT COUNT(*), SUM({traffic_count}) FROM {granular_count}").format(
+        traffic_count=sql.Identifier(tables.GranularCountsTableColumns.traffic_count.value),
+        granular_count=sql.Identifier(tables.PredefinedTableNames.granular_count.value)
+    ))
+    # Zero counts are not stored
+    assert rows == [(6, 20)]
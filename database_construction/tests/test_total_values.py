@@ -1,15 +1,11 @@
 import pandas as pd
-from psycopg2 import connect
-from psycopg2._psycopg import cursor
-from psycopg2.sql import SQL, Identifier
 from pathlib import Path
-import tqdm
 import os
 from dotenv import load_dotenv
 import pytest
-from providers.tables_providers import PredefinedTableNames, GranularCountsTableColumns
-from providers.tables_providers import MovementsDirectionsTableColumns, MovementVehiclesTableColumns
-from providers.tables_providers import StudiesTableColumns, StudiesDirectionsTableColumns
+from providers.database_providers import PostgresDatabaseConnection
+from providers.reconciliation_providers import ReconciliationProvider, ReconciliationReport, ReconciliationColumns, find_total_discrepancies, extract_expected_totals, STUDY_KEYS
+from providers.extraction_providers import MiovisionExtractor
 
 
 @pytest.fixture(scope='module')
@@ -19,71 +15,47 @@ def test_database_connection_string()->str:
     assert url_key in os.environ, f"{url_key} not found in environment variables"
     database_connection_str = os.environ['LOCAL_DATABASE_URL']
     return database_connection_str
-    
+
 @pytest.fixture(scope='module')
 def test_database_connection(test_database_connection_string):
-    connection = connect(test_database_connection_string)
-    cursor = connection.cursor()
-    yield cursor
-    connection.close()
+    connection = PostgresDatabaseConnection(test_database_connection_string)
+    yield connection
+    connection.connection.close()
 
 def excel_files()->list[Path]:
     test_files_directory = Path('Granular Miovision Files')
-    
+
     assert test_files_directory.exists(), f'Test directory {test_files_directory} does not exist'
-    
+
     return [path for path in test_files_directory.iterdir()]
-    
-def get_total_value_from_excel(path:Path)->int:
-    total_volume_sheet_name = 'Total Volume Class Breakdown'
-    total_volume_row_label = 'Grand Total'
-    df = pd.read_excel(path,sheet_name = total_volume_sheet_name)
-    
-    total_values_including_label_df = df[df[df.columns[0]] == total_volume_row_label]
-    total_values_df = total_values_including_label_df[total_values_including_label_df.columns[1:]]
-    total_values_transposed_df = total_values_df.T
-    total_values_series : pd.Series[int] = total_values_transposed_df[total_values_transposed_df.columns[0]]
-    
-    # Last value of the series is double counted in the sum, so need to substract it
-    traffic_count = total_values_series.sum() - (2 * total_values_series.iloc[-1]) 
-    
-    return traffic_count
 
-def get_total_value_from_db(path:Path, transaction: cursor)->int:
-    stem_str = path.stem
-    miovision_id : int = int(stem_str.split('-')[-1])
-    
-    query = SQL("""
-        SELECT SUM(g.{traffic_count})
-        FROM {studies} s
-        JOIN {studies_directions} sd ON s.{studies_miovision_id} = sd.{sd_miovision_id}
-        JOIN {directions_movements} dm ON sd.id = dm.{study_direction_id}
-        JOIN {movements_vehicles} mv ON dm.id = mv.{direction_movement_id}
-        JOIN {granular_count} g ON mv.id = g.{movement_vehicle_id}
-        WHERE s.{studies_miovision_id} = %s;
-    """).format(
-        traffic_count = Identifier(GranularCountsTableColumns.traffic_count.value),
-        studies = Identifier(PredefinedTableNames.studies.value),
-        studies_directions = Identifier(PredefinedTableNames.studies_directions.value),
-        directions_movements = Identifier(PredefinedTableNames.directions_movements.value),
-        movements_vehicles = Identifier(PredefinedTableNames.movements_vehicles.value),
-        granular_count = Identifier(PredefinedTableNames.granular_count.value),
-        studies_miovision_id = Identifier(StudiesTableColumns.miovision_id.value),
-        sd_miovision_id = Identifier(StudiesDirectionsTableColumns.miovision_id.value),
-        study_direction_id = Identifier(MovementsDirectionsTableColumns.study_direction_id.value),
-        direction_movement_id = Identifier(MovementVehiclesTableColumns.direction_movement_id.value),
-        movement_vehicle_id = Identifier(GranularCountsTableColumns.movement_vehicle_id.value)
-    )
-    
-    transaction.execute(query, [miovision_id])
-    
-    result = transaction.fetchone()
-    if result is None:
-        raise Exception(f'None returned from DB for {stem_str}')
-    else:
-        traffic_count = int(result[0])
-        return traffic_count
-    
+@pytest.fixture(scope='module')
+def reconciliation_report(test_database_connection)->ReconciliationReport:
+    # All files are read in parallel and compared against one grouped query
+    return ReconciliationProvider(test_database_connection).reconcile(extract_expected_totals(excel_files()))
+
+def study_rows(totals:pd.DataFrame, path:Path)->pd.DataFrame:
+    miovision_id = int(MiovisionExtractor.get_miovision_id_string(path))
+    return totals[totals[ReconciliationColumns.miovision_id.value] == miovision_id]
+
 @pytest.mark.parametrize('path',excel_files())
-def test_total_db_values(path:Path,test_database_connection):
-    assert get_total_value_from_db(path,test_database_connection) == get_total_value_from_excel(path), f"Inequal values for {path}"
\ No newline at end of file
+def test_total_db_values(path:Path,reconciliation_report):
+    study_totals = study_rows(reconciliation_report.study_totals,path)
+
+    assert len(study_totals) == 1, f"Study of {path} not found"
+    assert (study_totals[ReconciliationColumns.difference.value] == 0).all(), f"Inequal values for {path}\n{study_totals.to_string(index=False)}"
+
+@pytest.mark.parametrize('path',excel_files())
+def test_direction_vehicle_db_values(path:Path,reconciliation_report):
+    discrepancies = study_rows(reconciliation_report.direction_vehicle_discrepancies,path)
+
+    assert discrepancies.empty, f"Inequal direction and vehicle class values for {path}\n{discrepancies.to_string(index=False)}"
+
+def test_total_discrepancies():
+    expected = pd.DataFrame({'miovision_id': [1, 2, 3], 'expected_count': [10, 20, 30]})
+    actual = pd.DataFrame({'miovision_id': [1, 2, 4], 'database_count': [10, 25, 40]})
+
+    report = find_total_discrepancies(expected,actual,STUDY_KEYS)
+
+    assert report['difference'].tolist() == [0, 5, -30, 40]
+    assert report['found_in'].tolist() == ['both', 'both', 'expected_only', 'database_only']
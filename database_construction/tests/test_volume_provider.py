@@ -1,5 +1,7 @@
 import pytest
-from .volume_provider import VolumeProvider, HtmlVolumeProvider, HtmlVolumeScraper, HtmlAuthenticator, LocalCredentialsProvider
+import json
+import time
+from .volume_provider import VolumeProvider, HtmlVolumeProvider, HtmlVolumeScraper, HtmlAuthenticator, LocalCredentialsProvider, CachedVolumeProvider, VolumeScrapingError
 from .volume_provider import CredentialsProvider, VolumeScraper, Authenticator, DirectionalVolumeAttr
 
 @pytest.fixture(scope="module")
@@ -70,4 +72,81 @@ def test_scraper(scraper,miovision_id_url):
 
 def test_provider(volume_provider,miovision_id, expected_result):
     result = volume_provider.get_volume(miovision_id)
-    assert result == expected_result, f"{result} does not equal {expected_result}"
\ No newline at end of file
+    assert result == expected_result, f"{result} does not equal {expected_result}"
+
+class StaticCredentialsProvider:
+    def get_username(self)->str:
+        return "username"
+    
+    def get_password(self)->str:
+        return "password"
+
+class CountingVolumeProvider:
+    def __init__(self, volumes:dict[str,DirectionalVolumeAttr]) -> None:
+        self.volumes = volumes
+        self.requested_ids : list[str] = []
+    
+    def get_volume(self, miovision_id:str)->dict[str,DirectionalVolumeAttr]:
+        self.requested_ids.append(miovision_id)
+        return self.volumes
+
+class PartiallyFailingBatchProvider:
+    def __init__(self, volumes:dict[str,DirectionalVolumeAttr], failing_ids:set[str]) -> None:
+        self.volumes = volumes
+        self.failing_ids = failing_ids
+        self.requested_ids : list[list[str]] = []
+    
+    def get_volumes(self, miovision_ids:list[str])->dict[str,dict[str,DirectionalVolumeAttr]]:
+        self.requested_ids.append(miovision_ids)
+        errors = {miovision_id: Exception("page did not load") for miovision_id in miovision_ids if miovision_id in self.failing_ids}
+        volumes = {miovision_id: self.volumes for miovision_id in miovision_ids if miovision_id not in self.failing_ids}
+        if errors:
+            raise VolumeScrapingError(volumes, errors)
+        return volumes
+
+def write_storage_state(path, expires:float):
+    path.write_text(json.dumps({"cookies": [{"name": "session", "expires": expires}, {"name": "csrf", "expires": -1}], "origins": []}))
+
+def test_authenticator_reuses_storage_state(tmp_path):
+    auth_file = tmp_path / 'auth.json'
+    
+    write_storage_state(auth_file, time.time() + 3600)
+    assert HtmlAuthenticator(StaticCredentialsProvider(), auth_file)._authenticated
+    
+    write_storage_state(auth_file, time.time() - 60)
+    assert not HtmlAuthenticator(StaticCredentialsProvider(), auth_file)._authenticated
+    
+    write_storage_state(auth_file, time.time() + 3600)
+    assert not HtmlAuthenticator(StaticCredentialsProvider(), auth_file, reuse_storage_state=False)._authenticated
+
+def test_cached_provider(tmp_path, expected_result):
+    cache_file = tmp_path / 'volume_cache.json'
+    provider = CountingVolumeProvider(expected_result)
+    
+    assert CachedVolumeProvider(provider, cache_file).get_volume(1230846) == expected_result
+    assert CachedVolumeProvider(provider, cache_file).get_volume(1230846) == expected_result
+    assert provider.requested_ids == ["1230846"], "Cached study scraped again"
+    
+    CachedVolumeProvider(provider, cache_file, scraper_version=2).get_volume(1230846)
+    assert len(provider.requested_ids) == 2, "Study scraped by another scraper version not scraped again"
+    
+    refreshing_provider = CachedVolumeProvider(provider, cache_file, scraper_version=2, refresh=True)
+    refreshing_provider.get_volume(1230846)
+    refreshing_provider.get_volume(1230846)
+    assert len(provider.requested_ids) == 3, "Refresh should scrape a study exactly once"
+    
+    time.sleep(0.01)
+    CachedVolumeProvider(provider, cache_file, scraper_version=2, max_age_seconds=0).get_volume(1230846)
+    assert len(provider.requested_ids) == 4, "Stale study not scraped again"
+
+def test_cached_provider_keeps_partial_batch(tmp_path, expected_result):
+    cache_file = tmp_path / 'volume_cache.json'
+    provider = PartiallyFailingBatchProvider(expected_result, failing_ids={"1230900"})
+    
+    with pytest.raises(VolumeScrapingError) as scraping_error:
+        CachedVolumeProvider(provider, cache_file).get_volumes([1230846, 1230900])
+    assert list(scraping_error.value.errors) == ["1230900"]
+    
+    provider.failing_ids.clear()
+    assert CachedVolumeProvider(provider, cache_file).get_volumes([1230846, 1230900])["1230900"] == expected_result
+    assert provider.requested_ids == [["1230846", "1230900"], ["1230900"]], "Scraped study not kept after a failed batch"
@@ -1,18 +1,41 @@
 from typing import Protocol, TypedDict
 from playwright.sync_api import sync_playwright, Locator
+from playwright.async_api import async_playwright, Browser, BrowserContext, Playwright
 from enum import StrEnum
 from pathlib import Path
 from dotenv import load_dotenv
+import asyncio
+import json
 import os
+import time
 
 class DirectionalVolumeAttr(TypedDict):
     total_volume : int
     in_volume : int
     out_volume : int
 
+class VolumeScrapingError(Exception):
+    """
+    Raised when some studies of a batch could not be scraped. ``volumes`` holds the studies that were
+    scraped and ``errors`` the error of every study that failed, both keyed like the request.
+    """
+    def __init__(self, volumes:dict, errors:dict[str,BaseException]) -> None:
+        super().__init__(f"Scraping failed for {len(errors)} studies: " + "; ".join(f"{key}: {error}" for key, error in errors.items()))
+        self.volumes = volumes
+        self.errors = errors
+
 class AuthenticationStorageConfig(StrEnum):
     path_name = 'auth.json'
 
+class VolumeCacheConfig(StrEnum):
+    path_name = 'volume_cache.json'
+
+# Bump whenever the scraping or parsing of study pages changes, so cached volumes are scraped again
+SCRAPER_VERSION = 1
+
+# Cookies expiring within this margin are considered expired, so a session does not expire mid-run
+AUTHENTICATION_EXPIRY_MARGIN_SECONDS = 300
+
 class AuthenticationScrapingConfig(StrEnum):
     email_locator_text = "input[name=username]"
     email_submit_locator_text = "button._button-login-id"
@@ -25,6 +48,17 @@ class VolumeScrapingConfig(StrEnum):
     in_volume_locator_text = 'text.enter_total'
     out_volume_locator_text = 'text.exit_total'
     volume_direction_id_name = 'data-direction'
+
+DIRECTION_NAME_MAPPING = {
+    1 : "Southbound",
+    2 : "Southwestbound",
+    3 : "Westbound",
+    4 : "Northwestbound",
+    5 : "Northbound",
+    6 : "Northeastbound",
+    7 : "Eastbound",
+    8 : "Southeastbound"
+}
     
 class LocalCredentials(StrEnum):
     username = "MIOVISION_USERNAME"
@@ -59,12 +93,31 @@ class LocalCredentialsProvider:
         return os.environ[LocalCredentials.password.value]
 
 class HtmlAuthenticator:
-    def __init__(self, credentials: CredentialsProvider, auth_file=AuthenticationStorageConfig.path_name.value) -> None:
+    def __init__(self, credentials: CredentialsProvider, auth_file=AuthenticationStorageConfig.path_name.value, reuse_storage_state:bool=True) -> None:
         self._auth_file = Path(auth_file)
-        self._authenticated = False
+        self._authenticated = reuse_storage_state and self._storage_state_is_valid()
         self._username = credentials.get_username()
         self._password = credentials.get_password()
     
+    def _storage_state_is_valid(self)->bool:
+        """
+        The storage state written by an earlier run can be reused as long as none of its cookies expired.
+        Session cookies (``expires == -1``) do not carry an expiry and are ignored.
+        """
+        if not self._auth_file.exists():
+            return False
+        
+        try:
+            cookies = json.loads(self._auth_file.read_text(encoding='utf-8')).get('cookies', [])
+        except (json.JSONDecodeError, AttributeError):
+            return False
+        
+        expiry_timestamps = [cookie['expires'] for cookie in cookies if cookie.get('expires', -1) > 0]
+        if not expiry_timestamps:
+            return False
+        
+        return min(expiry_timestamps) > time.time() + AUTHENTICATION_EXPIRY_MARGIN_SECONDS
+    
     def _authenticate(self)->None:
         with sync_playwright() as playwright:
             browser = playwright.chromium.launch()
@@ -88,32 +141,68 @@ class HtmlAuthenticator:
             self._authenticate()
         return self._auth_file
 
+def parse_volume(volume_string:str|None)->int:
+    if volume_string is None:
+        raise Exception("None passed in as volume_string")
+
+    # Expect "<label> : <volume>" structure for volume_string
+    volume_label_value = volume_string.split(":")
+    assert len(volume_label_value) == 2, "Text scraped from Volume Locator doesn't match '<label>: <count>' format."
+    
+    return int(volume_label_value[-1])
+
+def parse_directional_id(direction_id:str|None)->str:
+    if direction_id is None:
+        raise Exception(f"{VolumeScrapingConfig.volume_direction_id_name.value} attribute not found")
+    
+    return direction_id
+
+def combine_directions_volumes(in_volume_mapping:dict[str,int], out_volume_mapping:dict[str,int], total_volumes:list[tuple[str,int]])->list[tuple[str,DirectionalVolumeAttr]]:
+    direction_volumes : list[tuple[str,DirectionalVolumeAttr]] = []
+    
+    for directional_id, total_volume in total_volumes:
+        try:
+            in_volume = in_volume_mapping[directional_id]
+            out_volume = out_volume_mapping[directional_id]
+            volume_attr = DirectionalVolumeAttr(total_volume=total_volume,
+                                                in_volume=in_volume,
+                                                out_volume=out_volume)
+            
+            direction_volumes.append((directional_id,volume_attr))
+        except KeyError as e:
+            raise KeyError(f"Directional_id for total_volume_locator not found in mapping: {e}")
+    
+    return direction_volumes
+
+def map_direction_names(directions_volumes:list[tuple[str,DirectionalVolumeAttr]])->dict[str,DirectionalVolumeAttr]:
+    volume_mapping  : dict[str, DirectionalVolumeAttr]= {}
+    
+    for direction_id, volume_attributes in directions_volumes:
+        if volume_attributes["in_volume"] != 0:
+            try:
+                direction_name = DIRECTION_NAME_MAPPING[int(direction_id)]
+                volume_mapping[direction_name] = volume_attributes
+            except KeyError as e:
+                raise Exception(f'Direction_id returned from VolumeScraper not found in mapping: {e}')
+            except Exception as e:
+                raise Exception(f'Exception raised during volume provider processing: {e}')
+    
+    return volume_mapping
+
 class HtmlVolumeScraper:
     def __init__(self, authenticator: Authenticator) -> None:
         self._authentication_storage_session_path = authenticator.return_authentication_file()
 
     def _parse_volume(self,volume_string:str|None)->int:
-        if volume_string is None:
-            raise Exception("None passed in as volume_string")
-
-        # Expect "<label> : <volume>" structure for volume_string
-        volume_label_value = volume_string.split(":")
-        assert len(volume_label_value) == 2, "Text scraped from Volume Locator doesn't match '<label>: <count>' format."
-        
-        return int(volume_label_value[-1])
+        return parse_volume(volume_string)
     
     def _parse_directional_id(self,locator: Locator)->str:
-        direction_id = locator.get_attribute(VolumeScrapingConfig.volume_direction_id_name.value)
-        
-        if direction_id is None:
-            raise Exception(f"{VolumeScrapingConfig.volume_direction_id_name.value} attribute not found")
-        
-        return direction_id
+        return parse_directional_id(locator.get_attribute(VolumeScrapingConfig.volume_direction_id_name.value))
 
     def return_directions_volumes(self,url:str)->list[tuple[str,DirectionalVolumeAttr]]:
-        direction_volumes : list[tuple[str,DirectionalVolumeAttr]] = []
         in_volume_mapping : dict[str,int] = {}
         out_volume_mapping : dict[str,int] = {}
+        total_volumes : list[tuple[str,int]] = []
         
         with sync_playwright() as playwright:
             browser = playwright.chromium.launch()
@@ -134,49 +223,216 @@ class HtmlVolumeScraper:
                 
             
             for locator in total_volume_locators:
-                total_volume = self._parse_volume(locator.text_content())
-                directional_id = self._parse_directional_id(locator)
+                total_volumes.append((self._parse_directional_id(locator),self._parse_volume(locator.text_content())))
+                
+        return combine_directions_volumes(in_volume_mapping,out_volume_mapping,total_volumes)
 
+class AsyncHtmlVolumeScraper:
+    """
+    Keeps one browser and one authenticated context open and scrapes study pages concurrently.
+    Use as ``async with AsyncHtmlVolumeScraper(...) as scraper``.
+    """
+    def __init__(self, authenticator: Authenticator | None, max_concurrency:int=4, max_attempts:int=3, retry_delay_seconds:float=1.0, selector_timeout_ms:float=30_000) -> None:
+        # Without an authenticator the context starts logged out, e.g. for locally served pages
+        self._authentication_storage_session_path = authenticator.return_authentication_file() if authenticator is not None else None
+        self._max_concurrency = max_concurrency
+        self._max_attempts = max_attempts
+        self._retry_delay_seconds = retry_delay_seconds
+        self._selector_timeout_ms = selector_timeout_ms
+        self._playwright : Playwright | None = None
+        self._browser : Browser | None = None
+        self._context : BrowserContext | None = None
+        self._semaphore : asyncio.Semaphore | None = None
+    
+    async def __aenter__(self)->"AsyncHtmlVolumeScraper":
+        self._playwright = await async_playwright().start()
+        self._browser = await self._playwright.chromium.launch()
+        self._context = await self._browser.new_context(storage_state=self._authentication_storage_session_path)
+        self._semaphore = asyncio.Semaphore(self._max_concurrency)
+        return self
+    
+    async def __aexit__(self, *exc_info)->None:
+        await self._context.close()
+        await self._browser.close()
+        await self._playwright.stop()
+    
+    async def _read_volumes(self, page, locator_text:str)->list[tuple[str,int]]:
+        # One round trip per locator instead of one per element
+        attribute_text_pairs = await page.eval_on_selector_all(
+            locator_text,
+            "(elements, attribute) => elements.map(element => [element.getAttribute(attribute), element.textContent])",
+            VolumeScrapingConfig.volume_direction_id_name.value
+        )
+        return [(parse_directional_id(direction_id),parse_volume(volume_string)) for direction_id, volume_string in attribute_text_pairs]
+    
+    async def _scrape_page(self, url:str)->list[tuple[str,DirectionalVolumeAttr]]:
+        page = await self._context.new_page()
+        try:
+            await page.goto(url)
+            await page.wait_for_selector(VolumeScrapingConfig.total_volume_locator_text.value,timeout=self._selector_timeout_ms)
+            
+            in_volumes = await self._read_volumes(page,VolumeScrapingConfig.in_volume_locator_text.value)
+            out_volumes = await self._read_volumes(page,VolumeScrapingConfig.out_volume_locator_text.value)
+            total_volumes = await self._read_volumes(page,VolumeScrapingConfig.total_volume_locator_text.value)
+        finally:
+            await page.close()
+        
+        return combine_directions_volumes(dict(in_volumes),dict(out_volumes),total_volumes)
+    
+    async def return_directions_volumes(self, url:str)->list[tuple[str,DirectionalVolumeAttr]]:
+        if self._semaphore is None:
+            raise Exception("AsyncHtmlVolumeScraper must be used within 'async with'")
+        
+        async with self._semaphore:
+            for attempt in range(1, self._max_attempts + 1):
                 try:
-                    in_volume = in_volume_mapping[directional_id]
-                    out_volume = out_volume_mapping[directional_id]
-                    volume_attr = DirectionalVolumeAttr(total_volume=total_volume,
-                                                        in_volume=in_volume,
-                                                        out_volume=out_volume)
-                    
-                    direction_volumes.append((directional_id,volume_attr))
-                except KeyError as e:
-                    raise KeyError(f"Directional_id for total_volume_locator not found in mapping: {e}")
-                
-        return direction_volumes
+                    return await self._scrape_page(url)
+                except Exception as e:
+                    if attempt == self._max_attempts:
+                        raise Exception(f"Scraping {url} failed after {attempt} attempts: {e}")
+                    await asyncio.sleep(self._retry_delay_seconds * 2 ** (attempt - 1))
+    
+    async def return_all_directions_volumes(self, urls:list[str])->dict[str,list[tuple[str,DirectionalVolumeAttr]]]:
+        # One failed study must not discard the studies that were scraped alongside it
+        results = await asyncio.gather(*(self.return_directions_volumes(url) for url in urls), return_exceptions=True)
+        directions_volumes = {url: result for url, result in zip(urls, results) if not isinstance(result, BaseException)}
+        errors = {url: result for url, result in zip(urls, results) if isinstance(result, BaseException)}
+        
+        if errors:
+            raise VolumeScrapingError(directions_volumes, errors)
+        return directions_volumes
 
 class HtmlVolumeProvider:
     def __init__(self, base_url:str, scraper: VolumeScraper) -> None:
         self._base_url = base_url
         self._scraper = scraper
-        self._direction_name_mapping = {
-            1 : "Southbound",
-            2 : "Southwestbound",
-            3 : "Westbound",
-            4 : "Northwestbound",
-            5 : "Northbound",
-            6 : "Northeastbound",
-            7 : "Eastbound",
-            8 : "Southeastbound"
-        }
         
     def get_volume(self, miovision_id: str)->dict[str,DirectionalVolumeAttr]:
         directions_volumes = self._scraper.return_directions_volumes(f'{self._base_url}{miovision_id}')
-        volume_mapping  : dict[str, DirectionalVolumeAttr]= {}
+        return map_direction_names(directions_volumes)
+
+class ConcurrentHtmlVolumeProvider:
+    """
+    ``VolumeProvider`` that scrapes many studies in one browser session, see ``AsyncHtmlVolumeScraper``.
+    """
+    def __init__(self, base_url:str, authenticator: Authenticator | None, max_concurrency:int=4, max_attempts:int=3, selector_timeout_ms:float=30_000) -> None:
+        self._base_url = base_url
+        self._authenticator = authenticator
+        self._max_concurrency = max_concurrency
+        self._max_attempts = max_attempts
+        self._selector_timeout_ms = selector_timeout_ms
+    
+    async def _scrape(self, urls:list[str])->dict[str,list[tuple[str,DirectionalVolumeAttr]]]:
+        async with AsyncHtmlVolumeScraper(self._authenticator,
+                                          max_concurrency=self._max_concurrency,
+                                          max_attempts=self._max_attempts,
+                                          selector_timeout_ms=self._selector_timeout_ms) as scraper:
+            return await scraper.return_all_directions_volumes(urls)
+    
+    def get_volumes(self, miovision_ids: list[str])->dict[str,dict[str,DirectionalVolumeAttr]]:
+        urls = {str(miovision_id): f'{self._base_url}{miovision_id}' for miovision_id in miovision_ids}
+        try:
+            directions_volumes = asyncio.run(self._scrape(list(urls.values())))
+        except VolumeScrapingError as e:
+            # Key the partial results by study, so callers can keep the studies that were scraped
+            volumes = {miovision_id: map_direction_names(e.volumes[url]) for miovision_id, url in urls.items() if url in e.volumes}
+            errors = {miovision_id: e.errors[url] for miovision_id, url in urls.items() if url in e.errors}
+            raise VolumeScrapingError(volumes, errors) from e
+        return {miovision_id: map_direction_names(directions_volumes[url]) for miovision_id, url in urls.items()}
+    
+    def get_volume(self, miovision_id: str)->dict[str,DirectionalVolumeAttr]:
+        return self.get_volumes([miovision_id])[str(miovision_id)]
+
+class CachedVolumeProvider:
+    """
+    ``VolumeProvider`` that keeps the volumes of every study it has seen in a JSON file, so repeated runs
+    only scrape new studies. Entries scraped by another ``scraper_version`` or older than ``max_age_seconds``
+    are scraped again, and ``refresh`` scrapes every study once more before the cache is used again.
+    """
+    def __init__(self, provider: VolumeProvider, cache_file=VolumeCacheConfig.path_name.value, scraper_version:int=SCRAPER_VERSION, max_age_seconds:float|None=None, refresh:bool=False) -> None:
+        self._provider = provider
+        self._cache_file = Path(cache_file)
+        self._scraper_version = scraper_version
+        self._max_age_seconds = max_age_seconds
+        self._refresh = refresh
+        self._refreshed_ids : set[str] = set()
+        self._entries : dict[str,dict] = self._load()
+    
+    def _load(self)->dict[str,dict]:
+        if not self._cache_file.exists():
+            return {}
         
-        for direction_id, volume_attributes in directions_volumes:
-            if volume_attributes["in_volume"] != 0:
-                try:
-                    direction_name = self._direction_name_mapping[int(direction_id)]
-                    volume_mapping[direction_name] = volume_attributes
-                except KeyError as e:
-                    raise Exception(f'Direction_id returned from VolumeScraper not found in mapping: {e}')
-                except Exception as e:
-                    raise Exception(f'Exception raised during volume provider processing: {e}')
+        try:
+            return json.loads(self._cache_file.read_text(encoding='utf-8'))
+        except json.JSONDecodeError:
+            # A corrupt cache only costs a re-scrape
+            return {}
+    
+    def _save(self)->None:
+        temporary_file = self._cache_file.with_suffix(f'{self._cache_file.suffix}.tmp')
+        temporary_file.write_text(json.dumps(self._entries, indent=2, sort_keys=True), encoding='utf-8')
+        os.replace(temporary_file, self._cache_file)
+    
+    def _is_fresh(self, miovision_id:str)->bool:
+        entry = self._entries.get(miovision_id)
+        if entry is None or entry['scraper_version'] != self._scraper_version:
+            return False
+        if self._refresh and miovision_id not in self._refreshed_ids:
+            return False
+        if self._max_age_seconds is not None and time.time() - entry['scraped_at'] > self._max_age_seconds:
+            return False
+        return True
+    
+    def _store(self, miovision_id:str, volumes:dict[str,DirectionalVolumeAttr])->None:
+        self._entries[miovision_id] = {
+            'scraper_version': self._scraper_version,
+            'scraped_at': time.time(),
+            'volumes': volumes
+        }
+        self._refreshed_ids.add(miovision_id)
+    
+    def _scrape(self, miovision_ids:list[str])->tuple[dict[str,dict[str,DirectionalVolumeAttr]],dict[str,BaseException]]:
+        # Providers scraping in batches (e.g. ConcurrentHtmlVolumeProvider) get all missing studies at once
+        if hasattr(self._provider, 'get_volumes'):
+            try:
+                return self._provider.get_volumes(miovision_ids), {}
+            except VolumeScrapingError as e:
+                return e.volumes, e.errors
         
-        return volume_mapping
\ No newline at end of file
+        scraped_volumes, errors = {}, {}
+        for miovision_id in miovision_ids:
+            try:
+                scraped_volumes[miovision_id] = self._provider.get_volume(miovision_id)
+            except Exception as e:
+                errors[miovision_id] = e
+        return scraped_volumes, errors
+    
+    def invalidate(self, miovision_id:str|None=None)->None:
+        """
+        Remove one study, or all studies when ``miovision_id`` is ``None``, from the cache.
+        """
+        if miovision_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(str(miovision_id), None)
+        self._save()
+    
+    def get_volumes(self, miovision_ids: list[str])->dict[str,dict[str,DirectionalVolumeAttr]]:
+        miovision_ids = [str(miovision_id) for miovision_id in miovision_ids]
+        missing_ids = [miovision_id for miovision_id in dict.fromkeys(miovision_ids) if not self._is_fresh(miovision_id)]
+        
+        if missing_ids:
+            scraped_volumes, errors = self._scrape(missing_ids)
+            
+            # Studies that were scraped are kept even if others failed, so a retry only scrapes the failures
+            for miovision_id, volumes in scraped_volumes.items():
+                self._store(miovision_id, volumes)
+            self._save()
+            
+            if errors:
+                raise VolumeScrapingError(scraped_volumes, errors)
+        
+        return {miovision_id: self._entries[miovision_id]['volumes'] for miovision_id in miovision_ids}
+    
+    def get_volume(self, miovision_id: str)->dict[str,DirectionalVolumeAttr]:
+        return self.get_volumes([miovision_id])[str(miovision_id)]
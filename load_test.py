@@ -0,0 +1,239 @@
+"""
+Load test for the chat server.
+
+Starts ``server.py`` under uvicorn with a stubbed ``SQLAgent`` whose LLM steps only sleep, while previews
+and Excel files are still produced by the real code against ``DATABASE_URL``. Virtual users then run chat
+sessions like the front end does (validate, then query, preview and Excel file, or suggestions for invalid
+prompts) at increasing concurrency, and the throughput, latency percentiles, error rates and server memory
+are reported per concurrency level.
+
+    DATABASE_URL=postgresql://... python load_test.py --concurrency 1 4 16 64 --duration 30
+
+Stub behaviour is configured with LOAD_TEST_VALIDATE_LATENCY_MS, LOAD_TEST_SUGGESTION_LATENCY_MS,
+LOAD_TEST_QUERY_LATENCY_MS and LOAD_TEST_RESULT_ROWS.
+"""
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterator
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+import numpy as np
+
+INVALID_PROMPT_PREFIX = "invalid:"
+
+def create_stub_app():
+    """
+    uvicorn factory for the server with a ``StubSQLAgent``.
+    """
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    from database_chat import SQLAgent, QueryEvent
+    import server
+
+    class StubSQLAgent(SQLAgent):
+        """
+        Agent whose LLM steps sleep for a configured time. Generated queries return a configurable
+        number of rows from ``generate_series``, so they run on any Postgres database.
+        """
+        def __init__(self) -> None:
+            super().__init__(llm=FakeListChatModel(responses=["True"]))
+            self.validate_latency_seconds = float(os.getenv("LOAD_TEST_VALIDATE_LATENCY_MS",200)) / 1000
+            self.suggestion_latency_seconds = float(os.getenv("LOAD_TEST_SUGGESTION_LATENCY_MS",1000)) / 1000
+            self.query_latency_seconds = float(os.getenv("LOAD_TEST_QUERY_LATENCY_MS",3000)) / 1000
+            self.result_rows = int(os.getenv("LOAD_TEST_RESULT_ROWS",10_000))
+
+        def validate_prompt_adequacy(self, prompt:str)->bool:
+            time.sleep(self.validate_latency_seconds)
+            return not prompt.startswith(INVALID_PROMPT_PREFIX)
+
+        def stream_prompt_suggestions(self, prompt:str)->Iterator[str]:
+            words = "Please add the study id, location or date you are interested in.".split(" ")
+            for word in words:
+                time.sleep(self.suggestion_latency_seconds / len(words))
+                yield word + " "
+
+        def stream_query(self, prompt:str, cancel_event=None)->Iterator[QueryEvent]:
+            query = f"SELECT g AS row_number, md5(g::text) AS value, g % 24 AS hour FROM generate_series(1, {self.result_rows}) AS g;"
+            for token in query.split(" "):
+                time.sleep(self.query_latency_seconds / len(query.split(" ")))
+                yield QueryEvent(event_type="token",content=token + " ")
+            yield QueryEvent(event_type="query",content=query)
+
+    return server.create_app(StubSQLAgent())
+
+@dataclass
+class RequestSample:
+    endpoint : str
+    status_code : int | None
+    is_error : bool
+    seconds : float
+
+@dataclass
+class LevelReport:
+    concurrency : int
+    duration_seconds : float
+    sessions : int
+    samples : list[RequestSample] = field(default_factory=list)
+    peak_rss_megabytes : float | None = None
+
+def read_rss_megabytes(pid:int)->float | None:
+    try:
+        with open(f"/proc/{pid}/status",'r') as file:
+            for line in file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+async def timed_request(client:httpx.AsyncClient, samples:list[RequestSample], endpoint:str, method:str, url:str, **kwargs)->httpx.Response | None:
+    start_time = time.perf_counter()
+    try:
+        response = await client.request(method,url,**kwargs)
+    except httpx.HTTPError:
+        samples.append(RequestSample(endpoint,None,True,time.perf_counter() - start_time))
+        return None
+
+    # Some endpoints report errors in a JSON body with a 200 status
+    is_error = response.status_code >= 400 or (
+        response.headers.get('content-type','').startswith('application/json') and 'error' in response.json()
+    )
+    samples.append(RequestSample(endpoint,response.status_code,is_error,time.perf_counter() - start_time))
+    return response
+
+async def run_session(client:httpx.AsyncClient, samples:list[RequestSample], prompt:str)->None:
+    response = await timed_request(client,samples,"/validate","POST","/validate",json={"prompt":prompt})
+    if response is None or response.status_code != 200 or 'is_valid' not in response.json():
+        return
+
+    if not response.json()['is_valid']:
+        await timed_request(client,samples,"/suggestion","POST","/suggestion",json={"prompt":prompt})
+        return
+
+    query_token = response.json().get('query_token')
+    if query_token is not None:
+        response = await timed_request(client,samples,"/query","GET",f"/query/{query_token}")
+    else:
+        response = await timed_request(client,samples,"/query","POST","/query",json={"prompt":prompt})
+    if response is None or response.status_code != 200 or 'query' not in response.json():
+        return
+
+    query = response.json()['query']
+    await timed_request(client,samples,"/preview","POST","/preview",json={"prompt":query,"page_size":50})
+    await timed_request(client,samples,"/excel_file","POST","/excel_file",json={"prompt":query})
+
+async def run_level(base_url:str, concurrency:int, duration_seconds:float, invalid_ratio:float, server_pid:int | None)->LevelReport:
+    report = LevelReport(concurrency=concurrency,duration_seconds=duration_seconds,sessions=0)
+    session_numbers = itertools.count()
+    deadline = time.monotonic() + duration_seconds
+
+    async def virtual_user(user_number:int)->None:
+        headers = {'X-Client-Id': f'load-test-user-{user_number}'}
+        async with httpx.AsyncClient(base_url=base_url,headers=headers,timeout=600) as client:
+            while time.monotonic() < deadline:
+                session_number = next(session_numbers)
+                # Every prompt is unique so identical requests are not coalesced by the server
+                prompt = f"Total volume by direction for session {session_number}"
+                if random.random() < invalid_ratio:
+                    prompt = INVALID_PROMPT_PREFIX + prompt
+                await run_session(client,report.samples,prompt)
+                report.sessions += 1
+
+    async def sample_memory()->None:
+        while True:
+            rss_megabytes = read_rss_megabytes(server_pid)
+            if rss_megabytes is not None:
+                report.peak_rss_megabytes = max(report.peak_rss_megabytes or 0, rss_megabytes)
+            await asyncio.sleep(0.5)
+
+    memory_task = asyncio.create_task(sample_memory()) if server_pid is not None else None
+    start_time = time.monotonic()
+    await asyncio.gather(*(virtual_user(user_number) for user_number in range(concurrency)))
+    report.duration_seconds = time.monotonic() - start_time
+    if memory_task is not None:
+        memory_task.cancel()
+
+    return report
+
+def format_report(report:LevelReport)->str:
+    summary = f"Concurrency {report.concurrency}: {report.sessions} sessions, {len(report.samples) / report.duration_seconds:.1f} requests/s"
+    if report.peak_rss_megabytes is not None:
+        summary += f", peak server RSS {report.peak_rss_megabytes:.0f} MB"
+    lines = [summary]
+    header = f"  {'endpoint':<12}{'requests':>10}{'errors %':>10}{'429 %':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    lines.append(header)
+
+    endpoints = sorted({sample.endpoint for sample in report.samples})
+    for endpoint in endpoints:
+        endpoint_samples = [sample for sample in report.samples if sample.endpoint == endpoint]
+        durations_ms = np.array([sample.seconds for sample in endpoint_samples]) * 1000
+        error_count = sum(1 for sample in endpoint_samples if sample.is_error)
+        rejected_count = sum(1 for sample in endpoint_samples if sample.status_code == 429)
+        lines.append(
+            f"  {endpoint:<12}{len(endpoint_samples):>10}"
+            f"{100 * error_count / len(endpoint_samples):>10.1f}{100 * rejected_count / len(endpoint_samples):>8.1f}"
+            f"{np.percentile(durations_ms,50):>10.0f}{np.percentile(durations_ms,95):>10.0f}{np.percentile(durations_ms,99):>10.0f}"
+        )
+
+    return "\n".join(lines)
+
+def start_stub_server(port:int)->subprocess.Popen:
+    environment = os.environ.copy()
+    # Replayed LLM without a cassette, so importing the server needs no API key, the stub never calls it
+    environment.setdefault("LLM_MODE","replay")
+    environment.setdefault("LLM_CASSETTE_PATH",str(Path(tempfile.gettempdir()) / "load_test_missing_cassette.json"))
+    # Results are produced by the database rather than the result cache
+    environment.setdefault("RESULT_CACHE_MAX_BYTES","0")
+
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "load_test:create_stub_app", "--factory", "--port", str(port), "--log-level", "warning"],
+        cwd=Path(__file__).parent,
+        env=environment
+    )
+
+def wait_for_server(base_url:str, timeout_seconds:float)->None:
+    deadline = time.monotonic() + timeout_seconds
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{base_url}/",timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise TimeoutError(f"Server at {base_url} did not start within {timeout_seconds}s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the chat server with a stubbed SQLAgent.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32], help="Concurrent virtual users per level")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds per concurrency level")
+    parser.add_argument("--invalid-ratio", type=float, default=0.2, help="Share of sessions whose prompt fails validation")
+    parser.add_argument("--port", type=int, default=8765, help="Port of the stub server")
+    parser.add_argument("--base-url", default=None, help="Test an already running server instead of starting the stub")
+    parser.add_argument("--server-pid", type=int, default=None, help="Process id of the running server, for memory sampling")
+    arguments = parser.parse_args()
+
+    server_process = None
+    base_url = arguments.base_url
+    server_pid = arguments.server_pid
+
+    if base_url is None:
+        server_process = start_stub_server(arguments.port)
+        base_url = f"http://127.0.0.1:{arguments.port}"
+        server_pid = server_process.pid
+
+    try:
+        wait_for_server(base_url,timeout_seconds=60)
+        for concurrency in arguments.concurrency:
+            report = asyncio.run(run_level(base_url,concurrency,arguments.duration,arguments.invalid_ratio,server_pid))
+            print(format_report(report),flush=True)
+    finally:
+        if server_process is not None:
+            server_process.terminate()
+            server_process.wait()
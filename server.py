@@ -1,16 +1,31 @@
-from fastapi import APIRouter, FastAPI
-from pydantic import BaseModel
-from database_chat import SQLAgent
+from fastapi import APIRouter, FastAPI, Query, Request
+from pydantic import BaseModel, Field
+from database_chat import SpeculativeQueryRunner, QueryJobQueue, QueryJob, AdmissionController, AdmissionRejectedError
+from database_chat.metrics import REGISTRY, REQUEST_DURATION, request_timing, timed_stage
 from fastapi.encoders import jsonable_encoder
-from fastapi.responses import JSONResponse, Response
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
+from contextlib import asynccontextmanager
 from io import BytesIO
-import pandas as pd
+from typing import Callable, Iterator, TYPE_CHECKING
+import json
+import os
+import threading
+import tempfile
+import time
+from pathlib import Path
+
+# The agent and pandas are imported when the components are built or a route needs them, so that a cold
+# start only pays for FastAPI before the app can be served
+if TYPE_CHECKING:
+    from database_chat import SQLAgent
 
 class RequestBody(BaseModel):
     prompt: str
     
 class ValidationResponse(BaseModel):
     is_valid:bool
+    query_token:str | None = None
 
 class SuggestionsResponse(BaseModel):
     suggestion:str
@@ -21,7 +36,152 @@ class QueryResponse(BaseModel):
 class ErrorResponse(BaseModel):
     error:str
 
-def configure_api_router(router:APIRouter,agent:SQLAgent)->APIRouter:
+class PreviewRequestBody(BaseModel):
+    prompt: str
+    page_size: int = Field(default=50,gt=0,le=1000)
+    offset: int = Field(default=0,ge=0)
+
+class PreviewResponse(BaseModel):
+    columns:list[str]
+    rows:list[dict]
+    estimated_row_count:int
+    page_size:int
+    offset:int
+
+class JobResponse(BaseModel):
+    job_id:str
+    status:str
+    query:str | None = None
+    error:str | None = None
+
+def to_job_response(job:QueryJob)->JobResponse:
+    return JobResponse(job_id=job.job_id,status=job.status,query=job.query,error=job.error)
+
+# Admission priorities, lower values are admitted first
+VALIDATION_PRIORITY = 0
+SUGGESTION_PRIORITY = 1
+QUERY_PRIORITY = 2
+JOB_CLIENT_ID = 'query-jobs'
+
+def to_client_id(request:Request)->str:
+    return request.headers.get('X-Client-Id') or (request.client.host if request.client else 'unknown')
+
+def too_many_requests_response(error:AdmissionRejectedError)->JSONResponse:
+    error_response = ErrorResponse(error=str(error.args))
+    jsonable_response = jsonable_encoder(error_response)
+    headers = {'Retry-After': str(error.retry_after_seconds)}
+    return JSONResponse(content=jsonable_response,status_code=429,headers=headers)
+
+def to_server_sent_event(event_type:str,data:dict)->str:
+    return f"event: {event_type}\ndata: {json.dumps(data)}\n\n"
+
+def stream_query_events(event_itr:Iterator)->Iterator[str]:
+    """
+    Convert query events into server-sent events, ending the stream with an ``error`` event if generation fails.
+    """
+    try:
+        for event in event_itr:
+            yield to_server_sent_event(event.event_type,{"content":event.content,"name":event.name})
+    except Exception as e:
+        yield to_server_sent_event("error",jsonable_encoder(ErrorResponse(error=str(e.args))))
+
+def streaming_response(event_itr:Iterator[str],admission:AdmissionController|None=None,client_id:str|None=None)->StreamingResponse:
+    """
+    Wrap the server-sent events in a response. If an admission slot is given, it is released once the
+    stream ends, or after the response if the stream was never started.
+    """
+    release_lock = threading.Lock()
+    is_released = False
+    
+    def release_slot():
+        nonlocal is_released
+        with release_lock:
+            if admission is None or is_released:
+                return
+            is_released = True
+        admission.release(client_id)
+    
+    def released_event_itr():
+        try:
+            yield from event_itr
+        finally:
+            release_slot()
+    
+    # Proxies must not buffer the stream, otherwise the tokens arrive all at once
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    return StreamingResponse(released_event_itr(),media_type='text/event-stream',headers=headers,background=BackgroundTask(release_slot))
+
+class ServerComponents:
+    """
+    The agent and the components serving it. They are built once per process by the lifespan hook, or by
+    the first request on runtimes that do not send lifespan events.
+    """
+    def __init__(self, agent_factory:Callable[[],"SQLAgent"]) -> None:
+        self._agent_factory = agent_factory
+        self._lock = threading.Lock()
+        self._is_started = False
+    
+    def start(self)->None:
+        with self._lock:
+            if self._is_started:
+                return
+            
+            self._agent = self._agent_factory()
+            self._speculative_runner = SpeculativeQueryRunner(
+                generator=self._agent,
+                max_workers=int(os.getenv("SPECULATIVE_QUERY_WORKERS",4)),
+                result_ttl_seconds=float(os.getenv("SPECULATIVE_QUERY_TTL",600))
+            )
+            # Requests wait for a slot on the server's worker threads, the wait is bounded so they cannot all block
+            self._admission = AdmissionController(
+                max_concurrency=int(os.getenv("ADMISSION_MAX_CONCURRENCY",4)),
+                max_queue_size=int(os.getenv("ADMISSION_MAX_QUEUE",32)),
+                max_queued_per_client=int(os.getenv("ADMISSION_MAX_QUEUED_PER_CLIENT",4)),
+                max_wait_seconds=float(os.getenv("ADMISSION_MAX_WAIT",30))
+            )
+            # Built after the admission controller since jobs left over from a previous run start right away
+            self._job_queue = QueryJobQueue(
+                generate_query=self._generate_job_query,
+                database_path=Path(os.getenv("QUERY_JOB_DATABASE_PATH",Path(tempfile.gettempdir()) / "coe_query_jobs.sqlite3")),
+                max_workers=int(os.getenv("QUERY_JOB_WORKERS",2)),
+                result_ttl_seconds=float(os.getenv("QUERY_JOB_TTL",24 * 60 * 60))
+            )
+            self._is_started = True
+    
+    def _generate_job_query(self, prompt:str)->str:
+        # Jobs share one client id, so together they get a single client's share of the slots
+        return self._admission.run(
+            "query",prompt,JOB_CLIENT_ID,QUERY_PRIORITY,
+            lambda: self._agent.generate_query(prompt)
+        )
+    
+    def shutdown(self)->None:
+        with self._lock:
+            if self._is_started:
+                self._job_queue.shutdown()
+                self._is_started = False
+    
+    @property
+    def agent(self)->"SQLAgent":
+        self.start()
+        return self._agent
+    
+    @property
+    def speculative_runner(self)->SpeculativeQueryRunner:
+        self.start()
+        return self._speculative_runner
+    
+    @property
+    def job_queue(self)->QueryJobQueue:
+        self.start()
+        return self._job_queue
+    
+    @property
+    def admission(self)->AdmissionController:
+        self.start()
+        return self._admission
+
+def configure_api_router(router:APIRouter,components:ServerComponents)->APIRouter:
     """
     Given the router, configure paths
     """
@@ -29,48 +189,195 @@ def configure_api_router(router:APIRouter,agent:SQLAgent)->APIRouter:
     def sanity_check():
         return {"Message":"Connection Works"}
     
+    @router.get('/metrics')
+    def get_metrics():
+        return Response(content=REGISTRY.render(),media_type='text/plain; version=0.0.4')
+    
     
 
     @router.post('/validate')
-    def post_hander(request_body:RequestBody):
+    def post_hander(request_body:RequestBody,request:Request):
+        client_id = to_client_id(request)
         
+        # Most prompts pass validation, so query generation starts right away and is cancelled if they don't.
+        # It only starts when a slot is free and another one stays free, so it never delays admitted requests.
+        query_token = None
+        if components.admission.try_acquire(client_id,reserve=1):
+            query_token = components.speculative_runner.start(request_body.prompt,on_finish=lambda: components.admission.release(client_id))
         try:
-            is_valid = agent.validate_prompt_adequacy(request_body.prompt)
-            response = ValidationResponse(is_valid=is_valid)
+            is_valid = components.admission.run(
+                "validate",request_body.prompt,client_id,VALIDATION_PRIORITY,
+                lambda: components.agent.validate_prompt_adequacy(request_body.prompt)
+            )
+            if not is_valid and query_token is not None:
+                components.speculative_runner.cancel(query_token)
+            response = ValidationResponse(is_valid=is_valid,query_token=query_token if is_valid else None)
             jsonable_response = jsonable_encoder(response)
             return JSONResponse(content=jsonable_response)
+        except AdmissionRejectedError as e:
+            if query_token is not None:
+                components.speculative_runner.cancel(query_token)
+            return too_many_requests_response(e)
         except Exception as e:
+            if query_token is not None:
+                components.speculative_runner.cancel(query_token)
             error_response = ErrorResponse(error=str(e.args))
             jsonable_response = jsonable_encoder(error_response)
             return JSONResponse(content=jsonable_response)
     
     @router.post('/suggestion')
-    def post_handler(request_body:RequestBody):
-        suggestion = agent.generate_prompt_suggestions(request_body.prompt)
+    def post_handler(request_body:RequestBody,request:Request):
+        try:
+            suggestion = components.admission.run(
+                "suggestion",request_body.prompt,to_client_id(request),SUGGESTION_PRIORITY,
+                lambda: components.agent.generate_prompt_suggestions(request_body.prompt)
+            )
+        except AdmissionRejectedError as e:
+            return too_many_requests_response(e)
         response = SuggestionsResponse(suggestion=suggestion)
         jsonable_response = jsonable_encoder(response)
         return JSONResponse(content=jsonable_response)
     
+    @router.post('/suggestion/stream')
+    def post_handler(request_body:RequestBody,request:Request):
+        client_id = to_client_id(request)
+        try:
+            components.admission.acquire(client_id,SUGGESTION_PRIORITY)
+        except AdmissionRejectedError as e:
+            return too_many_requests_response(e)
+        
+        def suggestion_events():
+            try:
+                for chunk in components.agent.stream_prompt_suggestions(request_body.prompt):
+                    yield to_server_sent_event("token",{"content":chunk})
+                yield to_server_sent_event("done",{})
+            except Exception as e:
+                yield to_server_sent_event("error",jsonable_encoder(ErrorResponse(error=str(e.args))))
+        
+        return streaming_response(suggestion_events(),components.admission,client_id)
+    
+    @router.post('/query/stream')
+    def post_handler(request_body:RequestBody,request:Request):
+        client_id = to_client_id(request)
+        try:
+            components.admission.acquire(client_id,QUERY_PRIORITY)
+        except AdmissionRejectedError as e:
+            return too_many_requests_response(e)
+        
+        return streaming_response(stream_query_events(components.agent.stream_query(request_body.prompt)),components.admission,client_id)
+    
+    @router.get('/query/{query_token}/stream')
+    def get_handler(query_token:str):
+        try:
+            event_itr = components.speculative_runner.stream(query_token)
+        except KeyError as e:
+            error_response = ErrorResponse(error=str(e.args))
+            jsonable_response = jsonable_encoder(error_response)
+            return JSONResponse(content=jsonable_response,status_code=404)
+        
+        return streaming_response(stream_query_events(event_itr))
+    
     @router.post('/query')
-    def post_hander(request_body:RequestBody):
-        query = agent.generate_query(request_body.prompt)
+    def post_hander(request_body:RequestBody,request:Request):
+        try:
+            query = components.admission.run(
+                "query",request_body.prompt,to_client_id(request),QUERY_PRIORITY,
+                lambda: components.agent.generate_query(request_body.prompt)
+            )
+        except AdmissionRejectedError as e:
+            return too_many_requests_response(e)
         response = QueryResponse(query=query)
         jsonable_response = jsonable_encoder(response)
         return JSONResponse(content=jsonable_response)
     
+    @router.get('/query/{query_token}')
+    def get_handler(query_token:str):
+        try:
+            query = components.speculative_runner.collect(query_token)
+            response = QueryResponse(query=query)
+            jsonable_response = jsonable_encoder(response)
+            return JSONResponse(content=jsonable_response)
+        except KeyError as e:
+            error_response = ErrorResponse(error=str(e.args))
+            jsonable_response = jsonable_encoder(error_response)
+            return JSONResponse(content=jsonable_response,status_code=404)
+        except Exception as e:
+            error_response = ErrorResponse(error=str(e.args))
+            jsonable_response = jsonable_encoder(error_response)
+            return JSONResponse(content=jsonable_response)
+    
+    @router.post('/jobs')
+    def post_handler(request_body:RequestBody):
+        # The job runs later through the admission controller, submissions are refused while it is full
+        try:
+            components.admission.check_capacity(JOB_CLIENT_ID)
+        except AdmissionRejectedError as e:
+            return too_many_requests_response(e)
+        job = components.job_queue.submit(request_body.prompt)
+        jsonable_response = jsonable_encoder(to_job_response(job))
+        return JSONResponse(content=jsonable_response,status_code=202)
+    
+    @router.get('/jobs/{job_id}')
+    def get_handler(job_id:str,wait:float=Query(default=0,ge=0,le=60)):
+        # With wait > 0 the request is held until the job finishes or the wait runs out (long polling)
+        try:
+            job = components.job_queue.wait(job_id,wait) if wait > 0 else components.job_queue.get(job_id)
+            jsonable_response = jsonable_encoder(to_job_response(job))
+            return JSONResponse(content=jsonable_response)
+        except KeyError as e:
+            error_response = ErrorResponse(error=str(e.args))
+            jsonable_response = jsonable_encoder(error_response)
+            return JSONResponse(content=jsonable_response,status_code=404)
+    
+    @router.post('/preview')
+    def post_handler(request_body:PreviewRequestBody):
+        try:
+            preview = components.agent.return_preview(request_body.prompt,request_body.page_size,request_body.offset)
+            # Missing values are sent as null since NaN is not valid JSON
+            page_df = preview.dataframe.astype(object).where(preview.dataframe.notna(),None)
+            response = PreviewResponse(
+                columns=[str(column) for column in page_df.columns],
+                rows=page_df.to_dict(orient='records'),
+                estimated_row_count=preview.estimated_row_count,
+                page_size=preview.page_size,
+                offset=preview.offset
+            )
+            jsonable_response = jsonable_encoder(response)
+            return JSONResponse(content=jsonable_response)
+        except Exception as e:
+            error_response = ErrorResponse(error=str(e.args))
+            jsonable_response = jsonable_encoder(error_response)
+            return JSONResponse(content=jsonable_response)
+    
     @router.post('/excel_file')
     def post_handler(request_body:RequestBody):
+        import pandas as pd
+        from database_chat import QueryRejectedError
+        
         try:
-            df = agent.return_dataframe(request_body.prompt)
+            query_result = components.agent.return_query_result(request_body.prompt)
+            df = query_result.dataframe
             excel_buffer = BytesIO()
             
-            with pd.ExcelWriter(path=excel_buffer) as writer:
+            with timed_stage("excel"), pd.ExcelWriter(path=excel_buffer) as writer:
                 df.to_excel(writer,index=False)
             
             excel_buffer.seek(0)
             headers = {'Content-Disposition': 'attachment; filename="Book.xlsx"'}
+            
+            plan_estimate = query_result.plan_estimate
+            if plan_estimate is not None:
+                headers['X-Plan-Total-Cost'] = str(plan_estimate.total_cost)
+                headers['X-Plan-Estimated-Rows'] = str(plan_estimate.estimated_rows)
+                if plan_estimate.row_limit_applied is not None:
+                    headers['X-Row-Limit-Applied'] = str(plan_estimate.row_limit_applied)
+            
             media_type = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
             return Response(content=excel_buffer.getvalue(),headers=headers,media_type=media_type)
+        except QueryRejectedError as e:
+            error_response = ErrorResponse(error=str(e.args))
+            jsonable_response = jsonable_encoder(error_response)
+            return JSONResponse(content=jsonable_response,status_code=422)
         except Exception as e:
             error_response = ErrorResponse(error=str(e.args))
             jsonable_response = jsonable_encoder(error_response)
@@ -78,7 +385,48 @@ def configure_api_router(router:APIRouter,agent:SQLAgent)->APIRouter:
     
     return router
 
-agent = SQLAgent()
-app = FastAPI()
-router = configure_api_router(APIRouter(),agent)
-app.include_router(router=router)
\ No newline at end of file
+def create_app(agent:"SQLAgent | None"=None)->FastAPI:
+    """
+    Build the application. The agent and the components behind it are built from the environment by the
+    lifespan hook, a different agent can be passed in, e.g. a stub for load testing.
+    """
+    def agent_factory()->"SQLAgent":
+        if agent is not None:
+            return agent
+        from database_chat import SQLAgent
+        return SQLAgent()
+    
+    components = ServerComponents(agent_factory)
+    
+    @asynccontextmanager
+    async def lifespan(app:FastAPI):
+        components.start()
+        yield
+        components.shutdown()
+    
+    app = FastAPI(lifespan=lifespan)
+    
+    @app.middleware("http")
+    async def add_server_timing(request:Request,call_next):
+        # Streamed responses send their headers first, so only the stages before the first byte are included
+        start_time = time.perf_counter()
+        with request_timing() as timing:
+            response = await call_next(request)
+        total_seconds = time.perf_counter() - start_time
+        
+        # The route template is used as label so ids in paths do not create new series
+        route = request.scope.get('route')
+        REQUEST_DURATION.observe(
+            total_seconds,
+            route=route.path if route is not None else 'unmatched',
+            method=request.method,
+            status=response.status_code
+        )
+        response.headers['Server-Timing'] = timing.server_timing_header(total_seconds)
+        return response
+    
+    router = configure_api_router(APIRouter(),components)
+    app.include_router(router=router)
+    return app
+
+app = create_app()
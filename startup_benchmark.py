@@ -0,0 +1,79 @@
+"""
+Cold start benchmark for the chat server.
+
+Every run starts a fresh interpreter with an empty temporary directory, like a serverless cold start, and
+measures the time to import ``server``, to run the lifespan startup and to answer the first and second
+request. The schema snapshot written by ``python -m database_chat.schema_descriptor --snapshot`` is used
+when it matches the data generation.
+
+    DATABASE_URL=postgresql://... python startup_benchmark.py --runs 5
+"""
+from pathlib import Path
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import numpy as np
+
+# Runs in the fresh interpreter, the timings are printed as a single JSON line
+_CHILD_SCRIPT = """
+import json, sys, time
+start_time = time.perf_counter()
+import server
+import_seconds = time.perf_counter() - start_time
+
+from fastapi.testclient import TestClient
+start_time = time.perf_counter()
+with TestClient(server.app) as client:
+    startup_seconds = time.perf_counter() - start_time
+    request_seconds = []
+    for _ in range(2):
+        start_time = time.perf_counter()
+        response = client.post(sys.argv[1],json={"prompt":sys.argv[2]})
+        request_seconds.append(time.perf_counter() - start_time)
+        response.raise_for_status()
+
+print(json.dumps({
+    "import": import_seconds,
+    "startup": startup_seconds,
+    "first_request": request_seconds[0],
+    "second_request": request_seconds[1],
+    "heavy_modules_loaded": sorted(name for name in ("langchain_deepseek", "langgraph", "pandas", "sqlalchemy") if name in sys.modules)
+}))
+"""
+
+def run_cold_start(endpoint:str, prompt:str)->dict:
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        environment = os.environ.copy()
+        # Nothing from earlier runs is reused except the snapshot shipped with the code
+        environment["SCHEMA_DESCRIPTOR_PATH"] = str(Path(temporary_directory) / "coe_schema_descriptor.json")
+        environment["RESULT_CACHE_DIRECTORY"] = str(Path(temporary_directory) / "coe_result_cache")
+        environment["QUERY_JOB_DATABASE_PATH"] = str(Path(temporary_directory) / "coe_query_jobs.sqlite3")
+        environment["EXAMPLE_STORE_PATH"] = str(Path(temporary_directory) / "coe_query_examples.jsonl")
+
+        output = subprocess.run(
+            [sys.executable, "-c", _CHILD_SCRIPT, endpoint, prompt],
+            cwd=Path(__file__).parent,
+            env=environment,
+            capture_output=True,
+            text=True,
+            check=True
+        ).stdout
+
+    return json.loads(output.strip().splitlines()[-1])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure import, startup and first request latency of the chat server.")
+    parser.add_argument("--runs", type=int, default=5, help="Number of cold starts")
+    parser.add_argument("--endpoint", default="/validate", help="Endpoint of the first requests")
+    parser.add_argument("--prompt", default="Total volume by direction for study 1230846", help="Prompt sent to the endpoint")
+    arguments = parser.parse_args()
+
+    runs = [run_cold_start(arguments.endpoint,arguments.prompt) for _ in range(arguments.runs)]
+
+    for timing_name in ("import", "startup", "first_request", "second_request"):
+        timings_ms = np.array([run[timing_name] for run in runs]) * 1000
+        print(f"{timing_name:<16} p50 {np.percentile(timings_ms,50):>8.0f} ms   max {timings_ms.max():>8.0f} ms")
+    print(f"Heavy modules loaded after the requests: {', '.join(runs[-1]['heavy_modules_loaded']) or 'none'}")
@@ -1,10 +1,10 @@
 import streamlit as st
 import requests
 import time
-from io import BytesIO
 import pandas as pd
 from dotenv import load_dotenv
 import os
+import json
 
 load_dotenv()
 api_endpoint = os.getenv('SERVER_ENDPOINT')
@@ -19,15 +19,89 @@ if "processing_request" not in st.session_state:
 if "saved_prompt" not in st.session_state:
     st.session_state.saved_prompt = None
 
+# Responses are kept between reruns so that button clicks don't repeat the expensive requests
+if "is_valid" not in st.session_state:
+    st.session_state.is_valid = None
+    st.session_state.query_token = None
 
-def stream_data(text:str):
-    for word in text.split(" "):
-        yield word + " "
-        time.sleep(0.05)
+if "generated_query" not in st.session_state:
+    st.session_state.generated_query = None
+    st.session_state.query_time = None
+    st.session_state.query_error = None
+
+if "preview" not in st.session_state:
+    st.session_state.preview = None
+
+if "file_bytes" not in st.session_state:
+    st.session_state.file_bytes = None
+    st.session_state.row_limit_applied = None
+
+preview_page_size = 50
+
+
+def read_server_sent_events(response:requests.Response):
+    """
+    Yield ``(event_type, data)`` pairs from a streaming response of the server.
+    """
+    event_type = "message"
+    for line in response.iter_lines(decode_unicode=True):
+        if line.startswith("event:"):
+            event_type = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            yield event_type, json.loads(line[len("data:"):].strip())
+            event_type = "message"
+
+def stream_suggestion(response:requests.Response):
+    for event_type, data in read_server_sent_events(response):
+        if event_type == "token":
+            yield data['content']
+        elif event_type == "error":
+            st.error(f"Suggestions could not be generated: {data['error']}")
+
+def stream_query(response:requests.Response):
+    """
+    Yield the LLM tokens and agent steps as text, storing the final query in the session state.
+    """
+    for event_type, data in read_server_sent_events(response):
+        if event_type == "token":
+            yield data['content']
+        elif event_type == "tool_call":
+            yield f"\n\n`{data['name']}` {data['content']}\n\n"
+        elif event_type == "query":
+            st.session_state.generated_query = data['content']
+        elif event_type == "error":
+            st.session_state.query_error = data['error']
+
+def server_is_busy(response:requests.Response)->bool:
+    """
+    Show a retry message and return ``True`` when the server turned the request away because it is at capacity.
+    """
+    if response.status_code != 429:
+        return False
+    
+    retry_after = response.headers.get('Retry-After')
+    wait_hint = f" in about {retry_after} seconds" if retry_after else " in a moment"
+    st.warning(f"The server is busy with other requests, please retry{wait_hint}.")
+    return True
+
+def show_retry_buttons():
+    # Responses that were turned away are not stored, so a rerun sends the request again
+    c1, c2, c3 = st.columns(3)
+    c1.button("Retry")
+    c3.button("Write Another Prompt",on_click=reset_chat)
+    st.stop()
 
 def reset_chat():
     st.session_state.saved_prompt = None
     st.session_state.processing_request = False
+    st.session_state.is_valid = None
+    st.session_state.query_token = None
+    st.session_state.generated_query = None
+    st.session_state.query_time = None
+    st.session_state.query_error = None
+    st.session_state.preview = None
+    st.session_state.file_bytes = None
+    st.session_state.row_limit_applied = None
     
 prompt = st.chat_input(placeholder="Ask me anything about the Traffic Volume Database",key="chat_input",disabled=st.session_state.processing_request)
 
@@ -42,14 +116,24 @@ if st.session_state.saved_prompt and st.session_state.processing_request:
         st.markdown(st.session_state.saved_prompt)
     
     with st.chat_message("ai"):
-        with st.spinner("Validating Prompt...",show_time=True):
-            response = requests.post(
-                url=f"{api_endpoint}/validate",
-                json={
-                    "prompt":st.session_state.saved_prompt
-                }
-            )
-        is_valid = response.json()['is_valid']
+        if st.session_state.is_valid is None:
+            with st.spinner("Validating Prompt...",show_time=True):
+                response = requests.post(
+                    url=f"{api_endpoint}/validate",
+                    json={
+                        "prompt":st.session_state.saved_prompt
+                    }
+                )
+            if server_is_busy(response):
+                show_retry_buttons()
+            validation = response.json()
+            if 'error' in validation:
+                st.error(f"Prompt could not be validated: {validation['error']}")
+                st.button("Write Another Prompt",on_click=reset_chat)
+                st.stop()
+            st.session_state.is_valid = validation['is_valid']
+            st.session_state.query_token = validation.get('query_token')
+        is_valid = st.session_state.is_valid
         
         if is_valid:
             st.success("Prompt is adequate for query generation.")
@@ -58,71 +142,112 @@ if st.session_state.saved_prompt and st.session_state.processing_request:
     
     if not is_valid:
         with st.chat_message("assistant"):
-            with st.spinner("Generating suggestions for improvement...",show_time=True):
-                response = requests.post(
-                    url=f"{api_endpoint}/suggestion",
-                    json={
-                        "prompt":st.session_state.saved_prompt
-                    }
-                )
-            suggestion = response.json()['suggestion']
-            generator = stream_data(suggestion)
-            st.write_stream(generator)
+            response = requests.post(
+                url=f"{api_endpoint}/suggestion/stream",
+                json={
+                    "prompt":st.session_state.saved_prompt
+                },
+                stream=True
+            )
+            if server_is_busy(response):
+                show_retry_buttons()
+            st.write_stream(stream_suggestion(response))
         c1, c2, c3 = st.columns(3)
         c2.button("Write Another Prompt",on_click=reset_chat)
     else:
         with st.chat_message("assistant"):
-            with st.spinner(text="Generating SQL Query... (Exp. Time ~ 80-140s)",show_time=True):
-                start_time = time.time()
-                response = requests.post(
-                    url=f"{api_endpoint}/query",
-                    json={
-                        "prompt":st.session_state.saved_prompt
-                    }
-                )
-                query = response.json()['query']
-                end_time = time.time()
-            st.success(f"Successfully qenerated query. Time taken: {round(end_time-start_time,1)}s")
-            description_generator = stream_data("The following query will be used to aggregate data from the database:")
-            st.write_stream(description_generator)
+            if st.session_state.generated_query is None and st.session_state.query_error is None:
+                with st.status("Generating SQL Query...",expanded=True) as status:
+                    start_time = time.time()
+                    response = None
+                    if st.session_state.query_token is not None:
+                        # Generation already started on the server while the prompt was being validated
+                        response = requests.get(url=f"{api_endpoint}/query/{st.session_state.query_token}/stream",stream=True)
+                        if response.status_code == 404:
+                            # The speculative query expired or was dropped, so generation starts over from the prompt
+                            st.session_state.query_token = None
+                            response = None
+                    if response is None:
+                        response = requests.post(
+                            url=f"{api_endpoint}/query/stream",
+                            json={
+                                "prompt":st.session_state.saved_prompt
+                            },
+                            stream=True
+                        )
+                    if response.status_code == 429:
+                        status.update(label="Server busy",state="error",expanded=False)
+                    elif not response.ok:
+                        st.session_state.query_error = f"The server responded with status {response.status_code}"
+                        status.update(label="SQL Query generation failed",state="error",expanded=False)
+                    else:
+                        st.write_stream(stream_query(response))
+                        status.update(label="SQL Query generation finished",state="complete",expanded=False)
+                    end_time = time.time()
+                if server_is_busy(response):
+                    show_retry_buttons()
+                st.session_state.query_time = round(end_time-start_time,1)
+            
+            if st.session_state.generated_query is None:
+                st.error(f"Query could not be generated: {st.session_state.query_error}")
+                st.button("Write Another Prompt",on_click=reset_chat)
+                st.stop()
+            
+            query = st.session_state.generated_query
+            st.success(f"Successfully qenerated query. Time taken: {st.session_state.query_time}s")
+            st.write("The following query will be used to aggregate data from the database:")
             st.code(body=query,language='sql')
         
         with st.chat_message("assistant"):
-            with st.spinner(text="Aggregating data into Excel format...",show_time=True):
-                response = requests.post(
-                    url=f"{api_endpoint}/excel_file",
-                    json={
-                        "prompt":query
-                    }
-                )
-                file_bytes = response.content
-            st.success("Successfully Recieved Data.")
-        
-        df = pd.read_excel(BytesIO(file_bytes))
-        
-        with st.chat_message("assistant"):
-            df_description_generator = stream_data("Preview of the data stored in the Excel file:")
-            st.write_stream(df_description_generator)
-            st.dataframe(df,hide_index=True,)
+            if st.session_state.preview is None:
+                with st.spinner(text="Loading preview...",show_time=True):
+                    response = requests.post(
+                        url=f"{api_endpoint}/preview",
+                        json={
+                            "prompt":query,
+                            "page_size":preview_page_size
+                        }
+                    )
+                st.session_state.preview = response.json()
+            preview = st.session_state.preview
+            
+            if 'error' in preview:
+                st.error(f"Preview could not be loaded: {preview['error']}")
+            else:
+                df = pd.DataFrame(data=preview['rows'],columns=preview['columns'])
+                st.write(f"Preview of the first {len(df)} rows (estimated total: ~{preview['estimated_row_count']} rows):")
+                st.dataframe(df,hide_index=True,)
         
         columns = st.columns(4)
-        columns[1].download_button(
-            label="Download Excel File",
-            data=file_bytes,
-            file_name="Generated Data.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            icon=":material/download:",
-            on_click=reset_chat,
-            type='primary'
-        )
+        if st.session_state.file_bytes is None:
+            # The full export is only requested once the user asks for it
+            if columns[1].button(label="Prepare Excel File",icon=":material/table:",type='primary'):
+                with st.spinner(text="Aggregating data into Excel format...",show_time=True):
+                    response = requests.post(
+                        url=f"{api_endpoint}/excel_file",
+                        json={
+                            "prompt":query
+                        }
+                    )
+                if response.headers.get('content-type','').startswith('application/json'):
+                    st.error(f"Excel file could not be generated: {response.json()['error']}")
+                else:
+                    st.session_state.file_bytes = response.content
+                    st.session_state.row_limit_applied = response.headers.get('X-Row-Limit-Applied')
+                    st.rerun()
+        else:
+            if st.session_state.row_limit_applied is not None:
+                st.warning(f"The query was over the size limit, only the first {st.session_state.row_limit_applied} rows are included in the Excel file.")
+            columns[1].download_button(
+                label="Download Excel File",
+                data=st.session_state.file_bytes,
+                file_name="Generated Data.xlsx",
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                icon=":material/download:",
+                on_click=reset_chat,
+                type='primary'
+            )
         columns[2].button(
             label="Write Another Prompt",
             on_click=reset_chat
         )
-            
-
-            
-    
-
- 
-    
\ No newline at end of file